@@ -0,0 +1,20 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('core', '0001_unidade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='unidade',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='usuarios', to='core.unidade'),
+        ),
+    ]
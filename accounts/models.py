@@ -9,3 +9,7 @@ class User(AbstractUser):
     )
 
     role = models.CharField(max_length=20, choices=ROLE_CHOICES)
+    # Onde a pessoa trabalha: define as filas e painéis que ela vê
+    unidade = models.ForeignKey(
+        "core.Unidade", on_delete=models.PROTECT, null=True, blank=True, related_name="usuarios",
+    )
@@ -1,10 +1,56 @@
+import re
+
 from django.contrib import admin
-from .models import FichaAtendimento
+
+from core.listas import ListaGrandeAdmin
+from patients.busca import filtro_busca
+from patients.models import Patient
+
+from .models import FichaAtendimento, FichaHistorico, PlantaoMedico
+
+CODIGO_SENHA = re.compile(r"^[A-Za-z]{1,3}\d{1,7}$")
 
 
 @admin.register(FichaAtendimento)
-class FichaAtendimentoAdmin(admin.ModelAdmin):
-    list_display = ("codigo", "paciente", "status", "prioridade", "criado_em", "chamado_em", "finalizado_em")
-    list_filter = ("status", "prioridade")
+class FichaAtendimentoAdmin(ListaGrandeAdmin):
+    list_display = ("codigo", "unidade", "paciente", "status", "prioridade", "criado_em", "chamado_em", "finalizado_em")
+    list_filter = ("unidade", "status", "prioridade")
+    list_select_related = ("paciente", "unidade")
     search_fields = ("codigo", "paciente__nome", "paciente__cpf")
-    ordering = ("-criado_em",)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Senha ("A012") pelo índice do código; senão o paciente pela busca
+        # indexada da recepção (CPF ou nome), nunca ILIKE '%x%' no JOIN
+        termo = search_term.strip()
+        if not termo:
+            return queryset, False
+        if CODIGO_SENHA.match(termo):
+            return queryset.filter(codigo=termo.upper()), False
+        filtro = filtro_busca(termo)
+        if filtro is None:
+            return queryset.none(), False
+        return queryset.filter(paciente_id__in=Patient.objects.filter(filtro).values("id")), False
+
+
+@admin.register(FichaHistorico)
+class FichaHistoricoAdmin(admin.ModelAdmin):
+    """Fichas vivas + arquivadas (somente leitura)."""
+    list_display = ("codigo", "paciente", "status", "prioridade", "criado_em", "finalizado_em", "arquivada")
+    list_filter = ("unidade", "status", "prioridade", "arquivada")
+    search_fields = ("codigo", "paciente__nome", "paciente__cpf")
+    date_hierarchy = "criado_em"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PlantaoMedico)
+class PlantaoMedicoAdmin(admin.ModelAdmin):
+    """Quem recebe fichas do despacho automático. Apagar aqui tira o médico do plantão."""
+    list_display = ("medico", "unidade", "sala", "inicio")
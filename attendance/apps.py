@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class AttendanceConfig(AppConfig):
     name = 'attendance'
+
+    def ready(self):
+        # Conecta os receivers do sinal ficha_transicionada
+        from . import eventos, previsao, snapshots  # noqa: F401
+        # Por último: despacha depois que a ficha triada já entrou nas filas e painéis
+        from . import despacho  # noqa: F401
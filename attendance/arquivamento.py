@@ -0,0 +1,61 @@
+"""
+Arquivamento das fichas encerradas (tabela quente x tabela fria).
+
+A tabela viva (FichaAtendimento) deve ter só o movimento de poucos dias: é
+ela que as filas consultam o tempo todo. FINALIZADO/CANCELADO mais antigos
+que settings.ARQUIVO_FICHAS_DIAS vão para FichaArquivada, em lotes pequenos
+(um DELETE ... RETURNING + INSERT por lote, numa transação curta), pulando
+linhas travadas por quem está atendendo.
+
+Histórico completo (vivas + arquivadas): models.FichaHistorico.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import FichaArquivada, FichaAtendimento
+
+Status = FichaAtendimento.Status
+
+ENCERRADOS = (Status.FINALIZADO, Status.CANCELADO)
+
+
+def limite_padrao():
+    """Fichas criadas antes disto já podem ir para o arquivo."""
+    return timezone.now() - timedelta(days=settings.ARQUIVO_FICHAS_DIAS)
+
+
+def arquivar_lote(antes, tamanho=1000) -> int:
+    """Move até `tamanho` fichas encerradas criadas antes de `antes`. Retorna quantas moveu."""
+    quote = connection.ops.quote_name
+    viva = quote(FichaAtendimento._meta.db_table)
+    arquivo = quote(FichaArquivada._meta.db_table)
+    colunas = ", ".join(quote(f.column) for f in FichaArquivada._meta.concrete_fields)
+    # Literal (e não parâmetro) para o planner casar com o índice ficha_encerrada_criado_idx
+    encerrados = ", ".join(f"'{s}'" for s in ENCERRADOS)
+
+    # O lote num CTE materializado: como subquery do DELETE ... IN, o planner
+    # pode reexecutá-lo e, com SKIP LOCKED, cada vez vêm outras linhas (o lote
+    # passava do tamanho pedido)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Se algo segura a tabela (ex.: migration), desiste do lote em vez de enfileirar a recepção atrás
+        cursor.execute("SET LOCAL lock_timeout = '2s'")
+        cursor.execute(
+            f"""
+            WITH lote AS MATERIALIZED (
+                SELECT id FROM {viva}
+                WHERE status IN ({encerrados}) AND criado_em < %s
+                ORDER BY criado_em
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ), movidas AS (
+                DELETE FROM {viva} WHERE id IN (SELECT id FROM lote)
+                RETURNING {colunas}
+            )
+            INSERT INTO {arquivo} ({colunas}) SELECT {colunas} FROM movidas
+            """,
+            [antes, tamanho],
+        )
+        return cursor.rowcount
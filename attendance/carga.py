@@ -0,0 +1,617 @@
+"""
+Teste de carga do fluxo completo: recepção -> triagem -> lançamento ->
+médico, com as TVs consultando os painéis ao mesmo tempo.
+
+Três partes (o comando manage.py teste_carga junta tudo):
+
+- semear_pacientes() / semear_fichas(): histórico no banco, com SQL puro
+  (generate_series), para as consultas rodarem contra um histórico de
+  tamanho realista. Fichas mais antigas que ARQUIVO_FICHAS_DIAS vão direto
+  para o arquivo, como o arquivamento faria.
+- simular(): uma thread por pessoa (recepcionistas, enfermeiras, lançamento,
+  médicos de plantão) e por TV, em cada unidade, pelas URLs reais de
+  attendance/urls.py (django.test.Client: a pilha inteira de middleware e
+  views, sem o servidor HTTP). Cada requisição é cronometrada e tem as
+  consultas ao banco contadas.
+- resumir() / comparar(): p50/p95/p99, requisições por segundo e consultas
+  por endpoint; o resultado vai para um arquivo JSONL (uma linha por
+  execução, com o commit) e é comparado com a última execução de mesmos
+  parâmetros, para uma regressão entre commits aparecer.
+
+Escreve de verdade no banco configurado: rode num banco de teste de carga,
+nunca no de produção. Para números próximos dos de produção, rode com
+DEBUG desligado e com o cache/Redis e o Postgres que a produção usa.
+O SSE (/painel/eventos/) fica de fora: é conexão longa, não requisição.
+
+comparar_caminhos() é outra medida: N TVs ao mesmo tempo no snapshot do
+painel pelo caminho síncrono (WSGI: uma thread por conexão) e pelo
+assíncrono (ASGI: uma corrotina por conexão, num único event loop), com
+requisições/s, latência e memória (RSS) por conexão de cada um.
+"""
+import abc
+import asyncio
+import json
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import connection, connections, transaction
+from django.test import AsyncClient, Client, override_settings
+from django.urls import resolve
+from django.utils import timezone
+
+from core.models import Unidade
+from patients.models import Patient
+
+from . import fila_cache
+from .arquivamento import limite_padrao
+from .models import FichaArquivada, FichaAtendimento
+
+Status = FichaAtendimento.Status
+
+# Pacientes da carga: CPF 9xx.xxx.xxx-xx (não colide com cadastro real de teste)
+PREFIXO_CPF = "9"
+# Fichas semeadas: código H<n> (nunca sai do gerador de senhas)
+PREFIXO_HISTORICO = "H"
+ARQUIVO_RESULTADOS = Path(settings.BASE_DIR) / "benchmarks" / "carga.jsonl"
+PRIORIDADES = ["VERMELHO", "LARANJA", "AMARELO", "VERDE", "AZUL"]
+
+
+# --- HISTÓRICO ---------------------------------------------------------------
+
+def _cpf_sql(numero):
+    """Expressão SQL do CPF formatado da carga para o inteiro `numero`."""
+    digitos = f"('{PREFIXO_CPF}' || lpad(({numero})::text, 10, '0'))"
+    return (
+        f"substr({digitos}, 1, 3) || '.' || substr({digitos}, 4, 3) || '.' || "
+        f"substr({digitos}, 7, 3) || '-' || substr({digitos}, 10, 2)"
+    )
+
+
+def semear_pacientes(total: int, lote: int = 100_000) -> int:
+    """Garante `total` pacientes da carga (os que já existem ficam como estão). Quantos inseriu."""
+    tabela = connection.ops.quote_name(Patient._meta.db_table)
+    inseridos = 0
+    for inicio in range(1, total + 1, lote):
+        fim = min(inicio + lote - 1, total)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {tabela} (nome, cpf, telefone, nome_mae, data_nascimento, criado_em, atualizado_em)
+                SELECT 'Paciente Carga ' || n, {_cpf_sql('n')}, '', 'Mae Carga ' || n,
+                       DATE '1940-01-01' + (n * 7 %% 30000), now(), now()
+                FROM generate_series(%s, %s) AS n
+                ON CONFLICT (cpf) DO NOTHING
+                """,
+                [inicio, fim],
+            )
+            inseridos += cursor.rowcount
+    return inseridos
+
+
+def semear_fichas(total: int, unidade_ids, dias: int = 365, lote: int = 100_000, ao_progresso=None) -> int:
+    """
+    `total` fichas encerradas espalhadas nos últimos `dias`, divididas entre as
+    unidades, para os pacientes da carga. Não repete: se já há fichas semeadas
+    no arquivo, não faz nada. Quantas inseriu.
+    """
+    if FichaArquivada.objects.filter(codigo__startswith=PREFIXO_HISTORICO).exists():
+        return 0
+
+    quote = connection.ops.quote_name
+    pacientes = quote(Patient._meta.db_table)
+    viva = quote(FichaAtendimento._meta.db_table)
+    arquivo = quote(FichaArquivada._meta.db_table)
+    agora = timezone.now()
+    limite = limite_padrao()
+    unidades = list(unidade_ids)
+    colunas = (
+        "unidade_id, codigo, data_senha, paciente_id, status, prioridade, prioridade_ordem, "
+        "criado_em, atualizado_em, chamado_em, finalizado_em"
+    )
+    # n = 1 é a ficha mais recente; as contas abaixo só dependem de n (reprodutível)
+    historico = f"""
+        WITH h AS (
+            SELECT n, %(agora)s - %(dias)s * interval '1 day' * (n::float8 / %(total)s) AS criado_em
+            FROM generate_series(%(inicio)s, %(fim)s) AS n
+        )
+        SELECT (%(unidades)s::bigint[])[1 + n %% cardinality(%(unidades)s::bigint[])] AS unidade_id,
+               '{PREFIXO_HISTORICO}' || n AS codigo,
+               h.criado_em::date AS data_senha,
+               p.id AS paciente_id,
+               CASE WHEN n %% 20 = 0 THEN 'CANCELADO' ELSE 'FINALIZADO' END AS status,
+               (%(prioridades)s::text[])[1 + n %% 5] AS prioridade,
+               1 + n %% 5 AS prioridade_ordem,
+               h.criado_em,
+               h.criado_em + interval '1 minute' * (15 + n %% 90) AS atualizado_em,
+               CASE WHEN n %% 20 = 0 THEN NULL ELSE h.criado_em + interval '1 minute' * (n %% 60) END AS chamado_em,
+               CASE WHEN n %% 20 = 0 THEN NULL ELSE h.criado_em + interval '1 minute' * (15 + n %% 90) END
+                   AS finalizado_em
+        FROM h JOIN carga_pacientes p ON p.posicao = 1 + (n::bigint * 7919) %% %(pacientes)s
+    """
+    inseridas = 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            CREATE TEMP TABLE IF NOT EXISTS carga_pacientes AS
+            SELECT row_number() OVER (ORDER BY id) AS posicao, id FROM {pacientes}
+            WHERE cpf LIKE %s
+            """,
+            [f"{PREFIXO_CPF}%"],
+        )
+        cursor.execute("SELECT count(*) FROM carga_pacientes")
+        quantos_pacientes = cursor.fetchone()[0]
+        if not quantos_pacientes:
+            raise ValueError("Semeie os pacientes da carga antes das fichas.")
+
+        for inicio in range(1, total + 1, lote):
+            parametros = {
+                "agora": agora, "dias": dias, "total": total, "inicio": inicio, "fim": min(inicio + lote - 1, total),
+                "unidades": unidades, "prioridades": PRIORIDADES, "pacientes": quantos_pacientes,
+                "limite": limite,
+            }
+            with transaction.atomic():
+                # Recentes na tabela viva; o resto direto no arquivo, com id da mesma sequence
+                cursor.execute(
+                    f"INSERT INTO {viva} ({colunas}) SELECT * FROM ({historico}) s WHERE s.criado_em >= %(limite)s",
+                    parametros,
+                )
+                inseridas += cursor.rowcount
+                cursor.execute(
+                    f"""
+                    INSERT INTO {arquivo} (id, {colunas})
+                    SELECT nextval(pg_get_serial_sequence('{FichaAtendimento._meta.db_table}', 'id')), s.*
+                    FROM ({historico}) s WHERE s.criado_em < %(limite)s
+                    """,
+                    parametros,
+                )
+                inseridas += cursor.rowcount
+            if ao_progresso:
+                ao_progresso(inseridas)
+        cursor.execute("DROP TABLE carga_pacientes")
+        cursor.execute(f"ANALYZE {pacientes}; ANALYZE {viva}; ANALYZE {arquivo}")
+    return inseridas
+
+
+def preparar_unidades(quantidade: int) -> list:
+    """As `quantidade` primeiras unidades (por id), criando "Unidade Carga N" se faltar."""
+    unidades = list(Unidade.objects.order_by("id")[:quantidade])
+    for numero in range(len(unidades) + 1, quantidade + 1):
+        unidades.append(Unidade.objects.get_or_create(
+            slug=f"carga-{numero}", defaults={"nome": f"Unidade Carga {numero}"},
+        )[0])
+    return unidades
+
+
+def _usuario(username, unidade, grupo=None):
+    usuario, criado = get_user_model().objects.get_or_create(username=username, defaults={"unidade": unidade})
+    if criado:
+        usuario.set_unusable_password()
+        usuario.save(update_fields=["password"])
+    if grupo:
+        usuario.groups.add(grupo)
+    return usuario
+
+
+# --- SIMULAÇÃO ---------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Medicao:
+    endpoint: str
+    unidade_id: int
+    segundos: float
+    consultas: int
+    status: int
+
+
+class Simulacao:
+    """Estado compartilhado pelas threads: quando parar e o que foi medido."""
+
+    def __init__(self, pausa: float, semente=None):
+        self.pausa = pausa
+        self.parar = threading.Event()
+        self.medicoes = []
+        self.falhas = []
+        self.aleatorio = random.Random(semente)
+        self.duracao = 0.0
+        self.host = next((h for h in settings.ALLOWED_HOSTS if h and h[0] not in ".*"), "localhost")
+
+    def registrar(self, medicao: Medicao) -> None:
+        self.medicoes.append(medicao)  # list.append é atômico
+
+
+class _Ator(threading.Thread, metaclass=abc.ABCMeta):
+    """Uma pessoa (ou TV) usando o sistema numa unidade, até a simulação parar."""
+
+    def __init__(self, simulacao: Simulacao, unidade: Unidade, usuario=None):
+        super().__init__(daemon=True)
+        self.simulacao = simulacao
+        self.unidade = unidade
+        self.usuario = usuario
+        self.aleatorio = random.Random(simulacao.aleatorio.random())
+
+    def run(self):
+        try:
+            self.cliente = Client(raise_request_exception=False, SERVER_NAME=self.simulacao.host)
+            if self.usuario is not None:
+                self.cliente.force_login(self.usuario)
+            self.preparar()
+            while not self.simulacao.parar.is_set():
+                self.passo()
+                self.simulacao.parar.wait(self.pausa())
+            self.encerrar()
+        except Exception as exc:
+            self.simulacao.falhas.append(f"{type(self).__name__} ({self.unidade.slug}): {exc!r}")
+        finally:
+            connections.close_all()
+
+    def pausa(self):
+        return self.simulacao.pausa
+
+    def preparar(self):
+        pass
+
+    def encerrar(self):
+        pass
+
+    @abc.abstractmethod
+    def passo(self):
+        """Uma ação da pessoa (uma ou mais requisições)."""
+
+    def requisitar(self, metodo, url, dados=None, **extra):
+        consultas = 0
+
+        def contar(execute, sql, params, many, context):
+            nonlocal consultas
+            consultas += 1
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        # Em todos os bancos: com réplicas, painéis e listas leem delas
+        with ExitStack() as pilha:
+            for conexao in connections.all():
+                pilha.enter_context(conexao.execute_wrapper(contar))
+            resposta = getattr(self.cliente, metodo)(url, dados, **extra)
+        segundos = time.perf_counter() - inicio
+        endpoint = f"{metodo.upper()} {resolve(urlsplit(url).path).view_name}"
+        self.simulacao.registrar(Medicao(endpoint, self.unidade.id, segundos, consultas, resposta.status_code))
+        return resposta
+
+
+class Recepcionista(_Ator):
+    def __init__(self, simulacao, unidade, usuario, pacientes, novos=0.2):
+        super().__init__(simulacao, unidade, usuario)
+        self.pacientes = pacientes
+        self.novos = novos
+
+    def passo(self):
+        if not self.pacientes or self.aleatorio.random() < self.novos:
+            cpf = "8" + "".join(self.aleatorio.choices("0123456789", k=10))
+            self.requisitar("post", "/recepcao/", {"nome": f"Paciente Novo {cpf}", "cpf": cpf})
+            return
+        # Paciente que volta: busca pelo nome no autocomplete e abre a ficha
+        paciente_id, nome = self.aleatorio.choice(self.pacientes)
+        self.requisitar("get", "/pacientes/buscar/", {"q": nome})
+        self.requisitar("post", "/recepcao/", {"paciente": paciente_id})
+
+
+class Enfermeira(_Ator):
+    def passo(self):
+        self.requisitar("get", "/triagem/")
+        # Na tela, a enfermeira clica em alguém do topo da fila
+        proximas = fila_cache.fila(self.unidade.id, Status.CHEGADA, 3)
+        if not proximas:
+            return
+        ficha_id = self.aleatorio.choice(proximas)["id"]
+        self.requisitar("get", f"/triagem/chamar/{ficha_id}/")
+        if self.requisitar("post", f"/triagem/atendimento/{ficha_id}/").status_code != 200:
+            return  # outra estação chamou antes
+        self.requisitar("get", f"/triagem/finalizar/{ficha_id}/")
+        self.requisitar("post", f"/triagem/finalizar/{ficha_id}/", {
+            "prioridade": self.aleatorio.choice(PRIORIDADES),
+            "pa_sistolica": self.aleatorio.randint(100, 160), "pa_diastolica": self.aleatorio.randint(60, 100),
+            "temperatura": "36.8", "frequencia_cardiaca": self.aleatorio.randint(60, 110),
+        })
+
+
+class Lancamento(_Ator):
+    """Roteia na mão o que o despacho automático não levou (ninguém de plantão)."""
+
+    def __init__(self, simulacao, unidade, usuario, medicos):
+        super().__init__(simulacao, unidade, usuario)
+        self.medicos = medicos
+
+    def passo(self):
+        self.requisitar("get", "/lancamento/")
+        triados = fila_cache.fila(self.unidade.id, Status.TRIADO, 1)
+        if triados and self.medicos:
+            medico = self.aleatorio.choice(self.medicos)
+            self.requisitar("post", f"/lancamento/rotear/{triados[0]['id']}/", {
+                "medico_id": medico.id, "local": f"Sala {medico.id}",
+            })
+
+
+class Medico(_Ator):
+    def __init__(self, simulacao, unidade, usuario, plantao=True):
+        super().__init__(simulacao, unidade, usuario)
+        self.plantao = plantao
+
+    def preparar(self):
+        if self.plantao:
+            self.requisitar("post", "/medico/plantao/", {"sala": f"Sala {self.usuario.id}"})
+
+    def encerrar(self):
+        if self.plantao:
+            self.requisitar("post", "/medico/plantao/", {"sair": "1"})
+
+    def passo(self):
+        self.requisitar("get", "/medico/")
+        fila = fila_cache.fila(self.unidade.id, fila_cache.fila_medico(self.usuario.id))
+        em_consulta = next((f for f in fila if f["status"] != Status.AGUARDANDO_MEDICO), None)
+        if em_consulta:
+            self.requisitar("get", f"/medico/finalizar/{em_consulta['id']}/")
+        elif fila:
+            self.requisitar("get", f"/medico/chamar/{fila[0]['id']}/")
+
+
+class TV(_Ator):
+    """Consulta o snapshot do painel com o ETag da última resposta (como o JS das TVs)."""
+
+    def __init__(self, simulacao, unidade, painel, intervalo):
+        super().__init__(simulacao, unidade)
+        self.painel = painel
+        self.intervalo = intervalo
+        self.etag = None
+
+    def pausa(self):
+        return self.intervalo
+
+    def passo(self):
+        extra = {"HTTP_IF_NONE_MATCH": self.etag} if self.etag else {}
+        resposta = self.requisitar("get", f"/painel/{self.painel}/snapshot/", {"unidade": self.unidade.slug}, **extra)
+        self.etag = resposta.get("ETag", self.etag)
+
+
+def simular(
+    unidades, duracao: float, recepcionistas=1, enfermeiras=2, medicos=3, tvs=2,
+    lancamento=True, plantao=True, pausa=0.2, intervalo_tv=1.0, semente=None,
+) -> Simulacao:
+    """Roda o fluxo em todas as unidades por `duracao` segundos (quantidades por unidade)."""
+    simulacao = Simulacao(pausa, semente)
+    grupo_medicos, _ = Group.objects.get_or_create(name="Medicos")
+    pacientes = list(
+        Patient.objects.filter(cpf__startswith=PREFIXO_CPF).order_by("id").values_list("id", "nome")[:10_000]
+    )
+
+    atores = []
+    for unidade in unidades:
+        def usuario(papel, i, grupo=None):
+            return _usuario(f"carga-{unidade.slug}-{papel}{i}", unidade, grupo)
+
+        equipe_medica = [usuario("medico", i, grupo_medicos) for i in range(medicos)]
+        atores += [Recepcionista(simulacao, unidade, usuario("recepcao", i), pacientes) for i in range(recepcionistas)]
+        atores += [Enfermeira(simulacao, unidade, usuario("enfermeira", i)) for i in range(enfermeiras)]
+        atores += [Medico(simulacao, unidade, m, plantao) for m in equipe_medica]
+        if lancamento:
+            atores.append(Lancamento(simulacao, unidade, usuario("lancamento", 0), equipe_medica))
+        atores += [
+            TV(simulacao, unidade, ("recepcao", "medico", "tv")[i % 3], intervalo_tv) for i in range(tvs)
+        ]
+
+    for ator in atores:
+        ator.start()
+    simulacao.parar.wait(duracao)
+    simulacao.parar.set()
+    for ator in atores:
+        ator.join()
+    simulacao.duracao = duracao
+    return simulacao
+
+
+# --- CONEXÕES SIMULTÂNEAS: SÍNCRONO x ASSÍNCRONO ----------------------------
+
+def _rss_kb():
+    """Memória residente do processo agora, em kB (None fora do Linux)."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for linha in status:
+                if linha.startswith("VmRSS:"):
+                    return int(linha.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _por_conexao(antes, durante, conexoes):
+    if antes is None or durante is None:
+        return None
+    return round((durante - antes) / conexoes, 1)
+
+
+def _tvs_sincronas(url, dados, conexoes, duracao) -> dict:
+    medicoes = []
+    parar = threading.Event()
+    prontas = threading.Barrier(conexoes + 1)
+
+    def tv():
+        cliente = Client(raise_request_exception=False)
+        etag = None
+        try:
+            prontas.wait()
+            while not parar.is_set():
+                extra = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+                inicio = time.perf_counter()
+                resposta = cliente.get(url, dados, **extra)
+                medicoes.append(Medicao("sync", 0, time.perf_counter() - inicio, 0, resposta.status_code))
+                etag = resposta.get("ETag", etag)
+        finally:
+            connections.close_all()
+
+    antes = _rss_kb()
+    threads = [threading.Thread(target=tv, daemon=True) for _ in range(conexoes)]
+    for thread in threads:
+        thread.start()
+    prontas.wait()
+    parar.wait(duracao)
+    durante = _rss_kb()
+    parar.set()
+    for thread in threads:
+        thread.join()
+    return {
+        **_estatisticas(medicoes, duracao),
+        "threads": conexoes,
+        "memoria_por_conexao_kb": _por_conexao(antes, durante, conexoes),
+    }
+
+
+async def _tvs_assincronas(url, dados, conexoes, duracao) -> dict:
+    medicoes = []
+    parar = asyncio.Event()
+
+    async def tv():
+        cliente = AsyncClient(raise_request_exception=False)
+        etag = None
+        while not parar.is_set():
+            headers = {"if-none-match": etag} if etag else {}
+            inicio = time.perf_counter()
+            resposta = await cliente.get(url, dados, headers=headers)
+            medicoes.append(Medicao("async", 0, time.perf_counter() - inicio, 0, resposta.status_code))
+            etag = resposta.get("ETag", etag)
+
+    antes = _rss_kb()
+    tarefas = [asyncio.create_task(tv()) for _ in range(conexoes)]
+    await asyncio.sleep(duracao)
+    durante = _rss_kb()
+    parar.set()
+    await asyncio.gather(*tarefas)
+    return {
+        **_estatisticas(medicoes, duracao),
+        "threads": 1,
+        "memoria_por_conexao_kb": _por_conexao(antes, durante, conexoes),
+    }
+
+
+def comparar_caminhos(
+    unidade: Unidade, conexoes: int, duracao: float, painel: str = "recepcao", caminhos=("sync", "async"),
+) -> dict:
+    """
+    {"sync": {...}, "async": {...}}: `conexoes` TVs consultando sem pausa o
+    snapshot do painel (com ETag), cada caminho por `duracao` segundos.
+    A memória por conexão é o RSS durante a carga menos o de antes, dividido
+    pelas conexões. É aproximada: o alocador do Python reaproveita o que o
+    caminho anterior liberou. Para comparar memória, meça um caminho por
+    processo (`caminhos`).
+    """
+    url = f"/painel/{painel}/snapshot/"
+    dados = {"unidade": unidade.slug}
+    resultado = {}
+    # O AsyncClient sempre manda Host: testserver
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+        if "sync" in caminhos:
+            resultado["sync"] = _tvs_sincronas(url, dados, conexoes, duracao)
+        if "async" in caminhos:
+            resultado["async"] = asyncio.run(_tvs_assincronas(url, dados, conexoes, duracao))
+    return resultado
+
+
+# --- RESULTADOS --------------------------------------------------------------
+
+def _percentil(ordenados: list, p: float) -> float:
+    """Percentil p (0-100) pelo posto mais próximo."""
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[indice]
+
+
+def _estatisticas(medicoes: list, duracao: float) -> dict:
+    if not medicoes:
+        # Nenhuma resposta no período (TVs presas no long-poll, servidor caído):
+        # zeros com requisicoes = 0, em vez de estourar no percentil
+        return {
+            "requisicoes": 0, "por_segundo": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0,
+            "consultas_media": 0.0, "consultas_max": 0, "erros": 0,
+        }
+    tempos = sorted(m.segundos * 1000 for m in medicoes)
+    consultas = [m.consultas for m in medicoes]
+    return {
+        "requisicoes": len(medicoes),
+        "por_segundo": round(len(medicoes) / duracao, 2),
+        "p50_ms": round(_percentil(tempos, 50), 2),
+        "p95_ms": round(_percentil(tempos, 95), 2),
+        "p99_ms": round(_percentil(tempos, 99), 2),
+        "consultas_media": round(sum(consultas) / len(consultas), 2),
+        "consultas_max": max(consultas),
+        "erros": sum(1 for m in medicoes if m.status >= 500),
+    }
+
+
+def _commit():
+    try:
+        saida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5, check=True,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return saida.stdout.strip() or None
+
+
+def resumir(simulacao: Simulacao, parametros: dict) -> dict:
+    """Resultado da execução: estatísticas por endpoint e por unidade."""
+    por_endpoint = defaultdict(list)
+    por_unidade = defaultdict(list)
+    for medicao in simulacao.medicoes:
+        por_endpoint[medicao.endpoint].append(medicao)
+        por_unidade[medicao.unidade_id].append(medicao)
+    return {
+        "em": timezone.now().isoformat(),
+        "commit": _commit(),
+        "parametros": parametros,
+        "duracao_s": simulacao.duracao,
+        "falhas": simulacao.falhas,
+        "endpoints": {nome: _estatisticas(m, simulacao.duracao) for nome, m in sorted(por_endpoint.items())},
+        "unidades": {str(u): _estatisticas(m, simulacao.duracao) for u, m in sorted(por_unidade.items())},
+    }
+
+
+def anterior(arquivo: Path, parametros: dict):
+    """Última execução gravada com os mesmos parâmetros (None se não há)."""
+    if not arquivo.exists():
+        return None
+    encontrado = None
+    with arquivo.open(encoding="utf-8") as entrada:
+        for linha in entrada:
+            resultado = json.loads(linha)
+            if resultado.get("parametros") == parametros:
+                encontrado = resultado
+    return encontrado
+
+
+def gravar(arquivo: Path, resultado: dict) -> None:
+    arquivo.parent.mkdir(parents=True, exist_ok=True)
+    with arquivo.open("a", encoding="utf-8") as saida:
+        saida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+
+
+def comparar(resultado: dict, base: dict, tolerancia: float = 0.2) -> list:
+    """
+    [(endpoint, p95 antes, p95 agora, variação)] dos endpoints cujo p95 piorou
+    mais que `tolerancia` (0.2 = 20%) ou que passaram a fazer mais consultas.
+    """
+    regressoes = []
+    for endpoint, atual in resultado["endpoints"].items():
+        antes = base["endpoints"].get(endpoint)
+        if antes is None:
+            continue
+        variacao = (atual["p95_ms"] - antes["p95_ms"]) / antes["p95_ms"] if antes["p95_ms"] else 0
+        if variacao > tolerancia or atual["consultas_media"] > antes["consultas_media"] + 0.5:
+            regressoes.append((endpoint, antes["p95_ms"], atual["p95_ms"], variacao))
+    return regressoes
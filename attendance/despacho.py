@@ -0,0 +1,120 @@
+"""
+Despacho automático: ficha triada vai direto para a fila de um médico de plantão.
+
+Sem ninguém de plantão (PlantaoMedico) nada muda: a ficha fica TRIADO e o
+lançamento escolhe médico e sala na mão. Com plantão, assim que a triagem
+termina (signal ficha_transicionada) a ficha é encaminhada (AGUARDANDO_MEDICO)
+para o médico da mesma unidade onde ela seria atendida mais cedo:
+
+    (fichas na frente dela na fila do médico + 1) x tempo médio de consulta dele
+
+"Na frente" respeita a prioridade Manchester: um VERMELHO não enxerga os
+VERDES já encaminhados. A contagem sai do cache das filas (fila_cache.contar,
+O(log n) por médico), sem reler os triados nem as filas dos consultórios.
+
+O tempo médio de cada médico é uma média móvel exponencial (peso ALFA para a
+última consulta) guardada no cache do Django e atualizada a cada FINALIZADO.
+
+O lançamento continua podendo passar por cima: rotear uma ficha já
+encaminhada manda ela para o médico/sala escolhidos.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.dispatch import receiver
+
+from . import fila_cache
+from .models import FichaAtendimento, PlantaoMedico
+from .signals import ficha_transicionada
+from .transicoes import TransicaoInvalida, transicionar
+
+logger = logging.getLogger(__name__)
+
+Status = FichaAtendimento.Status
+
+ALFA = 0.2
+
+
+def _chave_consulta(medico_id):
+    return f"despacho:consulta:{medico_id}"
+
+
+def tempos_de_consulta(medico_ids) -> dict:
+    """{medico_id: minutos por consulta}, uma ida ao cache para todos."""
+    padrao = settings.DESPACHO_CONSULTA_PADRAO_MIN
+    salvos = cache.get_many([_chave_consulta(m) for m in medico_ids])
+    return {m: salvos.get(_chave_consulta(m), padrao) for m in medico_ids}
+
+
+def registrar_consulta(medico_id, minutos: float) -> float:
+    media = tempos_de_consulta([medico_id])[medico_id]
+    media = ALFA * minutos + (1 - ALFA) * media
+    cache.set(_chave_consulta(medico_id), media, timeout=None)
+    return media
+
+
+def escolher_plantao(ficha, plantoes):
+    """O plantão onde a ficha seria atendida mais cedo (empate: quem entrou primeiro). None se vazio."""
+    if not plantoes:
+        return None
+    score = fila_cache.score_prioridade(ficha.prioridade_ordem, ficha.criado_em)
+    tempos = tempos_de_consulta([p.medico_id for p in plantoes])
+
+    def espera(plantao):
+        na_frente = fila_cache.contar(ficha.unidade_id, fila_cache.fila_medico(plantao.medico_id), score)
+        return (na_frente + 1) * tempos[plantao.medico_id], plantao.id
+
+    return min(plantoes, key=espera)
+
+
+def despachar(ficha, plantoes=None, ator=None):
+    """Encaminha a ficha TRIADO para um médico de plantão da unidade dela. A ficha encaminhada, ou None."""
+    if plantoes is None:
+        plantoes = list(PlantaoMedico.objects.filter(unidade_id=ficha.unidade_id))
+    plantao = escolher_plantao(ficha, plantoes)
+    if plantao is None:
+        return None
+    try:
+        return transicionar(
+            ficha.id, "encaminhar_medico", ator,
+            medico_atendente_id=plantao.medico_id, local_atendimento=plantao.sala,
+        )
+    except (TransicaoInvalida, FichaAtendimento.DoesNotExist):
+        # O lançamento (ou outra estação) foi mais rápido
+        return None
+
+
+def despachar_pendentes(unidade_id, ator=None) -> int:
+    """Distribui os triados da unidade que ficaram esperando (ninguém estava de plantão). Quantos foram."""
+    plantoes = list(PlantaoMedico.objects.filter(unidade_id=unidade_id))
+    if not plantoes:
+        return 0
+    # Mais graves primeiro: cada um já entra na conta dos seguintes
+    return sum(
+        1 for ficha in FichaAtendimento.fila.triados().da_unidade(unidade_id) if despachar(ficha, plantoes, ator) is not None
+    )
+
+
+def entrar_plantao(medico, sala, unidade_id, ator=None) -> int:
+    """Abre (ou muda a sala/unidade do) plantão do médico e despacha os triados pendentes da unidade."""
+    PlantaoMedico.objects.update_or_create(medico=medico, defaults={"sala": sala, "unidade_id": unidade_id})
+    return despachar_pendentes(unidade_id, ator)
+
+
+def sair_plantao(medico) -> None:
+    """Para de receber fichas. Quem já está na fila do médico continua com ele."""
+    PlantaoMedico.objects.filter(medico=medico).delete()
+
+
+@receiver(ficha_transicionada)
+def despachar_triado(sender, ficha, anterior, **kwargs):
+    try:
+        if ficha.status == Status.TRIADO:
+            despachar(ficha)
+        elif ficha.status == Status.FINALIZADO and ficha.medico_atendente_id and ficha.chamado_em and ficha.finalizado_em:
+            minutos = (ficha.finalizado_em - ficha.chamado_em).total_seconds() / 60
+            registrar_consulta(ficha.medico_atendente_id, minutos)
+    except Exception:
+        # Sem despacho a ficha só fica TRIADO, como antes: o lançamento resolve
+        logger.exception("Falha no despacho automático (ficha %s)", ficha.id)
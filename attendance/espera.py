@@ -0,0 +1,110 @@
+"""
+Long-poll "me avise quando mudar", para TVs e telas sem EventSource.
+
+A versão que o cliente guarda é o cursor da trilha (ver trilha.py).
+aguardar() responde na hora se alguma ficha da unidade mudou depois do
+cursor; se nada mudou, segura a requisição até chegar um evento da unidade
+pelo broker (eventos.get_broker: LISTEN/NOTIFY com o PostgresBroker,
+memória do processo com o LocalBroker) ou até o timeout. A resposta traz só
+as fichas que mudaram (resumo atual de cada uma) e o cursor novo.
+
+Uma TV no polling de 3 s faz 20 requisições por minuto; no long-poll, uma
+por mudança (ou uma por timeout, quando a fila está parada).
+
+Evento perdido (broker fora do ar, reconexão) não perde mudança: no
+timeout a trilha é lida de novo, e ela é a fonte da verdade. Uma transação
+de escrita aberta segura a trilha (ver trilha.py) por no máximo
+trilha.PARADA_MAXIMA segundos; depois disso a TV segue sem ela.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+
+from . import trilha
+from .eventos import get_broker
+from .models import FichaAtendimento
+
+TIMEOUT_PADRAO = 25
+TIMEOUT_MAXIMO = 55
+
+# O broker avisa logo depois do commit, mas a trilha só entrega o evento
+# quando não há transação mais antiga aberta: reconfere algumas vezes antes
+# de voltar a esperar (o timeout pega o resto).
+RECONFERENCIAS = 5
+INTERVALO_RECONFERENCIA = 0.2
+
+
+def _interessa(de, para, filtro) -> bool:
+    return not filtro or bool({de, para} & filtro)
+
+
+def mudancas(unidade_id: int, cursor: str, filtro=frozenset()) -> tuple[dict, str]:
+    """
+    ({ficha_id: status anterior}, cursor novo): fichas da unidade que
+    entraram ou saíram das filas do filtro depois do cursor.
+    ValueError se o cursor não vale.
+    """
+    fichas = {}
+    while True:
+        # Só os eventos da unidade saem do banco: a TV não lê a trilha da rede toda
+        # Transação esquecida aberta não segura a TV além de trilha.PARADA_MAXIMA
+        eventos, cursor = trilha.eventos_apos(
+            cursor, trilha.LIMITE_MAXIMO, unidade_id=unidade_id, parada_maxima=trilha.PARADA_MAXIMA,
+        )
+        for evento in eventos:
+            if _interessa(evento.de, evento.para, filtro):
+                # O status de antes do primeiro evento é o que o cliente conhecia
+                fichas.setdefault(evento.ficha_id, evento.de)
+        if len(eventos) < trilha.LIMITE_MAXIMO:
+            return fichas, cursor
+
+
+def _resumos(fichas: dict) -> tuple[list, list]:
+    """(resumos das fichas, ids que já saíram da tabela viva)."""
+    encontradas = {
+        f.id: f for f in FichaAtendimento.objects.filter(id__in=fichas).select_related("paciente", "medico_atendente")
+    }
+    resumos = []
+    for ficha_id, anterior in fichas.items():
+        if ficha_id in encontradas:
+            resumos.append({**encontradas[ficha_id].resumo(), "anterior": anterior})
+    return resumos, [ficha_id for ficha_id in fichas if ficha_id not in encontradas]
+
+
+async def aguardar(unidade_id: int, cursor=None, filtro=frozenset(), timeout=TIMEOUT_PADRAO) -> dict:
+    """
+    {"cursor", "mudou", "fichas", "removidas"}. Sem cursor, só devolve o
+    cursor atual (o cliente carrega o estado pelo snapshot e passa a esperar
+    a partir dele). ValueError se o cursor não vale.
+    """
+    if not cursor:
+        return {"cursor": await sync_to_async(trilha.cursor_atual)(), "mudou": False, "fichas": [], "removidas": []}
+
+    loop = asyncio.get_running_loop()
+    fim = loop.time() + timeout
+    # Assina antes de ler: o que mudar entre a leitura e a espera não se perde
+    assinatura = get_broker().assinar(unidade_id)
+    try:
+        fichas, cursor = await sync_to_async(mudancas)(unidade_id, cursor, filtro)
+        while not fichas:
+            restante = fim - loop.time()
+            if restante <= 0:
+                break
+            evento = await assinatura.receber(timeout=restante)
+            if evento is None:
+                fichas, cursor = await sync_to_async(mudancas)(unidade_id, cursor, filtro)
+                break
+            if not _interessa(evento.get("anterior"), evento["status"], filtro):
+                continue
+            for _ in range(RECONFERENCIAS):
+                fichas, cursor = await sync_to_async(mudancas)(unidade_id, cursor, filtro)
+                if fichas:
+                    break
+                await asyncio.sleep(INTERVALO_RECONFERENCIA)
+    finally:
+        await assinatura.fechar()
+
+    if not fichas:
+        return {"cursor": cursor, "mudou": False, "fichas": [], "removidas": []}
+    resumos, removidas = await sync_to_async(_resumos)(fichas)
+    return {"cursor": cursor, "mudou": True, "fichas": resumos, "removidas": removidas}
@@ -0,0 +1,232 @@
+"""
+Canal de eventos das fichas (push para as TVs).
+
+Cada transição feita em services.py publica aqui o resumo da ficha
+(ver FichaAtendimento.resumo). Os painéis assinam via Server-Sent Events
+em /painel/eventos/ e só recebem alguma coisa quando uma ficha da unidade
+deles muda (o evento leva "unidade_id").
+
+O broker padrão é local (memória do próprio processo): serve para os testes
+e para rodar com um único worker ASGI. Com vários processos, use no .env
+EVENTOS_BROKER=attendance.eventos.RedisBroker ou, sem Redis,
+EVENTOS_BROKER=attendance.eventos.PostgresBroker (LISTEN/NOTIFY).
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .signals import ficha_transicionada
+
+logger = logging.getLogger(__name__)
+
+CANAL = "clinicflow:fichas"
+
+
+class LocalBroker:
+    """Pub/sub em memória. Quem publica nunca espera pelas TVs."""
+
+    def __init__(self, tamanho_fila=100):
+        self.tamanho_fila = tamanho_fila
+        self._lock = threading.Lock()
+        self._assinaturas = set()
+
+    def publicar(self, evento: dict) -> None:
+        with self._lock:
+            assinaturas = list(self._assinaturas)
+        for assinatura in assinaturas:
+            if assinatura.unidade_id is not None and assinatura.unidade_id != evento.get("unidade_id"):
+                continue
+            try:
+                assinatura.loop.call_soon_threadsafe(assinatura.entregar, evento)
+            except RuntimeError:
+                # Loop da conexão já foi encerrado (TV desligada)
+                self._remover(assinatura)
+
+    def assinar(self, unidade_id=None) -> "_AssinaturaLocal":
+        """Eventos só da unidade (None: de todas)."""
+        assinatura = _AssinaturaLocal(self, asyncio.get_running_loop(), self.tamanho_fila, unidade_id)
+        with self._lock:
+            self._assinaturas.add(assinatura)
+        return assinatura
+
+    def _remover(self, assinatura) -> None:
+        with self._lock:
+            self._assinaturas.discard(assinatura)
+
+
+class _AssinaturaLocal:
+    def __init__(self, broker, loop, tamanho_fila, unidade_id=None):
+        self.broker = broker
+        self.loop = loop
+        self.unidade_id = unidade_id
+        self.fila = asyncio.Queue(maxsize=tamanho_fila)
+
+    def entregar(self, evento):
+        # TV lenta: descarta o evento mais antigo em vez de acumular memória
+        if self.fila.full():
+            self.fila.get_nowait()
+        self.fila.put_nowait(evento)
+
+    async def receber(self, timeout=None):
+        """Próximo evento, ou None se nada chegou dentro do timeout."""
+        try:
+            return await asyncio.wait_for(self.fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def fechar(self):
+        self.broker._remover(self)
+
+
+class RedisBroker:
+    """
+    Pub/sub no Redis do docker-compose, para vários workers/servidores.
+    Um canal por unidade: a TV de uma unidade não recebe (nem descarta) os
+    eventos das outras.
+    """
+
+    def __init__(self, url=None):
+        import redis
+
+        self.url = url or settings.REDIS_URL
+        self._cliente = redis.Redis.from_url(self.url)
+
+    def publicar(self, evento: dict) -> None:
+        self._cliente.publish(f"{CANAL}:{evento['unidade_id']}", json.dumps(evento, cls=DjangoJSONEncoder))
+
+    def assinar(self, unidade_id=None) -> "_AssinaturaRedis":
+        """Eventos só da unidade (None: de todas)."""
+        return _AssinaturaRedis(self.url, unidade_id)
+
+
+class _AssinaturaRedis:
+    def __init__(self, url, unidade_id=None):
+        self.url = url
+        self.unidade_id = unidade_id
+        self._cliente = None
+        self._pubsub = None
+
+    async def receber(self, timeout=None):
+        if self._pubsub is None:
+            import redis.asyncio
+
+            self._cliente = redis.asyncio.Redis.from_url(self.url)
+            self._pubsub = self._cliente.pubsub()
+            if self.unidade_id is None:
+                await self._pubsub.psubscribe(f"{CANAL}:*")
+            else:
+                await self._pubsub.subscribe(f"{CANAL}:{self.unidade_id}")
+        mensagem = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if mensagem is None:
+            return None
+        return json.loads(mensagem["data"])
+
+    async def fechar(self):
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            await self._cliente.aclose()
+
+
+class PostgresBroker(LocalBroker):
+    """
+    LISTEN/NOTIFY do próprio PostgreSQL, para vários workers sem Redis.
+
+    publicar() faz pg_notify (o payload é o evento, bem abaixo do limite de
+    8000 bytes). Cada processo tem UMA conexão escutando, numa thread que
+    repassa os avisos para as assinaturas locais como o LocalBroker: uma TV
+    conectada não custa uma conexão no banco.
+    """
+
+    CANAL = "clinicflow_fichas"
+    # Sem aviso nenhum, a thread confere se a conexão ainda está viva
+    CONFERIR_SEGUNDOS = 30
+
+    def __init__(self, tamanho_fila=100, alias=DEFAULT_DB_ALIAS):
+        super().__init__(tamanho_fila)
+        self.alias = alias
+        self.escutando = threading.Event()
+        self._encerrar = threading.Event()
+        self._ouvinte = None
+        self._lock_ouvinte = threading.Lock()
+
+    def publicar(self, evento: dict) -> None:
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.CANAL, json.dumps(evento, cls=DjangoJSONEncoder)])
+
+    def assinar(self, unidade_id=None) -> "_AssinaturaLocal":
+        """Eventos só da unidade (None: de todas)."""
+        with self._lock_ouvinte:
+            if self._ouvinte is None or not self._ouvinte.is_alive():
+                self._encerrar.clear()
+                self._ouvinte = threading.Thread(target=self._ouvir, name="eventos-postgres", daemon=True)
+                self._ouvinte.start()
+        return super().assinar(unidade_id)
+
+    def encerrar(self) -> None:
+        """Para a thread de escuta e fecha a conexão dela."""
+        self._encerrar.set()
+        if self._ouvinte is not None:
+            self._ouvinte.join(5)
+
+    def _ouvir(self):
+        while not self._encerrar.is_set():
+            conexao = connections.create_connection(self.alias)
+            try:
+                conexao.ensure_connection()
+                with conexao.cursor() as cursor:
+                    cursor.execute(f"LISTEN {conexao.ops.quote_name(self.CANAL)}")
+                self.escutando.set()
+                self._repassar(conexao)
+            except Exception:
+                # Reconecta; o que passou nesse meio tempo as TVs recuperam
+                # pelo snapshot/trilha (ver espera.py)
+                logger.exception("Conexão LISTEN dos eventos caiu; reconectando")
+                self._encerrar.wait(1)
+            finally:
+                self.escutando.clear()
+                conexao.close()
+
+    def _repassar(self, conexao):
+        bruta = conexao.connection
+        conferida = time.monotonic()
+        while not self._encerrar.is_set():
+            if select.select([bruta], [], [], 1) == ([], [], []):
+                if time.monotonic() - conferida >= self.CONFERIR_SEGUNDOS:
+                    with conexao.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    conferida = time.monotonic()
+                continue
+            bruta.poll()
+            while bruta.notifies:
+                aviso = bruta.notifies.pop(0)
+                LocalBroker.publicar(self, json.loads(aviso.payload))
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.EVENTOS_BROKER)()
+
+
+def publicar(evento: dict) -> None:
+    get_broker().publicar(evento)
+
+
+@receiver(ficha_transicionada)
+def publicar_transicao(sender, ficha, anterior, **kwargs):
+    evento = ficha.resumo()
+    evento["anterior"] = anterior
+    try:
+        publicar(evento)
+    except Exception:
+        # Painel desatualizado é ruim, mas nunca pode derrubar a recepção/triagem
+        logger.exception("Falha ao publicar evento da ficha %s", ficha.id)
@@ -0,0 +1,325 @@
+"""
+Cache quente das filas (write-through).
+
+Cada fila ativa (CHEGADA, TRIADO, CHAMADO_*...) e a fila de cada médico
+(MEDICO:<id>) fica guardada já ordenada: sorted set no Redis, ou uma lista
+ordenada em memória (MemoriaFilaBackend, para testes e dev sem Redis).
+
+Cada unidade tem o seu backend (get_backend(unidade_id)): chaves, contador de
+mudanças e reconstrução são por unidade, então uma unidade movimentada não
+disputa nada com as outras.
+
+Depois do commit de cada transição a ficha é movida de fila aqui (ver
+snapshots.invalidar_paineis); painéis e listas leem daqui em vez do
+PostgreSQL. Cache frio (Redis reiniciado, deploy novo) é reconstruído do
+banco na primeira leitura. Se o cache cair, as leituras voltam para o banco.
+"""
+import json
+import logging
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from core.replicas import primaria
+
+from .models import FichaAtendimento
+
+logger = logging.getLogger(__name__)
+
+Status = FichaAtendimento.Status
+
+STATUS_ATIVOS = [s for s in Status if s not in (Status.FINALIZADO, Status.CANCELADO)]
+# Status em que a ficha também aparece na fila do médico atendente
+STATUS_MEDICO = [Status.AGUARDANDO_MEDICO, Status.CHAMADO_MEDICO, Status.EM_ATENDIMENTO]
+# Filas "quem foi chamado": a mais recente primeiro
+STATUS_CHAMADOS = [Status.CHAMADO_TRIAGEM, Status.EM_TRIAGEM, Status.CHAMADO_MEDICO, Status.EM_ATENDIMENTO]
+
+CAMPOS_DATA = ("criado_em", "chamado_em", "atualizado_em")
+
+
+def fila_medico(medico_id) -> str:
+    return f"MEDICO:{medico_id}"
+
+
+def score_prioridade(prioridade_ordem, criado_em) -> float:
+    # prioridade_ordem domina; dentro da mesma cor, ordem de chegada
+    return prioridade_ordem * 1e10 + criado_em.timestamp()
+
+
+def _score_prioridade(ficha) -> float:
+    return score_prioridade(ficha.prioridade_ordem, ficha.criado_em)
+
+
+def _score(ficha) -> float:
+    if ficha.status in (Status.TRIADO, Status.AGUARDANDO_MEDICO):
+        return _score_prioridade(ficha)
+    if ficha.status in STATUS_CHAMADOS:
+        return -ficha.atualizado_em.timestamp()
+    return ficha.criado_em.timestamp()
+
+
+def filas_da_ficha(ficha) -> list:
+    """[(fila, score), ...] onde a ficha deve estar agora (vazio se já saiu do fluxo)."""
+    if ficha.status not in STATUS_ATIVOS:
+        return []
+    filas = [(ficha.status, _score(ficha))]
+    if ficha.medico_atendente_id and ficha.status in STATUS_MEDICO:
+        filas.append((fila_medico(ficha.medico_atendente_id), _score_prioridade(ficha)))
+    return filas
+
+
+class MemoriaFilaBackend:
+    """Filas em memória do processo. Para testes e dev com um worker só."""
+
+    def __init__(self, unidade_id):
+        self.unidade_id = unidade_id
+        self._lock = threading.Lock()
+        self.limpar()
+
+    def limpar(self):
+        self._filas = {}    # nome -> [(score, id), ...] sempre ordenada
+        self._fichas = {}   # id -> {"versao", "filas", "resumo"}
+        self._mudancas = 0
+        self._pronto = False
+
+    def _remover(self, ficha_id):
+        registro = self._fichas.pop(ficha_id, None)
+        for nome, score in registro["filas"] if registro else []:
+            fila = self._filas[nome]
+            i = bisect_left(fila, (score, ficha_id))
+            if i < len(fila) and fila[i] == (score, ficha_id):
+                del fila[i]
+
+    def _inserir(self, ficha_id, versao, filas, resumo):
+        for nome, score in filas:
+            insort(self._filas.setdefault(nome, []), (score, ficha_id))
+        self._fichas[ficha_id] = {"versao": versao, "filas": filas, "resumo": resumo}
+
+    def aplicar(self, ficha_id, versao, filas, resumo) -> bool:
+        with self._lock:
+            self._mudancas += 1
+            antigo = self._fichas.get(ficha_id)
+            if antigo and antigo["versao"] > versao:
+                return False  # chegou atrasado: já existe estado mais novo
+            self._remover(ficha_id)
+            if filas:
+                self._inserir(ficha_id, versao, filas, resumo)
+            return True
+
+    def ler(self, fila, limite=None):
+        with self._lock:
+            if not self._pronto:
+                return None
+            return [self._fichas[i]["resumo"] for _, i in self._filas.get(fila, [])[:limite]]
+
+    def contar(self, fila, abaixo_de=None):
+        """Quantas fichas da fila têm score menor que `abaixo_de` (todas, se None). None se frio."""
+        with self._lock:
+            if not self._pronto:
+                return None
+            itens = self._filas.get(fila, [])
+            return len(itens) if abaixo_de is None else bisect_left(itens, (abaixo_de,))
+
+    def mudancas(self) -> int:
+        return self._mudancas
+
+    def substituir(self, mudancas_esperadas, itens) -> bool:
+        with self._lock:
+            if self._mudancas != mudancas_esperadas:
+                return False  # houve transição durante a leitura do banco
+            self._filas, self._fichas = {}, {}
+            for item in itens:
+                self._inserir(*item)
+            self._pronto = True
+            return True
+
+
+# Move a ficha de fila numa só ida ao Redis, ignorando atualizações fora de ordem
+_LUA_APLICAR = """
+local prefixo, id = ARGV[1], ARGV[2]
+local novo = cjson.decode(ARGV[3])
+redis.call('INCR', prefixo .. '_mudancas')
+local bruto = redis.call('HGET', prefixo .. '_fichas', id)
+if bruto then
+    local antigo = cjson.decode(bruto)
+    if antigo['versao'] > novo['versao'] then return 0 end
+    for _, par in ipairs(antigo['filas']) do redis.call('ZREM', prefixo .. par[1], id) end
+end
+if #novo['filas'] == 0 then
+    redis.call('HDEL', prefixo .. '_fichas', id)
+    return 1
+end
+for _, par in ipairs(novo['filas']) do
+    redis.call('ZADD', prefixo .. par[1], par[2], id)
+    redis.call('SADD', prefixo .. '_nomes', par[1])
+end
+redis.call('HSET', prefixo .. '_fichas', id, ARGV[3])
+return 1
+"""
+
+_LUA_LER = """
+local prefixo = ARGV[1]
+if redis.call('EXISTS', prefixo .. '_pronto') == 0 then return false end
+local ids = redis.call('ZRANGE', prefixo .. ARGV[2], 0, tonumber(ARGV[3]))
+if #ids == 0 then return {} end
+return redis.call('HMGET', prefixo .. '_fichas', unpack(ids))
+"""
+
+
+class RedisFilaBackend:
+    """Filas como sorted sets no Redis, compartilhadas por todos os workers."""
+
+    PREFIXO = "clinicflow:fila:"
+
+    def __init__(self, unidade_id, url=None):
+        import redis
+
+        self.unidade_id = unidade_id
+        self.prefixo = f"{self.PREFIXO}{unidade_id}:"
+
+        self._redis = redis.Redis.from_url(url or settings.REDIS_URL)
+        self._aplicar = self._redis.register_script(_LUA_APLICAR)
+        self._ler = self._redis.register_script(_LUA_LER)
+
+    def limpar(self):
+        nomes = [n.decode() for n in self._redis.smembers(self.prefixo + "_nomes")]
+        chaves = [self.prefixo + n for n in nomes]
+        chaves += [self.prefixo + s for s in ("_nomes", "_fichas", "_mudancas", "_pronto")]
+        self._redis.delete(*chaves)
+
+    def aplicar(self, ficha_id, versao, filas, resumo) -> bool:
+        registro = json.dumps({"versao": versao, "filas": filas, "resumo": resumo})
+        return bool(self._aplicar(args=[self.prefixo, ficha_id, registro]))
+
+    def ler(self, fila, limite=None):
+        brutos = self._ler(args=[self.prefixo, fila, -1 if limite is None else limite - 1])
+        if brutos is None:
+            return None
+        return [json.loads(b)["resumo"] for b in brutos if b]
+
+    def contar(self, fila, abaixo_de=None):
+        with self._redis.pipeline(transaction=False) as pipe:
+            pipe.exists(self.prefixo + "_pronto")
+            pipe.zcount(self.prefixo + fila, "-inf", "+inf" if abaixo_de is None else f"({abaixo_de}")
+            pronto, total = pipe.execute()
+        return total if pronto else None
+
+    def mudancas(self) -> int:
+        return int(self._redis.get(self.prefixo + "_mudancas") or 0)
+
+    def substituir(self, mudancas_esperadas, itens) -> bool:
+        import redis
+
+        chave_mudancas = self.prefixo + "_mudancas"
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(chave_mudancas)
+                if int(pipe.get(chave_mudancas) or 0) != mudancas_esperadas:
+                    return False
+                nomes = [n.decode() for n in pipe.smembers(self.prefixo + "_nomes")]
+                pipe.multi()
+                pipe.delete(*[self.prefixo + n for n in nomes], self.prefixo + "_nomes", self.prefixo + "_fichas")
+                for ficha_id, versao, filas, resumo in itens:
+                    for nome, score in filas:
+                        pipe.zadd(self.prefixo + nome, {ficha_id: score})
+                        pipe.sadd(self.prefixo + "_nomes", nome)
+                    pipe.hset(self.prefixo + "_fichas", ficha_id,
+                              json.dumps({"versao": versao, "filas": filas, "resumo": resumo}))
+                pipe.set(self.prefixo + "_pronto", 1)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+
+@lru_cache(maxsize=None)
+def get_backend(unidade_id):
+    return import_string(settings.FILA_CACHE_BACKEND)(unidade_id)
+
+
+def _item(ficha):
+    return (ficha.id, ficha.atualizado_em.timestamp(), filas_da_ficha(ficha), ficha.resumo())
+
+
+def registrar(ficha) -> None:
+    """Coloca a ficha nas filas do seu status atual (chamar depois do commit)."""
+    get_backend(ficha.unidade_id).aplicar(*_item(ficha))
+
+
+def reconstruir(unidade_id, tentativas=3) -> bool:
+    """Recarrega as filas da unidade do banco (só as fichas ativas, pelo índice parcial)."""
+    backend = get_backend(unidade_id)
+    for _ in range(tentativas):
+        mudancas = backend.mudancas()
+        # Da primária: uma réplica atrasada deixaria a fila velha no cache
+        with primaria():
+            itens = [_item(f) for f in FichaAtendimento.fila.ativas().da_unidade(unidade_id)]
+        if backend.substituir(mudancas, itens):
+            return True
+    return False
+
+
+def _fila_do_banco(unidade_id, nome, limite=None):
+    fichas = FichaAtendimento.fila.da_unidade(unidade_id)
+    if nome.startswith("MEDICO:"):
+        fichas = fichas.do_medico(nome.split(":", 1)[1])
+    elif nome in (Status.TRIADO, Status.AGUARDANDO_MEDICO):
+        fichas = fichas.por_prioridade(nome)
+    elif nome in STATUS_CHAMADOS:
+        fichas = fichas.chamados(nome)
+    else:
+        fichas = fichas.por_chegada(nome)
+    return [f.resumo() for f in fichas[:limite]]
+
+
+def fila(unidade_id, nome, limite=None) -> list:
+    """Resumos das fichas da fila da unidade, já na ordem de chamada."""
+    try:
+        backend = get_backend(unidade_id)
+        itens = backend.ler(nome, limite)
+        if itens is None and reconstruir(unidade_id):
+            itens = backend.ler(nome, limite)
+        if itens is not None:
+            return itens
+    except Exception:
+        logger.exception("Cache das filas indisponível; lendo a fila %s da unidade %s do banco", nome, unidade_id)
+    return _fila_do_banco(unidade_id, nome, limite)
+
+
+def _contar_no_banco(unidade_id, nome, abaixo_de=None):
+    fichas = FichaAtendimento.fila.da_unidade(unidade_id)
+    if nome.startswith("MEDICO:"):
+        fichas = fichas.do_medico(nome.split(":", 1)[1])
+    else:
+        fichas = fichas.filter(status=nome)
+    scores = (dict(filas_da_ficha(f)).get(nome) for f in fichas)
+    return sum(1 for score in scores if score is not None and (abaixo_de is None or score < abaixo_de))
+
+
+def contar(unidade_id, nome, abaixo_de=None) -> int:
+    """
+    Tamanho da fila, ou quantas fichas ficam na frente de quem tem score
+    `abaixo_de` (ver filas_da_ficha). O(log n) no cache: não lê as fichas.
+    """
+    try:
+        backend = get_backend(unidade_id)
+        total = backend.contar(nome, abaixo_de)
+        if total is None and reconstruir(unidade_id):
+            total = backend.contar(nome, abaixo_de)
+        if total is not None:
+            return total
+    except Exception:
+        logger.exception("Cache das filas indisponível; contando a fila %s da unidade %s no banco", nome, unidade_id)
+    return _contar_no_banco(unidade_id, nome, abaixo_de)
+
+
+def com_datas(resumos) -> list:
+    """Converte as datas ISO dos resumos em datetime (para os filtros |date dos templates)."""
+    return [
+        {**r, **{c: datetime.fromisoformat(r[c]) for c in CAMPOS_DATA if r.get(c)}}
+        for r in resumos
+    ]
@@ -1,20 +1,33 @@
 from django import forms
 
+from patients.cpf import normalizar_cpf
+from patients.models import Patient
+
 
 INPUT_STYLE = "w-full border border-slate-300 rounded-lg px-3 py-2 focus:ring-2 focus:ring-blue-500 focus:outline-none"
 
 
 
 class RecepcaoGerarSenhaForm(forms.Form):
+    # Preenchido pelo autocomplete quando o paciente já tem cadastro:
+    # aí nome/CPF/etc. não precisam ser reenviados
+    paciente = forms.ModelChoiceField(
+        queryset=Patient.objects.all(),
+        required=False,
+        widget=forms.HiddenInput
+    )
+
     nome = forms.CharField(
         label="Nome completo",
         max_length=255,
+        required=False,
         widget=forms.TextInput(attrs={"class": INPUT_STYLE})
     )
 
     cpf = forms.CharField(
         label="CPF",
         max_length=14,
+        required=False,
         widget=forms.TextInput(attrs={"class": INPUT_STYLE})
     )
 
@@ -38,7 +51,13 @@ class RecepcaoGerarSenhaForm(forms.Form):
 
     def clean_cpf(self):
         cpf = self.cleaned_data["cpf"]
-        digits = "".join([c for c in cpf if c.isdigit()])
-        if len(digits) != 11:
-            raise forms.ValidationError("CPF inválido.")
-        return f"{digits[0:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:11]}"
+        return normalizar_cpf(cpf) if cpf else cpf
+
+    def clean(self):
+        dados = super().clean()
+        # Sem paciente escolhido no autocomplete, é cadastro/atualização: nome e CPF obrigatórios
+        if not dados.get("paciente"):
+            for campo in ("nome", "cpf"):
+                if not dados.get(campo) and campo not in self.errors:
+                    self.add_error(campo, "Este campo é obrigatório.")
+        return dados
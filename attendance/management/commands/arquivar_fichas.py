@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+
+from attendance.arquivamento import arquivar_lote, limite_padrao
+
+
+class Command(BaseCommand):
+    help = "Move fichas FINALIZADO/CANCELADO antigas para o arquivo, em lotes (pode rodar no cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=1000, help="Fichas por transação (padrão 1000).")
+        parser.add_argument("--pausa", type=float, default=0.1, help="Segundos entre lotes (padrão 0.1).")
+        parser.add_argument("--max-lotes", type=int, default=None, help="Para depois de N lotes.")
+
+    def handle(self, *args, lote, pausa, max_lotes, **options):
+        antes = limite_padrao()  # fixo durante a execução: o comando sempre termina
+        total = lotes = 0
+        while max_lotes is None or lotes < max_lotes:
+            try:
+                movidas = arquivar_lote(antes, lote)
+            except OperationalError as exc:
+                self.stderr.write(f"Lote abortado ({exc}); o restante fica para a próxima execução.")
+                break
+            total += movidas
+            lotes += 1
+            if movidas < lote:
+                break
+            time.sleep(pausa)
+
+        self.stdout.write(self.style.SUCCESS(f"{total} ficha(s) arquivada(s) em {lotes} lote(s)."))
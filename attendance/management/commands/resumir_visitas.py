@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from attendance import visitas
+from patients.models import Patient
+
+
+class Command(BaseCommand):
+    help = (
+        "Monta o resumo de visitas (triagem) dos pacientes que ainda não têm, a partir do histórico. "
+        "Depois disso as services mantêm o resumo sozinhas. Pode ser interrompido e rodado de novo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=1000, help="Pacientes por consulta (padrão 1000).")
+        parser.add_argument("--todos", action="store_true", help="Refaz também quem já tem resumo.")
+
+    def handle(self, *args, lote, todos, **options):
+        pacientes = Patient.objects.order_by("id")
+        if not todos:
+            pacientes = pacientes.filter(resumo_visitas__isnull=True)
+        ultimo = 0
+        total = montados = 0
+        while True:
+            ids = list(pacientes.filter(id__gt=ultimo).values_list("id", flat=True)[:lote])
+            if not ids:
+                break
+            for paciente_id in ids:
+                montados += visitas.reconstruir(paciente_id) is not None
+            total += len(ids)
+            ultimo = ids[-1]
+            self.stdout.write(f"  {total} paciente(s)...")
+
+        self.stdout.write(self.style.SUCCESS(f"{montados} resumo(s) de visitas montado(s) ({total} paciente(s) lidos)."))
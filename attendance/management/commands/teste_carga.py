@@ -0,0 +1,117 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from attendance import carga
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de carga do fluxo recepção -> triagem -> lançamento -> médico + TVs, pelas URLs reais. "
+        "Grava p50/p95/p99, requisições/s e consultas por endpoint e compara com a execução anterior. "
+        "Com --conexoes, compara o snapshot das TVs pelo caminho síncrono (WSGI) e assíncrono (ASGI). "
+        "ESCREVE NO BANCO: use um banco de teste de carga."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--semear", action="store_true", help="Semeia o histórico antes (só o que falta).")
+        parser.add_argument("--pacientes", type=int, default=500_000, help="Pacientes do histórico (padrão 500 mil).")
+        parser.add_argument("--fichas", type=int, default=1_000_000, help="Fichas do histórico (padrão 1 milhão).")
+        parser.add_argument("--unidades", type=int, default=1, help="Unidades simuladas ao mesmo tempo (padrão 1).")
+        parser.add_argument("--duracao", type=float, default=60, help="Segundos de simulação (padrão 60).")
+        parser.add_argument("--recepcionistas", type=int, default=1, help="Por unidade (padrão 1).")
+        parser.add_argument("--enfermeiras", type=int, default=2, help="Por unidade (padrão 2).")
+        parser.add_argument("--medicos", type=int, default=3, help="Por unidade (padrão 3).")
+        parser.add_argument("--tvs", type=int, default=3, help="TVs por unidade (padrão 3).")
+        parser.add_argument("--sem-plantao", action="store_true", help="Médicos fora do plantão: o lançamento roteia tudo.")
+        parser.add_argument("--pausa", type=float, default=0.2, help="Segundos entre ações de cada pessoa (padrão 0.2).")
+        parser.add_argument("--intervalo-tv", type=float, default=1.0, help="Segundos entre consultas de cada TV (padrão 1).")
+        parser.add_argument("--semente", type=int, default=None, help="Semente do sorteio (execuções comparáveis).")
+        parser.add_argument("--saida", default=str(carga.ARQUIVO_RESULTADOS), help="Arquivo JSONL dos resultados.")
+        parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora de p95 aceita (padrão 0.2 = 20%%).")
+        parser.add_argument("--falhar-se-regredir", action="store_true", help="Termina com erro se houver regressão (CI).")
+        parser.add_argument(
+            "--conexoes", type=int, default=None,
+            help="Em vez do fluxo: N TVs simultâneas no snapshot, caminho síncrono x assíncrono.",
+        )
+        parser.add_argument(
+            "--caminho", choices=("sync", "async"), default=None,
+            help="Com --conexoes, mede só um caminho (memória mais fiel: um caminho por processo).",
+        )
+
+    def handle(self, *args, **opcoes):
+        unidades = carga.preparar_unidades(opcoes["unidades"])
+        if opcoes["conexoes"]:
+            return self._conexoes(unidades[0], opcoes)
+        if opcoes["semear"]:
+            self.stdout.write(f"{carga.semear_pacientes(opcoes['pacientes'])} paciente(s) semeado(s).")
+            fichas = carga.semear_fichas(
+                opcoes["fichas"], [u.id for u in unidades],
+                ao_progresso=lambda total: self.stdout.write(f"  {total} ficha(s)..."),
+            )
+            self.stdout.write(f"{fichas} ficha(s) de histórico semeada(s).")
+
+        parametros = {
+            nome: opcoes[nome]
+            for nome in (
+                "unidades", "duracao", "recepcionistas", "enfermeiras", "medicos", "tvs",
+                "sem_plantao", "pausa", "intervalo_tv",
+            )
+        }
+        self.stdout.write(f"Simulando {opcoes['duracao']:.0f}s em {len(unidades)} unidade(s)...")
+        simulacao = carga.simular(
+            unidades, opcoes["duracao"],
+            recepcionistas=opcoes["recepcionistas"], enfermeiras=opcoes["enfermeiras"], medicos=opcoes["medicos"],
+            tvs=opcoes["tvs"], plantao=not opcoes["sem_plantao"], pausa=opcoes["pausa"],
+            intervalo_tv=opcoes["intervalo_tv"], semente=opcoes["semente"],
+        )
+        resultado = carga.resumir(simulacao, parametros)
+        self._imprimir(resultado)
+
+        arquivo = Path(opcoes["saida"])
+        base = carga.anterior(arquivo, parametros)
+        carga.gravar(arquivo, resultado)
+        self.stdout.write(f"Resultado gravado em {arquivo}.")
+        if base is None:
+            return
+
+        regressoes = carga.comparar(resultado, base, opcoes["tolerancia"])
+        if not regressoes:
+            self.stdout.write(self.style.SUCCESS(f"Sem regressão em relação a {base['commit'] or base['em']}."))
+            return
+        for endpoint, antes, agora, variacao in regressoes:
+            self.stdout.write(self.style.WARNING(
+                f"REGRESSÃO {endpoint}: p95 {antes:.1f} -> {agora:.1f} ms ({variacao:+.0%})"
+            ))
+        if opcoes["falhar_se_regredir"]:
+            raise CommandError(f"{len(regressoes)} endpoint(s) regrediram em relação a {base['commit'] or base['em']}.")
+
+    def _conexoes(self, unidade, opcoes):
+        caminhos = (opcoes["caminho"],) if opcoes["caminho"] else ("sync", "async")
+        self.stdout.write(f"{opcoes['conexoes']} TV(s) simultânea(s), {opcoes['duracao']:.0f}s por caminho...")
+        resultado = carga.comparar_caminhos(unidade, opcoes["conexoes"], opcoes["duracao"], caminhos=caminhos)
+        self.stdout.write(
+            f"{'caminho':<8} {'threads':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'kB/conexão':>10} {'erros':>6}"
+        )
+        for caminho, e in resultado.items():
+            memoria = "-" if e["memoria_por_conexao_kb"] is None else f"{e['memoria_por_conexao_kb']:.1f}"
+            self.stdout.write(
+                f"{caminho:<8} {e['threads']:>7} {e['por_segundo']:>8.1f} {e['p50_ms']:>8.1f} "
+                f"{e['p95_ms']:>8.1f} {e['p99_ms']:>8.1f} {memoria:>10} {e['erros']:>6}"
+            )
+
+    def _imprimir(self, resultado):
+        self.stdout.write(
+            f"{'endpoint':<50} {'req':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'consultas':>9} {'erros':>6}"
+        )
+        for endpoint, e in resultado["endpoints"].items():
+            self.stdout.write(
+                f"{endpoint:<50} {e['requisicoes']:>7} {e['por_segundo']:>8.1f} {e['p50_ms']:>8.1f} "
+                f"{e['p95_ms']:>8.1f} {e['p99_ms']:>8.1f} {e['consultas_media']:>9.1f} {e['erros']:>6}"
+            )
+        for unidade_id, e in resultado["unidades"].items():
+            self.stdout.write(f"unidade {unidade_id}: {e['por_segundo']:.1f} req/s, p95 {e['p95_ms']:.1f} ms")
+        for falha in resultado["falhas"]:
+            self.stderr.write(f"Falha: {falha}")
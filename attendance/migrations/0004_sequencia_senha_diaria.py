@@ -0,0 +1,75 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:39
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def preencher_data_senha(apps, schema_editor):
+    """Fichas antigas: o dia da senha é o dia (local) em que foram criadas."""
+    FichaAtendimento = apps.get_model('attendance', 'FichaAtendimento')
+    FichaAtendimento.objects.update(data_senha=TruncDate('criado_em'))
+
+
+def semear_sequencias(apps, schema_editor):
+    """Continua a numeração de onde as fichas já existentes pararam."""
+    FichaAtendimento = apps.get_model('attendance', 'FichaAtendimento')
+    SequenciaSenha = apps.get_model('attendance', 'SequenciaSenha')
+
+    ultimos = {}
+    for data, codigo in FichaAtendimento.objects.values_list('data_senha', 'codigo').iterator():
+        prefixo, numero = codigo[:1], codigo[1:]
+        if numero.isdigit():
+            chave = (data, prefixo)
+            ultimos[chave] = max(ultimos.get(chave, 0), int(numero))
+
+    SequenciaSenha.objects.bulk_create(
+        SequenciaSenha(data=data, prefixo=prefixo, ultimo_numero=numero)
+        for (data, prefixo), numero in ultimos.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0003_alter_fichaatendimento_options_and_more'),
+        ('patients', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenciaSenha',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('prefixo', models.CharField(max_length=3)),
+                ('ultimo_numero', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Sequência de Senhas',
+                'verbose_name_plural': 'Sequências de Senhas',
+            },
+        ),
+        migrations.AddField(
+            model_name='fichaatendimento',
+            name='data_senha',
+            field=models.DateField(default=django.utils.timezone.localdate, editable=False),
+        ),
+        migrations.RunPython(preencher_data_senha, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='fichaatendimento',
+            name='codigo',
+            field=models.CharField(db_index=True, max_length=10),
+        ),
+        migrations.AddConstraint(
+            model_name='fichaatendimento',
+            constraint=models.UniqueConstraint(fields=('data_senha', 'codigo'), name='ficha_codigo_unico_por_dia'),
+        ),
+        migrations.AddConstraint(
+            model_name='sequenciasenha',
+            constraint=models.UniqueConstraint(fields=('data', 'prefixo'), name='sequencia_senha_unica_por_dia'),
+        ),
+        migrations.RunPython(semear_sequencias, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:39
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY: não trava a recepção enquanto indexa o histórico
+    atomic = False
+
+    dependencies = [
+        ('attendance', '0004_sequencia_senha_diaria'),
+        ('patients', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(condition=models.Q(('status__in', ['CHEGADA', 'CHAMADO_TRIAGEM', 'EM_TRIAGEM', 'TRIADO', 'AGUARDANDO_MEDICO', 'CHAMADO_MEDICO', 'EM_ATENDIMENTO'])), fields=['status', 'criado_em'], name='ficha_ativa_criado_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(condition=models.Q(('status__in', ['CHAMADO_TRIAGEM', 'EM_TRIAGEM', 'CHAMADO_MEDICO'])), fields=['status', 'chamado_em'], name='ficha_chamada_chamado_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(condition=models.Q(('status__in', ['CHAMADO_TRIAGEM', 'EM_TRIAGEM'])), fields=['status', 'atualizado_em'], name='ficha_chamada_atualizado_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(condition=models.Q(('status', 'TRIADO')), fields=['status', '-prioridade', 'criado_em'], name='ficha_triado_prioridade_idx'),
+        ),
+    ]
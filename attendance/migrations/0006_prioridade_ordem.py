@@ -0,0 +1,46 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:41
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+# Cópia congelada de FichaAtendimento.ORDEM_PRIORIDADE
+ORDEM_PRIORIDADE = {'VERMELHO': 1, 'LARANJA': 2, 'AMARELO': 3, 'VERDE': 4, 'AZUL': 5}
+
+
+def preencher_prioridade_ordem(apps, schema_editor):
+    FichaAtendimento = apps.get_model('attendance', 'FichaAtendimento')
+    # Um UPDATE por cor; fichas sem prioridade ficam com o default (9)
+    for prioridade, ordem in ORDEM_PRIORIDADE.items():
+        FichaAtendimento.objects.filter(prioridade=prioridade).update(prioridade_ordem=ordem)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('attendance', '0005_indices_filas'),
+        ('patients', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='fichaatendimento',
+            options={'ordering': ['prioridade_ordem', 'criado_em'], 'verbose_name': 'Ficha de Atendimento', 'verbose_name_plural': 'Fichas de Atendimento'},
+        ),
+        migrations.AddField(
+            model_name='fichaatendimento',
+            name='prioridade_ordem',
+            field=models.PositiveSmallIntegerField(default=9, editable=False),
+        ),
+        migrations.RunPython(preencher_prioridade_ordem, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(condition=models.Q(('status__in', ['TRIADO', 'AGUARDANDO_MEDICO'])), fields=['status', 'prioridade_ordem', 'criado_em'], name='ficha_fila_medica_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='fichaatendimento',
+            name='ficha_triado_prioridade_idx',
+        ),
+    ]
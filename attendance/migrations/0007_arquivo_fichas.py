@@ -0,0 +1,112 @@
+# Generated by Django 6.0.2 on 2026-10-18 14:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+# Colunas comuns às duas tabelas. Migrations que mexerem nas colunas da
+# ficha precisam recriar esta VIEW.
+COLUNAS = """
+    id, codigo, data_senha, paciente_id, status, prioridade, prioridade_ordem,
+    medico_atendente_id, local_atendimento, pa_sistolica, pa_diastolica, temperatura,
+    frequencia_cardiaca, observacoes_triagem, criado_em, atualizado_em, chamado_em, finalizado_em
+"""
+
+CRIAR_VIEW = f"""
+CREATE VIEW attendance_fichahistorico AS
+    SELECT {COLUNAS}, false AS arquivada FROM attendance_fichaatendimento
+    UNION ALL
+    SELECT {COLUNAS}, true AS arquivada FROM attendance_fichaarquivada
+"""
+
+
+class Migration(migrations.Migration):
+    # Índice parcial criado CONCURRENTLY (a tabela viva pode estar enorme)
+    atomic = False
+
+    dependencies = [
+        ('attendance', '0006_prioridade_ordem'),
+        ('patients', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FichaArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('codigo', models.CharField(max_length=10)),
+                ('data_senha', models.DateField()),
+                ('status', models.CharField(choices=[('CHEGADA', 'Aguardando Triagem'), ('CHAMADO_TRIAGEM', 'Chamado para Triagem'), ('EM_TRIAGEM', 'Em Triagem'), ('TRIADO', 'Aguardando Encaminhamento Médico'), ('AGUARDANDO_MEDICO', 'Aguardando Médico'), ('CHAMADO_MEDICO', 'Chamado para Médico'), ('EM_ATENDIMENTO', 'Em Atendimento Médico'), ('FINALIZADO', 'Finalizado'), ('CANCELADO', 'Cancelado')], max_length=30)),
+                ('prioridade', models.CharField(blank=True, choices=[('VERMELHO', 'Emergência'), ('LARANJA', 'Muito Urgente'), ('AMARELO', 'Urgente'), ('VERDE', 'Pouco Urgente'), ('AZUL', 'Não Urgente')], max_length=10, null=True)),
+                ('prioridade_ordem', models.PositiveSmallIntegerField()),
+                ('local_atendimento', models.CharField(blank=True, max_length=50, null=True)),
+                ('pa_sistolica', models.IntegerField(blank=True, null=True, verbose_name='Pressão Sistólica')),
+                ('pa_diastolica', models.IntegerField(blank=True, null=True, verbose_name='Pressão Diastólica')),
+                ('temperatura', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True)),
+                ('frequencia_cardiaca', models.IntegerField(blank=True, null=True)),
+                ('observacoes_triagem', models.TextField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField()),
+                ('atualizado_em', models.DateTimeField()),
+                ('chamado_em', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Ficha Arquivada',
+                'verbose_name_plural': 'Fichas Arquivadas',
+            },
+        ),
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(condition=models.Q(('status__in', ['FINALIZADO', 'CANCELADO'])), fields=['criado_em'], name='ficha_encerrada_criado_idx'),
+        ),
+        migrations.AddField(
+            model_name='fichaarquivada',
+            name='medico_atendente',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='atendimentos_arquivados', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='fichaarquivada',
+            name='paciente',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='fichas_arquivadas', to='patients.patient'),
+        ),
+        migrations.AddIndex(
+            model_name='fichaarquivada',
+            index=models.Index(fields=['criado_em'], name='ficha_arquivada_criado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fichaarquivada',
+            index=models.Index(fields=['data_senha', 'codigo'], name='ficha_arquivada_codigo_idx'),
+        ),
+        migrations.CreateModel(
+            name='FichaHistorico',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('codigo', models.CharField(max_length=10)),
+                ('data_senha', models.DateField()),
+                ('status', models.CharField(choices=[('CHEGADA', 'Aguardando Triagem'), ('CHAMADO_TRIAGEM', 'Chamado para Triagem'), ('EM_TRIAGEM', 'Em Triagem'), ('TRIADO', 'Aguardando Encaminhamento Médico'), ('AGUARDANDO_MEDICO', 'Aguardando Médico'), ('CHAMADO_MEDICO', 'Chamado para Médico'), ('EM_ATENDIMENTO', 'Em Atendimento Médico'), ('FINALIZADO', 'Finalizado'), ('CANCELADO', 'Cancelado')], max_length=30)),
+                ('prioridade', models.CharField(blank=True, choices=[('VERMELHO', 'Emergência'), ('LARANJA', 'Muito Urgente'), ('AMARELO', 'Urgente'), ('VERDE', 'Pouco Urgente'), ('AZUL', 'Não Urgente')], max_length=10, null=True)),
+                ('prioridade_ordem', models.PositiveSmallIntegerField()),
+                ('local_atendimento', models.CharField(blank=True, max_length=50, null=True)),
+                ('pa_sistolica', models.IntegerField(blank=True, null=True, verbose_name='Pressão Sistólica')),
+                ('pa_diastolica', models.IntegerField(blank=True, null=True, verbose_name='Pressão Diastólica')),
+                ('temperatura', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True)),
+                ('frequencia_cardiaca', models.IntegerField(blank=True, null=True)),
+                ('observacoes_triagem', models.TextField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField()),
+                ('atualizado_em', models.DateTimeField()),
+                ('chamado_em', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('arquivada', models.BooleanField()),
+            ],
+            options={
+                'verbose_name': 'Histórico de Fichas',
+                'verbose_name_plural': 'Histórico de Fichas',
+                'db_table': 'attendance_fichahistorico',
+                'ordering': ['-criado_em'],
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(CRIAR_VIEW, "DROP VIEW attendance_fichahistorico"),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:17
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Índices CONCURRENTLY: as tabelas de fichas podem estar enormes
+    atomic = False
+
+    dependencies = [
+        ('attendance', '0007_arquivo_fichas'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='fichaarquivada',
+            index=models.Index(fields=['atualizado_em'], name='ficha_arquivada_atualizado_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(condition=models.Q(('status__in', ['FINALIZADO', 'CANCELADO'])), fields=['atualizado_em'], name='ficha_encerrada_atualizado_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:19
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0008_indices_metricas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FichaEvento',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('ficha_id', models.BigIntegerField()),
+                ('de', models.CharField(choices=[('CHEGADA', 'Aguardando Triagem'), ('CHAMADO_TRIAGEM', 'Chamado para Triagem'), ('EM_TRIAGEM', 'Em Triagem'), ('TRIADO', 'Aguardando Encaminhamento Médico'), ('AGUARDANDO_MEDICO', 'Aguardando Médico'), ('CHAMADO_MEDICO', 'Chamado para Médico'), ('EM_ATENDIMENTO', 'Em Atendimento Médico'), ('FINALIZADO', 'Finalizado'), ('CANCELADO', 'Cancelado')], max_length=30, null=True)),
+                ('para', models.CharField(choices=[('CHEGADA', 'Aguardando Triagem'), ('CHAMADO_TRIAGEM', 'Chamado para Triagem'), ('EM_TRIAGEM', 'Em Triagem'), ('TRIADO', 'Aguardando Encaminhamento Médico'), ('AGUARDANDO_MEDICO', 'Aguardando Médico'), ('CHAMADO_MEDICO', 'Chamado para Médico'), ('EM_ATENDIMENTO', 'Em Atendimento Médico'), ('FINALIZADO', 'Finalizado'), ('CANCELADO', 'Cancelado')], max_length=30)),
+                ('em', models.DateTimeField(default=django.utils.timezone.now)),
+                ('transacao', models.BigIntegerField(db_default=models.Func(function='pg_current_xact_id', template='%(function)s()::text::bigint'), editable=False)),
+                ('ator', models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Evento de Ficha',
+                'verbose_name_plural': 'Eventos de Fichas',
+                'indexes': [models.Index(fields=['transacao', 'id'], name='ficha_evento_cursor_idx'), models.Index(fields=['ficha_id'], name='ficha_evento_ficha_idx'), django.contrib.postgres.indexes.BrinIndex(fields=['em'], name='ficha_evento_em_brin')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0009_trilha_eventos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fichaatendimento',
+            name='status_anterior',
+            field=models.CharField(blank=True, choices=[('CHEGADA', 'Aguardando Triagem'), ('CHAMADO_TRIAGEM', 'Chamado para Triagem'), ('EM_TRIAGEM', 'Em Triagem'), ('TRIADO', 'Aguardando Encaminhamento Médico'), ('AGUARDANDO_MEDICO', 'Aguardando Médico'), ('CHAMADO_MEDICO', 'Chamado para Médico'), ('EM_ATENDIMENTO', 'Em Atendimento Médico'), ('FINALIZADO', 'Finalizado'), ('CANCELADO', 'Cancelado')], editable=False, max_length=30, null=True),
+        ),
+    ]
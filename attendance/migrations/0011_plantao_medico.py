@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0010_status_anterior'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlantaoMedico',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sala', models.CharField(max_length=50)),
+                ('inicio', models.DateTimeField(auto_now_add=True)),
+                ('medico', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='plantao', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Plantão Médico',
+                'verbose_name_plural': 'Plantões Médicos',
+            },
+        ),
+    ]
@@ -0,0 +1,96 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.migrations import UNIDADE_INICIAL
+
+# Colunas comuns às duas tabelas (0007 + unidade_id). Migrations que mexerem
+# nas colunas da ficha precisam recriar esta VIEW.
+COLUNAS_ANTIGAS = """
+    id, codigo, data_senha, paciente_id, status, prioridade, prioridade_ordem,
+    medico_atendente_id, local_atendimento, pa_sistolica, pa_diastolica, temperatura,
+    frequencia_cardiaca, observacoes_triagem, criado_em, atualizado_em, chamado_em, finalizado_em
+"""
+COLUNAS = f"unidade_id, {COLUNAS_ANTIGAS}"
+
+
+def _view(colunas):
+    return f"""
+    DROP VIEW attendance_fichahistorico;
+    CREATE VIEW attendance_fichahistorico AS
+        SELECT {colunas}, false AS arquivada FROM attendance_fichaatendimento
+        UNION ALL
+        SELECT {colunas}, true AS arquivada FROM attendance_fichaarquivada;
+    """
+
+
+def _unidade(related_name, **kwargs):
+    # Tudo o que já existe passa a ser da unidade inicial. O default constante
+    # não reescreve a tabela (PostgreSQL 11+) e é removido logo em seguida.
+    return models.ForeignKey(
+        default=UNIDADE_INICIAL, on_delete=django.db.models.deletion.PROTECT,
+        related_name=related_name, to='core.unidade', **kwargs,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0011_plantao_medico'),
+        ('core', '0001_unidade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fichaatendimento',
+            name='unidade',
+            field=_unidade('fichas', db_index=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='fichaarquivada',
+            name='unidade',
+            field=_unidade('fichas_arquivadas', db_index=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='fichahistorico',
+            name='unidade',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.unidade'),
+            preserve_default=False,
+        ),
+        migrations.RunSQL(_view(COLUNAS), _view(COLUNAS_ANTIGAS)),
+        migrations.AddField(
+            model_name='fichaevento',
+            name='unidade',
+            field=models.ForeignKey(
+                db_constraint=False, db_index=False, default=UNIDADE_INICIAL,
+                on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.unidade',
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='plantaomedico',
+            name='unidade',
+            field=models.ForeignKey(
+                default=UNIDADE_INICIAL, on_delete=django.db.models.deletion.CASCADE,
+                related_name='plantoes', to='core.unidade',
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='sequenciasenha',
+            name='unidade',
+            field=_unidade('+', db_index=False),
+            preserve_default=False,
+        ),
+        migrations.RemoveConstraint(
+            model_name='sequenciasenha',
+            name='sequencia_senha_unica_por_dia',
+        ),
+        migrations.AddConstraint(
+            model_name='sequenciasenha',
+            constraint=models.UniqueConstraint(fields=('unidade', 'data', 'prefixo'), name='sequencia_senha_unica_por_unidade'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:41
+
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+FILAS = ['CHEGADA', 'CHAMADO_TRIAGEM', 'EM_TRIAGEM', 'TRIADO', 'AGUARDANDO_MEDICO', 'CHAMADO_MEDICO', 'EM_ATENDIMENTO']
+
+# Unique da senha por unidade: índice CONCURRENTLY e depois a constraint em cima
+# dele (ADD CONSTRAINT ... USING INDEX só trava a tabela por um instante)
+# (um comando por item: CONCURRENTLY não roda dentro de um bloco de vários comandos)
+SENHA_POR_UNIDADE = [
+    "CREATE UNIQUE INDEX CONCURRENTLY ficha_codigo_unico_por_unidade"
+    " ON attendance_fichaatendimento (unidade_id, data_senha, codigo)",
+    "ALTER TABLE attendance_fichaatendimento"
+    " ADD CONSTRAINT ficha_codigo_unico_por_unidade UNIQUE USING INDEX ficha_codigo_unico_por_unidade",
+    "ALTER TABLE attendance_fichaatendimento DROP CONSTRAINT ficha_codigo_unico_por_dia",
+]
+SENHA_POR_DIA = [
+    "CREATE UNIQUE INDEX CONCURRENTLY ficha_codigo_unico_por_dia"
+    " ON attendance_fichaatendimento (data_senha, codigo)",
+    "ALTER TABLE attendance_fichaatendimento"
+    " ADD CONSTRAINT ficha_codigo_unico_por_dia UNIQUE USING INDEX ficha_codigo_unico_por_dia",
+    "ALTER TABLE attendance_fichaatendimento DROP CONSTRAINT ficha_codigo_unico_por_unidade",
+]
+
+
+class Migration(migrations.Migration):
+    # Índices CONCURRENTLY: as tabelas de fichas podem estar enormes. Os novos
+    # são criados antes de remover os antigos (as filas nunca ficam sem índice).
+    atomic = False
+
+    dependencies = [
+        ('attendance', '0012_unidade'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(condition=models.Q(('status__in', FILAS)), fields=['unidade', 'status', 'criado_em'], name='ficha_unidade_ativa_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(condition=models.Q(('status__in', ['CHAMADO_TRIAGEM', 'EM_TRIAGEM', 'CHAMADO_MEDICO'])), fields=['unidade', 'status', 'chamado_em'], name='ficha_unidade_chamado_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(condition=models.Q(('status__in', ['CHAMADO_TRIAGEM', 'EM_TRIAGEM'])), fields=['unidade', 'status', 'atualizado_em'], name='ficha_unidade_atualizado_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(condition=models.Q(('status__in', ['TRIADO', 'AGUARDANDO_MEDICO'])), fields=['unidade', 'status', 'prioridade_ordem', 'criado_em'], name='ficha_unidade_fila_medica_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='fichaarquivada',
+            index=models.Index(fields=['unidade', 'data_senha', 'codigo'], name='ficha_arq_unidade_codigo_idx'),
+        ),
+        RemoveIndexConcurrently(model_name='fichaatendimento', name='ficha_ativa_criado_idx'),
+        RemoveIndexConcurrently(model_name='fichaatendimento', name='ficha_chamada_chamado_idx'),
+        RemoveIndexConcurrently(model_name='fichaatendimento', name='ficha_chamada_atualizado_idx'),
+        RemoveIndexConcurrently(model_name='fichaatendimento', name='ficha_fila_medica_idx'),
+        RemoveIndexConcurrently(model_name='fichaarquivada', name='ficha_arquivada_codigo_idx'),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunSQL(SENHA_POR_UNIDADE, SENHA_POR_DIA)],
+            state_operations=[
+                migrations.RemoveConstraint(model_name='fichaatendimento', name='ficha_codigo_unico_por_dia'),
+                migrations.AddConstraint(
+                    model_name='fichaatendimento',
+                    constraint=models.UniqueConstraint(fields=('unidade', 'data_senha', 'codigo'), name='ficha_codigo_unico_por_unidade'),
+                ),
+            ],
+        ),
+    ]
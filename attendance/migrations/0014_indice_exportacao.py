@@ -0,0 +1,20 @@
+# Generated by Django 6.0.2 on 2026-10-18 16:20
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Índices CONCURRENTLY: as tabelas de fichas podem estar enormes
+    atomic = False
+
+    dependencies = [
+        ('attendance', '0013_indices_unidade'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='fichaarquivada',
+            index=models.Index(fields=['unidade', 'criado_em'], name='ficha_arq_unidade_criado_idx'),
+        ),
+    ]
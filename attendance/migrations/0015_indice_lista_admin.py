@@ -0,0 +1,20 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Índices CONCURRENTLY: as tabelas de fichas podem estar enormes
+    atomic = False
+
+    dependencies = [
+        ('attendance', '0014_indice_exportacao'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='fichaatendimento',
+            index=models.Index(fields=['criado_em', 'id'], name='ficha_criado_id_idx'),
+        ),
+    ]
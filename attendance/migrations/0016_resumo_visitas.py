@@ -0,0 +1,43 @@
+# Generated by Django 6.0.2 on 2026-10-18 16:09
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Índices CONCURRENTLY: as tabelas de fichas podem estar enormes
+    atomic = False
+
+    dependencies = [
+        ('attendance', '0015_indice_lista_admin'),
+        ('core', '0001_unidade'),
+        ('patients', '0003_indice_lista_admin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoVisitas',
+            fields=[
+                ('paciente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumo_visitas', serialize=False, to='patients.patient')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('ultima_prioridade', models.CharField(blank=True, choices=[('VERMELHO', 'Emergência'), ('LARANJA', 'Muito Urgente'), ('AMARELO', 'Urgente'), ('VERDE', 'Pouco Urgente'), ('AZUL', 'Não Urgente')], max_length=10, null=True)),
+                ('ultima_ficha_id', models.BigIntegerField(blank=True, null=True)),
+                ('pa_sistolica', models.IntegerField(blank=True, null=True, verbose_name='Pressão Sistólica')),
+                ('pa_diastolica', models.IntegerField(blank=True, null=True, verbose_name='Pressão Diastólica')),
+                ('temperatura', models.DecimalField(blank=True, decimal_places=1, max_digits=4, null=True)),
+                ('frequencia_cardiaca', models.IntegerField(blank=True, null=True)),
+                ('sinais_em', models.DateTimeField(blank=True, null=True)),
+                ('ultimas', models.JSONField(default=list)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resumo de Visitas',
+                'verbose_name_plural': 'Resumos de Visitas',
+            },
+        ),
+        AddIndexConcurrently(
+            model_name='fichaarquivada',
+            index=models.Index(fields=['paciente', 'criado_em', 'id'], name='ficha_arq_paciente_criado_idx'),
+        ),
+    ]
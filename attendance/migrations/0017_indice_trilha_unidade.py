@@ -0,0 +1,20 @@
+# Generated by Django 6.0.2 on 2026-10-18 19:40
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Índice CONCURRENTLY: a trilha de eventos só cresce
+    atomic = False
+
+    dependencies = [
+        ('attendance', '0016_resumo_visitas'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='fichaevento',
+            index=models.Index(fields=['unidade', 'transacao', 'id'], name='ficha_evento_unidade_cur_idx'),
+        ),
+    ]
@@ -1,7 +1,68 @@
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 from django.conf import settings # Importante para vincular ao médico (User)
+from django.utils import timezone
 from patients.models import Patient
 
+
+class FilaQuerySet(models.QuerySet):
+    """
+    Consultas das filas (triagem, lançamento, TVs, consultório).
+    Já trazem paciente e médico no mesmo SELECT e só as colunas que as telas
+    e o resumo() usam: nada de uma consulta extra por linha no template.
+    """
+
+    CAMPOS = (
+        "id", "unidade", "codigo", "status", "prioridade", "prioridade_ordem", "local_atendimento",
+        "pa_sistolica", "pa_diastolica", "temperatura", "frequencia_cardiaca",
+        "criado_em", "chamado_em", "atualizado_em",
+        "paciente", "paciente__nome",
+        "medico_atendente", "medico_atendente__first_name",
+        "medico_atendente__last_name", "medico_atendente__username",
+    )
+
+    def da_unidade(self, unidade_id):
+        # Toda fila é de uma unidade: os índices das filas começam por unidade_id
+        return self.filter(unidade_id=unidade_id)
+
+    def enxuta(self):
+        return self.select_related("paciente", "medico_atendente").only(*self.CAMPOS)
+
+    def ativas(self):
+        # status__in (e não exclude) para casar com o índice parcial ficha_unidade_ativa_idx
+        Status = self.model.Status
+        fora = (Status.FINALIZADO, Status.CANCELADO)
+        return self.enxuta().filter(status__in=[s for s in Status if s not in fora])
+
+    def por_chegada(self, *status):
+        return self.enxuta().filter(status__in=status).order_by("criado_em")
+
+    def por_prioridade(self, *status):
+        # Manchester primeiro, depois ordem de chegada (índice ficha_unidade_fila_medica_idx)
+        return self.enxuta().filter(status__in=status).order_by("prioridade_ordem", "criado_em")
+
+    def chamados(self, *status):
+        # Quem foi chamado por último aparece primeiro
+        return self.enxuta().filter(status__in=status).order_by("-atualizado_em")
+
+    def triagem(self):
+        return self.por_chegada(self.model.Status.CHEGADA)
+
+    def em_triagem(self):
+        Status = self.model.Status
+        return self.chamados(Status.CHAMADO_TRIAGEM, Status.EM_TRIAGEM)
+
+    def triados(self):
+        return self.por_prioridade(self.model.Status.TRIADO)
+
+    def do_medico(self, medico_id):
+        """Fila do consultório: aguardando, chamado e em atendimento com esse médico."""
+        Status = self.model.Status
+        return self.por_prioridade(
+            Status.AGUARDANDO_MEDICO, Status.CHAMADO_MEDICO, Status.EM_ATENDIMENTO,
+        ).filter(medico_atendente_id=medico_id)
+
+
 class FichaAtendimento(models.Model):
     class Status(models.TextChoices):
         # FLUXO TV 01 (Recepção/Triagem)
@@ -27,10 +88,29 @@ class FichaAtendimento(models.Model):
         VERDE = "VERDE", "Pouco Urgente"
         AZUL = "AZUL", "Não Urgente"
 
-    codigo = models.CharField(max_length=10, unique=True)
+    # Gravidade Manchester como número (1 = mais grave). Ordenar pelo texto de
+    # 'prioridade' dava VERMELHO, VERDE, LARANJA... e não usava índice.
+    ORDEM_PRIORIDADE = {
+        Prioridade.VERMELHO: 1,
+        Prioridade.LARANJA: 2,
+        Prioridade.AMARELO: 3,
+        Prioridade.VERDE: 4,
+        Prioridade.AZUL: 5,
+    }
+    SEM_PRIORIDADE = 9  # ainda não triado: fica depois de todos
+
+    # A senha (A001, A002...) recomeça todo dia: é única só dentro de data_senha
+    codigo = models.CharField(max_length=10, db_index=True)
+    # Sem índice próprio: os índices das filas (Meta) já começam por unidade
+    unidade = models.ForeignKey("core.Unidade", on_delete=models.PROTECT, related_name="fichas", db_index=False)
+    data_senha = models.DateField(default=timezone.localdate, editable=False)
     paciente = models.ForeignKey(Patient, on_delete=models.PROTECT, related_name="fichas")
     status = models.CharField(max_length=30, choices=Status.choices, default=Status.CHEGADA)
+    # Preenchido pelo próprio UPDATE da transição (transicoes.py): é assim que o
+    # RETURNING devolve o status de antes sem travar a linha para lê-lo
+    status_anterior = models.CharField(max_length=30, choices=Status.choices, null=True, blank=True, editable=False)
     prioridade = models.CharField(max_length=10, choices=Prioridade.choices, null=True, blank=True)
+    prioridade_ordem = models.PositiveSmallIntegerField(default=SEM_PRIORIDADE, editable=False)
     
     # Campo para o 'Segundo PC' definir o médico destino
     medico_atendente = models.ForeignKey(
@@ -56,10 +136,287 @@ class FichaAtendimento(models.Model):
     chamado_em = models.DateTimeField(null=True, blank=True)
     finalizado_em = models.DateTimeField(null=True, blank=True)
 
+    objects = models.Manager()
+    fila = FilaQuerySet.as_manager()  # FichaAtendimento.fila.triagem(), .triados()...
+
     class Meta:
         verbose_name = "Ficha de Atendimento"
         verbose_name_plural = "Fichas de Atendimento"
-        ordering = ['-prioridade', 'criado_em'] # Prioridade Manchester nativa no banco
+        ordering = ['prioridade_ordem', 'criado_em'] # Prioridade Manchester nativa no banco
+        constraints = [
+            # Cada unidade tem sua própria sequência de senhas (A001 em todas)
+            models.UniqueConstraint(fields=['unidade', 'data_senha', 'codigo'], name='ficha_codigo_unico_por_unidade'),
+        ]
+        # Índices parciais: só as fichas ativas (poucas centenas) entram neles, então
+        # as filas continuam rápidas com meses de FINALIZADO/CANCELADO na tabela.
+        # Os das filas começam pela unidade: cada unidade lê só o seu pedaço do
+        # índice, por mais unidades que o servidor atenda.
+        # (Meta não enxerga a classe Status, por isso os status vão como texto.)
+        indexes = [
+            # CHEGADA/TRIADO... por ordem de chegada (triagem, próximas senhas)
+            models.Index(
+                fields=['unidade', 'status', 'criado_em'], name='ficha_unidade_ativa_idx',
+                condition=models.Q(status__in=[
+                    'CHEGADA', 'CHAMADO_TRIAGEM', 'EM_TRIAGEM', 'TRIADO',
+                    'AGUARDANDO_MEDICO', 'CHAMADO_MEDICO', 'EM_ATENDIMENTO',
+                ]),
+            ),
+            # Último chamado de cada TV (triagem e consultório)
+            models.Index(
+                fields=['unidade', 'status', 'chamado_em'], name='ficha_unidade_chamado_idx',
+                condition=models.Q(status__in=['CHAMADO_TRIAGEM', 'EM_TRIAGEM', 'CHAMADO_MEDICO']),
+            ),
+            # Painel da recepção: chamado/azul recentes por atualizado_em
+            models.Index(
+                fields=['unidade', 'status', 'atualizado_em'], name='ficha_unidade_atualizado_idx',
+                condition=models.Q(status__in=['CHAMADO_TRIAGEM', 'EM_TRIAGEM']),
+            ),
+            # Fila do lançamento/TV 02/médico: "próximo paciente" é a primeira entrada
+            models.Index(
+                fields=['unidade', 'status', 'prioridade_ordem', 'criado_em'], name='ficha_unidade_fila_medica_idx',
+                condition=models.Q(status__in=['TRIADO', 'AGUARDANDO_MEDICO']),
+            ),
+            # Fichas encerradas à espera do arquivamento (comando arquivar_fichas)
+            models.Index(
+                fields=['criado_em'], name='ficha_encerrada_criado_idx',
+                condition=models.Q(status__in=['FINALIZADO', 'CANCELADO']),
+            ),
+            # Encerradas desde a última atualização das métricas (reports)
+            models.Index(
+                fields=['atualizado_em'], name='ficha_encerrada_atualizado_idx',
+                condition=models.Q(status__in=['FINALIZADO', 'CANCELADO']),
+            ),
+            # Lista do admin: páginas por cursor em (criado_em, id) (core/listas.py)
+            models.Index(fields=['criado_em', 'id'], name='ficha_criado_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.codigo} - {self.paciente.nome}"
+
+    @classmethod
+    def ordem_da_prioridade(cls, prioridade) -> int:
+        return cls.ORDEM_PRIORIDADE.get(prioridade, cls.SEM_PRIORIDADE)
+
+    def save(self, *args, **kwargs):
+        self.prioridade_ordem = self.ordem_da_prioridade(self.prioridade)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "prioridade" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "prioridade_ordem"}
+        super().save(*args, **kwargs)
+
+    def resumo(self) -> dict:
+        """Versão compacta da ficha usada pelos painéis (eventos, snapshots, cache das filas)."""
+        medico = self.medico_atendente
+        return {
+            "id": self.id,
+            "unidade_id": self.unidade_id,
+            "codigo": self.codigo,
+            "status": self.status,
+            "paciente": {"nome": self.paciente.nome},
+            "prioridade": self.prioridade,
+            "prioridade_display": self.get_prioridade_display(),
+            "local": self.local_atendimento,
+            "medico_id": self.medico_atendente_id,
+            "medico": (medico.get_full_name() or medico.username) if medico else None,
+            "pa_sistolica": self.pa_sistolica,
+            "pa_diastolica": self.pa_diastolica,
+            "temperatura": str(self.temperatura) if self.temperatura is not None else None,
+            "frequencia_cardiaca": self.frequencia_cardiaca,
+            "criado_em": self.criado_em.isoformat() if self.criado_em else None,
+            "chamado_em": self.chamado_em.isoformat() if self.chamado_em else None,
+            "atualizado_em": self.atualizado_em.isoformat() if self.atualizado_em else None,
+        }
+
+class SequenciaSenha(models.Model):
+    """
+    Contador das senhas do dia: uma linha por (unidade, data, prefixo).
+    Incrementado com um único UPDATE atômico (ver services._proximo_codigo).
+    Cada unidade trava só a sua linha: recepções de unidades diferentes
+    nunca esperam uma pela outra.
+    """
+    unidade = models.ForeignKey("core.Unidade", on_delete=models.PROTECT, related_name="+", db_index=False)
+    data = models.DateField()
+    prefixo = models.CharField(max_length=3)
+    ultimo_numero = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Sequência de Senhas"
+        verbose_name_plural = "Sequências de Senhas"
+        constraints = [
+            models.UniqueConstraint(fields=['unidade', 'data', 'prefixo'], name='sequencia_senha_unica_por_unidade'),
+        ]
+
+    def __str__(self):
+        return f"{self.data:%d/%m/%Y} {self.prefixo} ({self.ultimo_numero}) - unidade {self.unidade_id}"
+
+
+# --- HISTÓRICO (fichas encerradas) ---------------------------------------
+# A tabela viva (FichaAtendimento) guarda só o movimento dos últimos dias.
+# FINALIZADO/CANCELADO mais antigos que settings.ARQUIVO_FICHAS_DIAS vão para
+# FichaArquivada (comando arquivar_fichas). Para consultar tudo junto
+# (admin, relatórios) use FichaHistorico, uma VIEW com as duas tabelas.
+
+class DadosFicha(models.Model):
+    """Colunas copiadas da ficha viva para o arquivo (mesmos nomes, mesmo id)."""
+    id = models.BigIntegerField(primary_key=True)
+    codigo = models.CharField(max_length=10)
+    data_senha = models.DateField()
+    status = models.CharField(max_length=30, choices=FichaAtendimento.Status.choices)
+    prioridade = models.CharField(max_length=10, choices=FichaAtendimento.Prioridade.choices, null=True, blank=True)
+    prioridade_ordem = models.PositiveSmallIntegerField()
+    local_atendimento = models.CharField(max_length=50, null=True, blank=True)
+
+    pa_sistolica = models.IntegerField("Pressão Sistólica", null=True, blank=True)
+    pa_diastolica = models.IntegerField("Pressão Diastólica", null=True, blank=True)
+    temperatura = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True)
+    frequencia_cardiaca = models.IntegerField(null=True, blank=True)
+    observacoes_triagem = models.TextField(null=True, blank=True)
+
+    # Sem auto_now: no arquivo as datas são as originais
+    criado_em = models.DateTimeField()
+    atualizado_em = models.DateTimeField()
+    chamado_em = models.DateTimeField(null=True, blank=True)
+    finalizado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"{self.codigo} - {self.paciente.nome}"
+
+
+class FichaArquivada(DadosFicha):
+    unidade = models.ForeignKey("core.Unidade", on_delete=models.PROTECT, related_name="fichas_arquivadas", db_index=False)
+    paciente = models.ForeignKey(Patient, on_delete=models.PROTECT, related_name="fichas_arquivadas")
+    medico_atendente = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="atendimentos_arquivados",
+    )
+
+    class Meta:
+        verbose_name = "Ficha Arquivada"
+        verbose_name_plural = "Fichas Arquivadas"
+        indexes = [
+            models.Index(fields=['criado_em'], name='ficha_arquivada_criado_idx'),
+            # Exportação do histórico de uma unidade por período (reports/exportacao.py)
+            models.Index(fields=['unidade', 'criado_em'], name='ficha_arq_unidade_criado_idx'),
+            models.Index(fields=['unidade', 'data_senha', 'codigo'], name='ficha_arq_unidade_codigo_idx'),
+            # Histórico de visitas do paciente, por cursor (attendance/visitas.py)
+            models.Index(fields=['paciente', 'criado_em', 'id'], name='ficha_arq_paciente_criado_idx'),
+            models.Index(fields=['atualizado_em'], name='ficha_arquivada_atualizado_idx'),
+        ]
+
+
+class FichaHistorico(DadosFicha):
+    """Somente leitura: VIEW attendance_fichahistorico = fichas vivas UNION ALL arquivadas."""
+    unidade = models.ForeignKey("core.Unidade", on_delete=models.DO_NOTHING, related_name="+")
+    paciente = models.ForeignKey(Patient, on_delete=models.DO_NOTHING, related_name="+")
+    medico_atendente = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, null=True, blank=True, related_name="+",
+    )
+    arquivada = models.BooleanField()
+
+    class Meta:
+        managed = False
+        db_table = "attendance_fichahistorico"
+        verbose_name = "Histórico de Fichas"
+        verbose_name_plural = "Histórico de Fichas"
+        ordering = ['-criado_em']
+
+
+# --- RESUMO DE VISITAS ---------------------------------------------------
+# O que a triagem mostra das visitas anteriores, mantido pelas services
+# (attendance/visitas.py): uma linha por paciente, lida pela chave primária.
+
+class ResumoVisitas(models.Model):
+    paciente = models.OneToOneField(Patient, on_delete=models.CASCADE, primary_key=True, related_name="resumo_visitas")
+    total = models.PositiveIntegerField(default=0)
+    ultima_prioridade = models.CharField(
+        max_length=10, choices=FichaAtendimento.Prioridade.choices, null=True, blank=True,
+    )
+    # Ficha de onde vieram a prioridade e os sinais abaixo
+    ultima_ficha_id = models.BigIntegerField(null=True, blank=True)
+    pa_sistolica = models.IntegerField("Pressão Sistólica", null=True, blank=True)
+    pa_diastolica = models.IntegerField("Pressão Diastólica", null=True, blank=True)
+    temperatura = models.DecimalField(max_digits=4, decimal_places=1, null=True, blank=True)
+    frequencia_cardiaca = models.IntegerField(null=True, blank=True)
+    sinais_em = models.DateTimeField(null=True, blank=True)
+    # Últimas visitas, da mais nova para a mais antiga (visitas._visita)
+    ultimas = models.JSONField(default=list)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Resumo de Visitas"
+        verbose_name_plural = "Resumos de Visitas"
+
+    def __str__(self):
+        return f"Paciente {self.paciente_id}: {self.total} visita(s)"
+
+
+# --- TRILHA DE EVENTOS ----------------------------------------------------
+# Uma linha por transição, gravada na mesma transação da mudança de status
+# (services.py). Nunca é alterada: é daqui que saem os tempos exatos de cada
+# etapa (chamado_em da ficha é sobrescrito a cada chamada).
+
+class FichaEvento(models.Model):
+    """
+    Transição de status de uma ficha (somente inserção; ver attendance/trilha.py).
+
+    Linha estreita e sem chave estrangeira para a ficha: o arquivamento apaga
+    a ficha viva e o evento continua valendo para a FichaArquivada (mesmo id).
+    """
+    id = models.BigAutoField(primary_key=True)
+    ficha_id = models.BigIntegerField()
+    unidade = models.ForeignKey(
+        "core.Unidade", on_delete=models.DO_NOTHING, db_constraint=False, db_index=False, related_name="+",
+    )
+    de = models.CharField(max_length=30, choices=FichaAtendimento.Status.choices, null=True)  # None = criação
+    para = models.CharField(max_length=30, choices=FichaAtendimento.Status.choices)
+    ator = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+        null=True, blank=True, related_name="+",
+    )
+    em = models.DateTimeField(default=timezone.now)
+    # Transação (xid) que gravou o evento: base do cursor de leitura (trilha.py)
+    transacao = models.BigIntegerField(
+        db_default=models.Func(function="pg_current_xact_id", template="%(function)s()::text::bigint"),
+        editable=False,
+    )
+
+    class Meta:
+        verbose_name = "Evento de Ficha"
+        verbose_name_plural = "Eventos de Fichas"
+        indexes = [
+            # Leitura pelo cursor (transacao, id)
+            models.Index(fields=['transacao', 'id'], name='ficha_evento_cursor_idx'),
+            # Long-poll das TVs: só a trilha da unidade, a partir do cursor
+            models.Index(fields=['unidade', 'transacao', 'id'], name='ficha_evento_unidade_cur_idx'),
+            # Linha do tempo de uma ficha
+            models.Index(fields=['ficha_id'], name='ficha_evento_ficha_idx'),
+            # Relatórios por período: a tabela só cresce em ordem de tempo, BRIN fica minúsculo
+            BrinIndex(fields=['em'], name='ficha_evento_em_brin'),
+        ]
+
+    def __str__(self):
+        return f"Ficha {self.ficha_id}: {self.de or '-'} -> {self.para}"
+
+
+# --- PLANTÃO --------------------------------------------------------------
+# Quem está atendendo agora. Só médicos de plantão recebem fichas do
+# despacho automático (attendance/despacho.py).
+
+class PlantaoMedico(models.Model):
+    medico = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="plantao")
+    unidade = models.ForeignKey("core.Unidade", on_delete=models.CASCADE, related_name="plantoes")
+    sala = models.CharField(max_length=50)  # vai para o local_atendimento das fichas encaminhadas
+    inicio = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Plantão Médico"
+        verbose_name_plural = "Plantões Médicos"
 
     def __str__(self):
-        return f"{self.codigo} - {self.paciente.nome}"
\ No newline at end of file
+        return f"{self.medico} ({self.sala})"
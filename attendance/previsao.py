@@ -0,0 +1,210 @@
+"""
+Previsão de espera das fichas na fila (TVs e senha da recepção).
+
+Para cada etapa (chamada para a triagem, chamada para o consultório) guarda o
+ritmo de chamadas: média móvel exponencial do intervalo entre uma chamada e
+a seguinte. Esse intervalo já embute quantas enfermeiras/médicos estão
+atendendo e quanto dura cada atendimento, então a previsão de quem tem N
+fichas na frente é só (N + 1) x intervalo da etapa: O(1) por ficha, sem
+consultar o histórico.
+
+O ritmo é atualizado a cada chamada (signal ficha_transicionada) e fica num
+item do cache do Django por unidade (cada uma tem sua equipe e seu ritmo). Cache frio (Redis reiniciado, deploy novo):
+reaprende com as chamadas das últimas horas da trilha de eventos (uma
+consulta). Intervalos maiores que PAUSA_MAXIMA (madrugada, troca de
+plantão) não entram na média.
+
+Na etapa do consultório quem está "na frente" segue a ordem Manchester:
+triados e encaminhados (TRIADO + AGUARDANDO_MEDICO) com prioridade maior ou
+iguais e chegados antes. Lá o ritmo também é guardado por gravidade: além
+da média geral, uma média do intervalo entre chamadas de cada cor. Quem
+é mais grave sai no ritmo geral; os da mesma cor saem no ritmo da cor,
+que já embute o tempo gasto com os vermelhos e laranjas que chegam depois
+e passam na frente (no ritmo geral um verde parecia sair logo). Cor ainda
+sem observações usa o ritmo geral.
+
+Duas chamadas ao mesmo tempo em workers diferentes podem perder uma das
+observações (ler-e-gravar no cache). Para uma média móvel tanto faz.
+"""
+import logging
+import math
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import fila_cache
+from .models import FichaAtendimento, FichaEvento, FichaHistorico
+from .signals import ficha_transicionada
+
+logger = logging.getLogger(__name__)
+
+Status = FichaAtendimento.Status
+
+ALFA = 0.2
+PAUSA_MAXIMA = timedelta(minutes=30)
+JANELA_APRENDIZADO = timedelta(hours=6)
+# Minutos entre chamadas enquanto não há observações
+INTERVALO_PADRAO = {"triagem": 5.0, "medico": 15.0}
+
+
+def _chave(unidade_id):
+    return f"previsao:{unidade_id}:etapas"
+
+# Fila(s) de espera de cada etapa
+FILAS_DA_ETAPA = {
+    "triagem": (Status.CHEGADA,),
+    "medico": (Status.TRIADO, Status.AGUARDANDO_MEDICO),
+}
+
+
+def etapa_da_chamada(de, para):
+    """Qual etapa uma transição "chama" (ou None)."""
+    if para == Status.CHAMADO_TRIAGEM and de == Status.CHEGADA:
+        return "triagem"
+    if para == Status.CHAMADO_MEDICO and de in (Status.TRIADO, Status.AGUARDANDO_MEDICO):
+        return "medico"
+    return None
+
+
+def _chave_prioridade(etapa, ordem):
+    return f"{etapa}:{ordem}"
+
+
+def _observar(estado: dict, etapa: str, instante: float) -> None:
+    atual = estado.setdefault(etapa, {"intervalo": None, "ultima": None})
+    if atual["ultima"] is not None:
+        intervalo = instante - atual["ultima"]
+        if 0 <= intervalo <= PAUSA_MAXIMA.total_seconds():
+            anterior = atual["intervalo"]
+            atual["intervalo"] = intervalo if anterior is None else ALFA * intervalo + (1 - ALFA) * anterior
+    atual["ultima"] = max(instante, atual["ultima"] or instante)
+
+
+def _observar_chamada(estado: dict, etapa: str, instante: float, ordem=None) -> None:
+    _observar(estado, etapa, instante)
+    if etapa == "medico" and ordem is not None:
+        _observar(estado, _chave_prioridade(etapa, ordem), instante)
+
+
+def _aprender_da_trilha(unidade_id, agora) -> dict:
+    """Estado reconstruído com as chamadas recentes da trilha de eventos da unidade."""
+    estado = {}
+    eventos = (
+        FichaEvento.objects
+        .filter(
+            unidade_id=unidade_id, em__gte=agora - JANELA_APRENDIZADO,
+            para__in=[Status.CHAMADO_TRIAGEM, Status.CHAMADO_MEDICO],
+        )
+        # A gravidade vem da ficha (viva ou arquivada), na mesma consulta
+        .annotate(ordem=Subquery(FichaHistorico.objects.filter(id=OuterRef("ficha_id")).values("prioridade_ordem")[:1]))
+        .order_by("em")
+        .values_list("de", "para", "em", "ordem")
+    )
+    for de, para, em, ordem in eventos.iterator():
+        etapa = etapa_da_chamada(de, para)
+        if etapa:
+            _observar_chamada(estado, etapa, em.timestamp(), ordem)
+    return estado
+
+
+def _estado(unidade_id) -> dict:
+    estado = cache.get(_chave(unidade_id))
+    if estado is None:
+        estado = _aprender_da_trilha(unidade_id, timezone.now())
+        cache.set(_chave(unidade_id), estado, timeout=None)
+    return estado
+
+
+def _minutos(estado, chave, padrao) -> float:
+    intervalo = estado.get(chave, {}).get("intervalo")
+    return padrao if intervalo is None else round(intervalo / 60, 1)
+
+
+def intervalos(unidade_id) -> dict:
+    """{etapa: minutos entre chamadas} da unidade (padrão enquanto a etapa não tem observações)."""
+    estado = _estado(unidade_id)
+    return {etapa: _minutos(estado, etapa, padrao) for etapa, padrao in INTERVALO_PADRAO.items()}
+
+
+def intervalo_da_prioridade(estado, etapa, ordem) -> float:
+    """Minutos entre chamadas de fichas da gravidade `ordem` (o ritmo geral enquanto ela não tem observações)."""
+    return _minutos(estado, _chave_prioridade(etapa, ordem), _minutos(estado, etapa, INTERVALO_PADRAO[etapa]))
+
+
+def espera_minutos(na_frente: int, intervalo: float) -> int:
+    return math.ceil((na_frente + 1) * intervalo)
+
+
+def espera_consultorio(mais_graves: int, mesma_cor: int, geral: float, da_cor: float) -> int:
+    """Os mais graves na frente saem no ritmo geral; os da mesma cor (e a própria ficha), no da cor."""
+    return math.ceil(mais_graves * geral + (mesma_cor + 1) * da_cor)
+
+
+def _na_frente(unidade_id, score, *filas) -> int:
+    return sum(fila_cache.contar(unidade_id, f, score) for f in filas)
+
+
+def _mais_graves(unidade_id, ordem, *filas) -> int:
+    # Score da cor mais grave é sempre menor que ordem x 1e10 (ver fila_cache.score_prioridade)
+    return _na_frente(unidade_id, ordem * 1e10, *filas)
+
+
+def com_previsao(unidade_id, etapa: str, resumos: list, minutos=None) -> list:
+    """
+    Os resumos (na ordem da fila da etapa, começando do primeiro) com
+    "espera_min" preenchido. Na triagem a posição é o índice na lista.
+    """
+    if etapa == "triagem":
+        intervalo = (minutos or intervalos(unidade_id))[etapa]
+        return [{**r, "espera_min": espera_minutos(i, intervalo)} for i, r in enumerate(resumos)]
+
+    # Consultório: os triados da lista + os já encaminhados que passam na frente
+    estado = _estado(unidade_id)
+    geral = _minutos(estado, etapa, INTERVALO_PADRAO[etapa])
+    outras = [f for f in FILAS_DA_ETAPA[etapa] if f != Status.TRIADO]
+    ordens = [FichaAtendimento.ordem_da_prioridade(r["prioridade"]) for r in resumos]
+    previstos = []
+    for i, r in enumerate(resumos):
+        ordem = ordens[i]
+        score = fila_cache.score_prioridade(ordem, datetime.fromisoformat(r["criado_em"]))
+        # A lista vem na ordem da fila: os mais graves dela são os primeiros
+        mais_graves = sum(1 for o in ordens[:i] if o < ordem) + _mais_graves(unidade_id, ordem, *outras)
+        na_frente = i + _na_frente(unidade_id, score, *outras)
+        espera = espera_consultorio(mais_graves, na_frente - mais_graves, geral, intervalo_da_prioridade(estado, etapa, ordem))
+        previstos.append({**r, "espera_min": espera})
+    return previstos
+
+
+def prever_ficha(ficha):
+    """Minutos até a próxima chamada da ficha (None se ela não está esperando chamada)."""
+    if ficha.status == Status.CHEGADA:
+        etapa, score = "triagem", ficha.criado_em.timestamp()
+    elif ficha.status in FILAS_DA_ETAPA["medico"]:
+        etapa, score = "medico", fila_cache.score_prioridade(ficha.prioridade_ordem, ficha.criado_em)
+    else:
+        return None
+    na_frente = _na_frente(ficha.unidade_id, score, *FILAS_DA_ETAPA[etapa])
+    if etapa == "triagem":
+        return espera_minutos(na_frente, intervalos(ficha.unidade_id)[etapa])
+    estado = _estado(ficha.unidade_id)
+    mais_graves = _mais_graves(ficha.unidade_id, ficha.prioridade_ordem, *FILAS_DA_ETAPA[etapa])
+    return espera_consultorio(
+        mais_graves, na_frente - mais_graves,
+        _minutos(estado, etapa, INTERVALO_PADRAO[etapa]), intervalo_da_prioridade(estado, etapa, ficha.prioridade_ordem),
+    )
+
+
+@receiver(ficha_transicionada)
+def aprender_ritmo(sender, ficha, anterior, **kwargs):
+    etapa = etapa_da_chamada(anterior, ficha.status)
+    if etapa is None:
+        return
+    try:
+        estado = _estado(ficha.unidade_id)
+        _observar_chamada(estado, etapa, ficha.atualizado_em.timestamp(), ficha.prioridade_ordem)
+        cache.set(_chave(ficha.unidade_id), estado, timeout=None)
+    except Exception:
+        logger.exception("Falha ao atualizar a previsão de espera (ficha %s)", ficha.id)
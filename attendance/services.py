@@ -1,8 +1,11 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from django.db import transaction, models
+from django.db import connection, transaction, models
 from django.utils import timezone
-from .models import FichaAtendimento
+from . import trilha, visitas
+from .models import FichaAtendimento, SequenciaSenha
+from .signals import ficha_transicionada
+from .transicoes import TRANSICOES, transicionar
 from patients.models import Patient
 
 @dataclass(frozen=True)
@@ -10,47 +13,57 @@ class CriarFichaResult:
     ficha: FichaAtendimento
     paciente_criado: bool
 
+def _registrar_transicao(ficha: FichaAtendimento, anterior: str | None, ator=None) -> None:
+    """
+    Grava o evento na trilha (mesma transação da mudança) e avisa
+    painéis/ouvintes só depois do commit (nunca mostra algo que sofreu rollback).
+    """
+    trilha.registrar(ficha, anterior, ator)
+    transaction.on_commit(
+        lambda: ficha_transicionada.send(sender=FichaAtendimento, ficha=ficha, anterior=anterior),
+        robust=True,
+    )
+
 # --- GERAÇÃO DE CÓDIGO ---
-def _proximo_codigo() -> str:
-    from django.utils import timezone
-    hoje = timezone.now().date()
-    prefixo = "A"
-    
-    # 1. Tenta pegar a última ficha de hoje
-    ultima_hoje = FichaAtendimento.objects.filter(
-        criado_em__date=hoje
-    ).order_by('-id').first()
-
-    if ultima_hoje:
-        try:
-            numero = int(ultima_hoje.codigo[1:])
-            return f"{prefixo}{numero + 1:03d}"
-        except (ValueError, IndexError):
-            pass
-
-    # 2. Se não achou ficha de hoje, vamos conferir a ÚLTIMA GERAL do banco
-    # Isso evita o erro caso o fuso horário esteja desencontrado
-    ultima_geral = FichaAtendimento.objects.order_by('-id').first()
-    
-    if ultima_geral:
-        # Se a última ficha geral for de "hoje" (mesmo que o filtro de data falhou)
-        # extraímos o número dela e somamos 1
-        if ultima_geral.codigo.startswith(prefixo):
-            try:
-                # Verificamos se a data de criação da última é igual a hoje
-                # Se for o mesmo dia, incrementamos. Se for outro dia, resetamos para 001.
-                if ultima_geral.criado_em.date() == hoje:
-                    numero = int(ultima_geral.codigo[1:])
-                    return f"{prefixo}{numero + 1:03d}"
-            except:
-                pass
-
-    # 3. Se chegou aqui, ou é o primeiro do dia ou o banco está vazio
-    return f"{prefixo}001"
+def _proximo_codigo(unidade_id: int, prefixo: str = "A", dia=None) -> str:
+    """
+    Próxima senha do dia da unidade para o prefixo, em O(1): um único
+    INSERT ... ON CONFLICT DO UPDATE ... RETURNING na linha do contador.
+
+    A linha fica travada até o commit da ficha, então duas recepções ao mesmo
+    tempo nunca recebem o mesmo número, e um rollback devolve o número
+    (sem buracos na sequência).
+    """
+    dia = dia or timezone.localdate()
+    tabela = connection.ops.quote_name(SequenciaSenha._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {tabela} (unidade_id, data, prefixo, ultimo_numero) VALUES (%s, %s, %s, 1)
+            ON CONFLICT (unidade_id, data, prefixo)
+            DO UPDATE SET ultimo_numero = {tabela}.ultimo_numero + 1
+            RETURNING ultimo_numero
+            """,
+            [unidade_id, dia, prefixo],
+        )
+        numero = cursor.fetchone()[0]
+    return f"{prefixo}{numero:03d}"
 
 # --- RECEPÇÃO ---
+def _abrir_ficha(paciente: Patient, unidade_id: int, prefixo: str, ator=None) -> FichaAtendimento:
+    hoje = timezone.localdate()
+    ficha = FichaAtendimento.objects.create(
+        unidade_id=unidade_id,
+        codigo=_proximo_codigo(unidade_id, prefixo, hoje),
+        data_senha=hoje,
+        paciente=paciente,
+        status=FichaAtendimento.Status.CHEGADA,
+    )
+    _registrar_transicao(ficha, None, ator)
+    return ficha
+
 @transaction.atomic
-def criar_ficha_por_cpf(*, nome, cpf, telefone="", nome_mae="", data_nascimento=None) -> CriarFichaResult:
+def criar_ficha_por_cpf(*, unidade_id, nome, cpf, telefone="", nome_mae="", data_nascimento=None, prefixo="A", ator=None) -> CriarFichaResult:
     paciente, criado = Patient.objects.get_or_create(
         cpf=cpf,
         defaults={
@@ -61,67 +74,48 @@ def criar_ficha_por_cpf(*, nome, cpf, telefone="", nome_mae="", data_nascimento=
     if not criado:
         Patient.objects.filter(id=paciente.id).update(nome=nome, telefone=telefone)
 
-    ficha = FichaAtendimento.objects.create(
-        codigo=_proximo_codigo(),
-        paciente=paciente,
-        status=FichaAtendimento.Status.CHEGADA,
-    )
+    ficha = _abrir_ficha(paciente, unidade_id, prefixo, ator)
     # AJUSTE AQUI: era 'creado', o correto é 'criado'
     return CriarFichaResult(ficha=ficha, paciente_criado=criado)
-# --- TRIAGEM ---
 
 @transaction.atomic
-def chamar_para_triagem(ficha_id: int) -> FichaAtendimento:
-    ficha = FichaAtendimento.objects.select_for_update().get(id=ficha_id)
-    ficha.status = FichaAtendimento.Status.CHAMADO_TRIAGEM
-    ficha.chamado_em = timezone.now()
-    ficha.save()
-    return ficha
+def criar_ficha_para_paciente(paciente: Patient, unidade_id: int, prefixo="A", ator=None) -> CriarFichaResult:
+    """Paciente que já tem cadastro (escolhido no autocomplete): só abre a ficha."""
+    return CriarFichaResult(ficha=_abrir_ficha(paciente, unidade_id, prefixo, ator), paciente_criado=False)
+# --- TRANSIÇÕES ---
+# Cada uma é um único UPDATE condicional (ver transicoes.py): TransicaoInvalida
+# se a ficha não está num status de onde a transição pode sair.
 
-@transaction.atomic
-def finalizar_triagem(ficha_id: int, dados_triagem: dict) -> FichaAtendimento:
-    """ESTA É A FUNÇÃO QUE ESTAVA FALTANDO"""
-    ficha = FichaAtendimento.objects.select_for_update().get(id=ficha_id)
-    
-    ficha.prioridade = dados_triagem.get('prioridade')
-    ficha.pa_sistolica = dados_triagem.get('pa_sistolica')
-    ficha.pa_diastolica = dados_triagem.get('pa_diastolica')
-    ficha.temperatura = dados_triagem.get('temperatura')
-    ficha.frequencia_cardiaca = dados_triagem.get('frequencia_cardiaca')
-    ficha.observacoes_triagem = dados_triagem.get('observacoes_triagem')
-    
-    ficha.status = FichaAtendimento.Status.TRIADO 
-    ficha.save()
+# --- TRIAGEM ---
+
+def chamar_para_triagem(ficha_id: int, ator=None) -> FichaAtendimento:
+    return transicionar(ficha_id, "chamar_triagem", ator)
+
+def iniciar_triagem(ficha_id: int, ator=None) -> FichaAtendimento:
+    """Paciente chegou na sala: a TV para de chamar e mostra 'EM ATENDIMENTO'."""
+    return transicionar(ficha_id, "iniciar_triagem", ator)
+
+def finalizar_triagem(ficha_id: int, dados_triagem: dict, ator=None) -> FichaAtendimento:
+    """Grava os sinais vitais e a prioridade Manchester; a ficha vai para o lançamento."""
+    campos = TRANSICOES["finalizar_triagem"].campos
+    with transaction.atomic():
+        ficha = transicionar(ficha_id, "finalizar_triagem", ator, **{c: dados_triagem.get(c) for c in campos})
+        visitas.registrar(ficha)  # histórico que a próxima triagem do paciente mostra
     return ficha
 
 # --- LANÇAMENTO / ROTEAMENTO ---
-@transaction.atomic
-def rotear_para_medico(ficha_id: int, medico_id: int, local: str) -> FichaAtendimento:
-    ficha = FichaAtendimento.objects.select_for_update().get(id=ficha_id)
-    
-    # NOMES CORRIGIDOS CONFORME SEU MODELS.PY:
-    ficha.medico_atendente_id = medico_id # Usando _id para evitar busca extra no banco
-    ficha.local_atendimento = local       # Nome exato no seu model
-    
-    ficha.status = FichaAtendimento.Status.CHAMADO_MEDICO
-    ficha.chamado_em = timezone.now()
-    ficha.save()
-    return ficha
+def rotear_para_medico(ficha_id: int, medico_id: int, local: str, ator=None) -> FichaAtendimento:
+    return transicionar(
+        ficha_id, "rotear_medico", ator, medico_atendente_id=medico_id, local_atendimento=local,
+    )
 
 # --- MÉDICO ---
 
-@transaction.atomic
-def chamar_para_medico(ficha_id: int) -> FichaAtendimento:
-    ficha = FichaAtendimento.objects.select_for_update().get(id=ficha_id)
-    ficha.status = FichaAtendimento.Status.CHAMADO_MEDICO
-    ficha.chamado_em = timezone.now()
-    ficha.save()
-    return ficha
+def chamar_para_medico(ficha_id: int, ator=None) -> FichaAtendimento:
+    return transicionar(ficha_id, "chamar_medico", ator)
 
-@transaction.atomic
-def finalizar_atendimento_medico(ficha_id: int) -> FichaAtendimento:
-    ficha = FichaAtendimento.objects.select_for_update().get(id=ficha_id)
-    ficha.status = FichaAtendimento.Status.FINALIZADO
-    ficha.finalizado_em = timezone.now()
-    ficha.save()
-    return ficha
\ No newline at end of file
+def finalizar_atendimento_medico(ficha_id: int, ator=None) -> FichaAtendimento:
+    with transaction.atomic():
+        ficha = transicionar(ficha_id, "finalizar_atendimento", ator)
+        visitas.registrar(ficha)
+    return ficha
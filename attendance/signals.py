@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Disparado (depois do commit) sempre que uma service muda o status de uma ficha.
+# Argumentos: ficha (FichaAtendimento já salva) e anterior (status antigo ou None
+# quando a ficha acabou de ser criada na recepção).
+ficha_transicionada = Signal()
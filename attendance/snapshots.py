@@ -0,0 +1,376 @@
+"""
+Snapshots JSON dos painéis (TVs) com ETag.
+
+Cada fila (status) de cada unidade tem um contador de versão no cache,
+incrementado depois do commit de toda transição que entra ou sai dela. O ETag de um painel sai
+só desses contadores: a TV que pergunta "mudou algo?" custa uma leitura no
+cache e recebe 304, sem consulta ao banco e sem renderizar template.
+
+Os dados em si vêm do cache das filas (fila_cache), não do PostgreSQL.
+O cache precisa ser compartilhado entre os workers (Redis em produção);
+com o LocMemCache padrão isso só vale para um processo.
+
+aobter_snapshot() é o caminho das views assíncronas dos painéis (ASGI): o
+caso comum (nada mudou) é só a leitura assíncrona do cache; remontar o
+snapshot, que lê as filas e a previsão, roda numa thread (sync_to_async).
+
+Banco lento (vacuum, fila atrás de um SELECT ... FOR UPDATE): remontar pode
+ler o banco (cache das filas ou ritmo frio), e cada TV esperando prenderia
+um worker. Por isso:
+
+- as consultas da remontagem têm statement_timeout de PAINEL_TEMPO_LIMITE_MS;
+- só uma requisição remonta cada painel de cada unidade por vez (trava no
+  cache); as outras TVs recebem o snapshot anterior enquanto isso;
+- com o banco respondendo, quem pegou a trava remonta na hora: a TV nunca
+  fica uma versão atrás;
+- remontagem que falhou (tempo limite) grava o último snapshot bom marcado
+  como desatualizado ("desatualizado" e "gerado_em" nos dados, ETag
+  próprio) e a TV mostra o aviso;
+- depois de PAINEL_DISJUNTOR_FALHAS falhas seguidas o disjuntor do processo
+  abre: por PAINEL_DISJUNTOR_SEGUNDOS nenhum painel tenta o banco, depois
+  passa uma tentativa por vez. Com ele aberto a requisição não espera
+  nenhuma tentativa: devolve o snapshot marcado e a tentativa roda numa
+  thread de _remontadores (PAINEL_REMONTAR_EM_SEGUNDO_PLANO=False tenta na
+  própria requisição). Sem snapshot anterior nenhum sobra
+  PainelIndisponivel (503 nas views).
+"""
+import contextvars
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.replicas import banco_de_leitura
+
+from . import fila_cache, previsao
+from .models import FichaAtendimento
+from .signals import ficha_transicionada
+
+logger = logging.getLogger(__name__)
+
+Status = FichaAtendimento.Status
+
+# Mesmas travas de segurança do painel da recepção
+JANELA_CHAMADO = timedelta(minutes=2)
+JANELA_EM_TRIAGEM = timedelta(seconds=30)
+
+# Se quem remontava morreu sem soltar a trava, ela vence sozinha
+TRAVA_SEGUNDOS = 30
+
+# Quais filas cada painel mostra (o ETag depende só delas)
+PAINEIS = {
+    "recepcao": (Status.CHEGADA, Status.CHAMADO_TRIAGEM, Status.EM_TRIAGEM),
+    "medico": (Status.TRIADO, Status.CHAMADO_MEDICO),
+    "tv": (Status.CHAMADO_TRIAGEM, Status.CHAMADO_MEDICO),
+}
+
+
+def _chave_versao(unidade_id, status):
+    return f"fila:versao:{unidade_id}:{status}"
+
+
+def incrementar_versoes(unidade_id, *status) -> None:
+    for s in {s for s in status if s}:
+        chave = _chave_versao(unidade_id, s)
+        try:
+            cache.incr(chave)
+        except ValueError:
+            # Cache frio: começa num valor que nunca repete um ETag já entregue
+            cache.add(chave, time.time_ns(), timeout=None)
+
+
+@receiver(ficha_transicionada)
+def invalidar_paineis(sender, ficha, anterior, **kwargs):
+    # Primeiro o cache das filas, depois as versões: quem vir a versão nova
+    # já encontra as filas atualizadas.
+    try:
+        fila_cache.registrar(ficha)
+    except Exception:
+        logger.exception("Falha ao atualizar o cache das filas (ficha %s)", ficha.id)
+    incrementar_versoes(ficha.unidade_id, ficha.status, anterior)
+
+
+def _chamado_recente(unidade_id, status, agora, janela):
+    # As filas de chamados já vêm da mais recente para a mais antiga
+    for resumo in fila_cache.fila(unidade_id, status, 1):
+        atualizado_em = datetime.fromisoformat(resumo["atualizado_em"])
+        if atualizado_em >= agora - janela:
+            return resumo, atualizado_em + janela
+    return None, None
+
+
+def _montar_recepcao(unidade_id, agora):
+    atual, expira = _chamado_recente(unidade_id, Status.CHAMADO_TRIAGEM, agora, JANELA_CHAMADO)
+    if not atual:
+        atual, expira = _chamado_recente(unidade_id, Status.EM_TRIAGEM, agora, JANELA_EM_TRIAGEM)
+
+    minutos = previsao.intervalos(unidade_id)
+    dados = {
+        "atual": atual,
+        "proximos": previsao.com_previsao(unidade_id, "triagem", fila_cache.fila(unidade_id, Status.CHEGADA, 6), minutos),
+        # A TV recalcula a previsão de quem chega pelo SSE: (posição + 1) x intervalo
+        "minutos_por_chamada": minutos["triagem"],
+    }
+    # O chamado some da TV sozinho quando a janela vence, então o snapshot também expira
+    return dados, expira
+
+
+def _montar_medico(unidade_id, agora):
+    atual = fila_cache.fila(unidade_id, Status.CHAMADO_MEDICO, 1)
+    dados = {
+        "atual": atual[0] if atual else None,
+        "fila": previsao.com_previsao(unidade_id, "medico", fila_cache.fila(unidade_id, Status.TRIADO, 8)),
+    }
+    return dados, None
+
+
+def _montar_tv(unidade_id, agora):
+    dados = {
+        "chamados_triagem": fila_cache.fila(unidade_id, Status.CHAMADO_TRIAGEM, 5),
+        "chamados_medico": fila_cache.fila(unidade_id, Status.CHAMADO_MEDICO, 5),
+    }
+    return dados, None
+
+
+MONTADORES = {
+    "recepcao": _montar_recepcao,
+    "medico": _montar_medico,
+    "tv": _montar_tv,
+}
+
+
+def _chaves(painel, unidade_id):
+    return [_chave_versao(unidade_id, s) for s in PAINEIS[painel]], f"painel:{unidade_id}:{painel}:snapshot"
+
+
+def _chave_trava(chave_snapshot):
+    return f"{chave_snapshot}:montando"
+
+
+def _faltando(painel, chaves_versao, valores):
+    return [s for s, k in zip(PAINEIS[painel], chaves_versao) if k not in valores]
+
+
+def _vigente(snapshot, versao, agora) -> bool:
+    return bool(snapshot) and snapshot["versao"] == versao and (snapshot["expira"] is None or agora < snapshot["expira"])
+
+
+def _montar(painel, unidade_id, versao, agora) -> dict:
+    dados, expira = MONTADORES[painel](unidade_id, agora)
+    assinatura = f"{unidade_id}:{painel}:{versao}:{expira.timestamp() if expira else ''}"
+    return {
+        "etag": '"%s"' % hashlib.sha1(assinatura.encode()).hexdigest()[:20],
+        "versao": versao,
+        "expira": expira,
+        "gerado_em": agora,
+        "dados": {"painel": painel, **dados},
+    }
+
+
+# --- BANCO LENTO ---------------------------------------------------------------
+
+class PainelIndisponivel(Exception):
+    """O banco não deixou montar o snapshot e não há um anterior para servir."""
+
+
+class Disjuntor:
+    """Circuit breaker do banco para os painéis, por processo (ver docstring do módulo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.falhas = 0
+        self.aberto_ate = 0.0
+
+    def aberto(self) -> bool:
+        """Falhas demais seguidas (não gasta a tentativa do meio aberto)."""
+        with self._lock:
+            return self.falhas >= settings.PAINEL_DISJUNTOR_FALHAS
+
+    def permite(self) -> bool:
+        with self._lock:
+            if self.falhas < settings.PAINEL_DISJUNTOR_FALHAS:
+                return True
+            agora = time.monotonic()
+            if agora < self.aberto_ate:
+                return False
+            # Meio aberto: esta passa, as outras esperam a próxima janela
+            self.aberto_ate = agora + settings.PAINEL_DISJUNTOR_SEGUNDOS
+            return True
+
+    def sucesso(self) -> None:
+        with self._lock:
+            if self.falhas >= settings.PAINEL_DISJUNTOR_FALHAS:
+                logger.info("Banco respondeu de novo; painéis voltam a remontar", extra={"evento": "painel_disjuntor_fechado"})
+            self.falhas = 0
+
+    def falha(self) -> None:
+        with self._lock:
+            self.falhas += 1
+            if self.falhas < settings.PAINEL_DISJUNTOR_FALHAS:
+                return
+            if self.falhas == settings.PAINEL_DISJUNTOR_FALHAS:
+                logger.warning(
+                    "%d falhas seguidas; painéis param de ir ao banco por %.0f s",
+                    self.falhas, settings.PAINEL_DISJUNTOR_SEGUNDOS,
+                    extra={"evento": "painel_disjuntor_aberto", "falhas": self.falhas},
+                )
+            self.aberto_ate = time.monotonic() + settings.PAINEL_DISJUNTOR_SEGUNDOS
+
+
+disjuntor = Disjuntor()
+
+
+@contextmanager
+def _tempo_limite():
+    """
+    statement_timeout nas consultas do bloco (banco de leitura e primária).
+    Dentro de transação alheia não mexe: o SET LOCAL valeria até o fim dela.
+    """
+    bancos = dict.fromkeys([banco_de_leitura(), DEFAULT_DB_ALIAS])
+    with ExitStack() as pilha:
+        for alias in bancos:
+            if connections[alias].in_atomic_block:
+                continue
+            pilha.enter_context(transaction.atomic(using=alias))
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SET LOCAL statement_timeout = %s", [settings.PAINEL_TEMPO_LIMITE_MS])
+        yield
+
+
+def _remontar(painel, unidade_id, versao, agora) -> dict:
+    """_montar() com tempo limite e disjuntor. PainelIndisponivel se o banco não deixou."""
+    if not disjuntor.permite():
+        raise PainelIndisponivel("Disjuntor aberto")
+    try:
+        with _tempo_limite():
+            snapshot = _montar(painel, unidade_id, versao, agora)
+    except DatabaseError as erro:
+        disjuntor.falha()
+        logger.warning(
+            "Painel %s da unidade %s não remontou: %s", painel, unidade_id, erro,
+            extra={"evento": "painel_degradado", "painel": painel, "unidade_id": unidade_id},
+        )
+        raise PainelIndisponivel(str(erro)) from erro
+    disjuntor.sucesso()
+    return snapshot
+
+
+def _desatualizado(snapshot) -> dict:
+    """O último snapshot bom, marcado para a TV mostrar o aviso (ETag próprio: não vira 304)."""
+    if snapshot["dados"].get("desatualizado"):
+        return snapshot
+    gerado_em = snapshot.get("gerado_em")  # snapshots de antes deste campo não têm
+    return {
+        **snapshot,
+        "etag": snapshot["etag"][:-1] + '-d"',
+        "dados": {**snapshot["dados"], "desatualizado": True, "gerado_em": gerado_em and gerado_em.isoformat()},
+    }
+
+
+# --- REMONTAGEM FORA DA REQUISIÇÃO -----------------------------------------------
+
+# Só com o disjuntor aberto. Poucas threads: a trava já deixa uma remontagem
+# por painel de cada unidade
+_remontadores = ThreadPoolExecutor(max_workers=2, thread_name_prefix="painel")
+
+
+def _atualizar(painel, unidade_id, versao, agora, anterior) -> dict:
+    """Remonta e grava o snapshot (ou o anterior marcado, se o banco não deixou) e solta a trava."""
+    _, chave_snapshot = _chaves(painel, unidade_id)
+    try:
+        try:
+            snapshot = _remontar(painel, unidade_id, versao, agora)
+        except PainelIndisponivel:
+            snapshot = _desatualizado(anterior)
+        cache.set(chave_snapshot, snapshot, timeout=None)
+        return snapshot
+    finally:
+        cache.delete(_chave_trava(chave_snapshot))
+
+
+def _atualizar_na_thread(*args) -> None:
+    try:
+        _atualizar(*args)
+    except Exception:
+        logger.exception("Falha ao remontar o painel %s da unidade %s", args[0], args[1])
+    finally:
+        # Thread do pool: a conexão não pode ficar aberta esperando a próxima vez
+        connections.close_all()
+
+
+def _remontar_em_segundo_plano(*args) -> None:
+    # Leva o contexto da requisição (ler_da_replica vale na thread também)
+    _remontadores.submit(contextvars.copy_context().run, _atualizar_na_thread, *args)
+
+
+# --- LEITURA ---------------------------------------------------------------------
+
+def obter_snapshot(painel: str, unidade_id: int) -> dict:
+    """
+    {"etag", "versao", "expira", "gerado_em", "dados"} do painel da unidade.
+    Só vai ao banco quando alguma fila do painel mudou (ou o chamado atual
+    expirou). PainelIndisponivel se não há snapshot nenhum e o banco não respondeu.
+    """
+    chaves_versao, chave_snapshot = _chaves(painel, unidade_id)
+    valores = cache.get_many([*chaves_versao, chave_snapshot])  # uma ida ao cache
+
+    faltando = _faltando(painel, chaves_versao, valores)
+    if faltando:
+        incrementar_versoes(unidade_id, *faltando)
+        valores.update(cache.get_many(chaves_versao))
+    versao = tuple(valores.get(k) for k in chaves_versao)
+
+    agora = timezone.now()
+    anterior = valores.get(chave_snapshot)
+    if _vigente(anterior, versao, agora):
+        return anterior
+    if anterior:
+        # Outra requisição já está remontando: fica no anterior
+        if not cache.add(_chave_trava(chave_snapshot), 1, TRAVA_SEGUNDOS):
+            return anterior
+        # Banco fora: a tentativa não prende a TV
+        if settings.PAINEL_REMONTAR_EM_SEGUNDO_PLANO and disjuntor.aberto():
+            _remontar_em_segundo_plano(painel, unidade_id, versao, agora, anterior)
+            return _desatualizado(anterior)
+        return _atualizar(painel, unidade_id, versao, agora, anterior)
+    # Sem anterior não há o que servir: remonta aqui (PainelIndisponivel sobe)
+    snapshot = _remontar(painel, unidade_id, versao, agora)
+    cache.set(chave_snapshot, snapshot, timeout=None)
+    return snapshot
+
+
+async def aobter_snapshot(painel: str, unidade_id: int) -> dict:
+    """obter_snapshot() para as views assíncronas (mesmas chaves e ETags)."""
+    chaves_versao, chave_snapshot = _chaves(painel, unidade_id)
+    valores = await cache.aget_many([*chaves_versao, chave_snapshot])
+
+    faltando = _faltando(painel, chaves_versao, valores)
+    if faltando:
+        await sync_to_async(incrementar_versoes)(unidade_id, *faltando)
+        valores.update(await cache.aget_many(chaves_versao))
+    versao = tuple(valores.get(k) for k in chaves_versao)
+
+    agora = timezone.now()
+    anterior = valores.get(chave_snapshot)
+    if _vigente(anterior, versao, agora):
+        return anterior
+    if anterior:
+        if not await cache.aadd(_chave_trava(chave_snapshot), 1, TRAVA_SEGUNDOS):
+            return anterior
+        if settings.PAINEL_REMONTAR_EM_SEGUNDO_PLANO and disjuntor.aberto():
+            _remontar_em_segundo_plano(painel, unidade_id, versao, agora, anterior)
+            return _desatualizado(anterior)
+        return await sync_to_async(_atualizar)(painel, unidade_id, versao, agora, anterior)
+    snapshot = await sync_to_async(_remontar)(painel, unidade_id, versao, agora)
+    await cache.aset(chave_snapshot, snapshot, timeout=None)
+    return snapshot
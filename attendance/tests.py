@@ -1,3 +1,1507 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import runpy
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.migrations import UNIDADE_INICIAL as UNIDADE
+from core.models import Unidade
+from patients.models import Patient
+
+from . import carga, despacho, espera, fila_cache, previsao, snapshots, trilha, visitas
+from .admin import FichaAtendimentoAdmin
+from .arquivamento import arquivar_lote
+from .eventos import LocalBroker, PostgresBroker, get_broker
+from .models import FichaArquivada, FichaAtendimento, FichaEvento, FichaHistorico, PlantaoMedico, ResumoVisitas
+from .services import (
+    _proximo_codigo, chamar_para_medico, chamar_para_triagem, criar_ficha_por_cpf,
+    finalizar_atendimento_medico, finalizar_triagem, iniciar_triagem, rotear_para_medico,
+)
+from .snapshots import obter_snapshot
+from .transicoes import TransicaoInvalida, transicionar
+
+
+def _nova_ficha(cpf="111.222.333-44", nome="Maria da Silva", unidade_id=UNIDADE):
+    return criar_ficha_por_cpf(unidade_id=unidade_id, nome=nome, cpf=cpf).ficha
+
+
+def _limpar_caches():
+    # Cache e filas vivem fora da transação do teste: zera entre um teste e outro
+    cache.clear()
+    for unidade_id in Unidade.objects.values_list("id", flat=True):
+        fila_cache.get_backend(unidade_id).limpar()
+
+
+class LocalBrokerTests(TestCase):
+    def test_entrega_evento_publicado_para_assinante(self):
+        broker = LocalBroker()
+
+        async def cenario():
+            assinatura = broker.assinar()
+            broker.publicar({"id": 1, "status": "CHEGADA"})
+            evento = await assinatura.receber(timeout=1)
+            await assinatura.fechar()
+            return evento
+
+        self.assertEqual(asyncio.run(cenario()), {"id": 1, "status": "CHEGADA"})
+
+    def test_receber_sem_evento_retorna_none_no_timeout(self):
+        broker = LocalBroker()
+
+        async def cenario():
+            assinatura = broker.assinar()
+            evento = await assinatura.receber(timeout=0.01)
+            await assinatura.fechar()
+            return evento
+
+        self.assertIsNone(asyncio.run(cenario()))
+
+    def test_assinante_lento_descarta_eventos_antigos(self):
+        broker = LocalBroker(tamanho_fila=2)
+
+        async def cenario():
+            assinatura = broker.assinar()
+            for i in range(5):
+                broker.publicar({"id": i})
+            await asyncio.sleep(0)  # deixa o loop processar as entregas
+            recebidos = [await assinatura.receber(timeout=1), await assinatura.receber(timeout=1)]
+            await assinatura.fechar()
+            return recebidos
+
+        self.assertEqual(asyncio.run(cenario()), [{"id": 3}, {"id": 4}])
+
+
+@override_settings(EVENTOS_BROKER="attendance.eventos.LocalBroker")
+class EventosTransicaoTests(TestCase):
+    def setUp(self):
+        get_broker.cache_clear()
+        self.publicados = []
+        get_broker().publicar = self.publicados.append
+
+    def tearDown(self):
+        get_broker.cache_clear()
+
+    def test_services_publicam_resumo_apos_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ficha = _nova_ficha()
+        with self.captureOnCommitCallbacks(execute=True):
+            chamar_para_triagem(ficha.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            iniciar_triagem(ficha.id)
+
+        self.assertEqual(
+            [(e["status"], e["anterior"]) for e in self.publicados],
+            [("CHEGADA", None), ("CHAMADO_TRIAGEM", "CHEGADA"), ("EM_TRIAGEM", "CHAMADO_TRIAGEM")],
+        )
+        self.assertEqual(self.publicados[-1]["paciente"], {"nome": "Maria da Silva"})
+
+    def test_nada_e_publicado_sem_commit(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            _nova_ficha()
+        self.assertEqual(self.publicados, [])
+
+
+class PainelEventosViewTests(TestCase):
+    async def test_stream_sse_entrega_somente_status_filtrados_da_unidade(self):
+        get_broker.cache_clear()
+        response = await self.async_client.get("/painel/eventos/", {"status": "CHEGADA"})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+        get_broker().publicar({"id": 6, "unidade_id": UNIDADE + 1, "status": "CHEGADA", "anterior": None})
+        get_broker().publicar({"id": 7, "unidade_id": UNIDADE, "status": "TRIADO", "anterior": "EM_TRIAGEM"})
+        get_broker().publicar({"id": 8, "unidade_id": UNIDADE, "status": "CHEGADA", "anterior": None})
+        chunk = await asyncio.wait_for(anext(stream), 1)
+        self.assertIn(b'"id": 8', chunk)
+        await stream.aclose()
+
+
+class PainelSnapshotTests(TestCase):
+    def setUp(self):
+        _limpar_caches()
+
+    def test_snapshot_sem_mudanca_responde_304_sem_consultar_banco(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ficha = _nova_ficha()
+
+        response = self.client.get("/painel/recepcao/snapshot/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["proximos"][0]["codigo"], ficha.codigo)
+        etag = response["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/painel/recepcao/snapshot/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_transicao_muda_etag_so_dos_paineis_afetados(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ficha = _nova_ficha()
+        etag_recepcao = self.client.get("/painel/recepcao/snapshot/")["ETag"]
+        etag_medico = self.client.get("/painel/medico/snapshot/")["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            chamar_para_triagem(ficha.id)
+
+        response = self.client.get("/painel/recepcao/snapshot/", HTTP_IF_NONE_MATCH=etag_recepcao)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["atual"]["codigo"], ficha.codigo)
+        self.assertEqual(response.json()["proximos"], [])
+        response = self.client.get("/painel/medico/snapshot/", HTTP_IF_NONE_MATCH=etag_medico)
+        self.assertEqual(response.status_code, 304)
+
+    def test_painel_desconhecido_retorna_404(self):
+        self.assertEqual(self.client.get("/painel/cozinha/snapshot/").status_code, 404)
+
+    def test_paineis_html_embutem_estado_inicial(self):
+        _nova_ficha()
+        response = self.client.get("/painel/recepcao/")
+        self.assertContains(response, 'id="estado-inicial"')
+        self.assertEqual(response.context["estado"]["dados"]["proximos"][0]["status"], "CHEGADA")
+        self.assertContains(self.client.get("/painel/medico/"), 'id="estado-inicial"')
+
+    async def test_caminho_assincrono_usa_o_mesmo_snapshot(self):
+        ficha = await sync_to_async(_nova_ficha)()
+        response = await self.async_client.get("/painel/recepcao/snapshot/")
+        self.assertEqual(response.json()["proximos"][0]["codigo"], ficha.codigo)
+        snapshot = await sync_to_async(obter_snapshot)("recepcao", UNIDADE)
+        self.assertEqual(response["ETag"], snapshot["etag"])
+
+        response = await self.async_client.get(
+            "/painel/recepcao/snapshot/", headers={"if-none-match": snapshot["etag"]},
+        )
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get("/painel/medico/")
+        self.assertContains(response, 'id="estado-inicial"')
+
+
+def _banco_fora(unidade_id, agora):
+    raise OperationalError("canceling statement due to statement timeout")
+
+
+def _banco_lento(unidade_id, agora):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_sleep(2)")
+    return {}, None
+
+
+@override_settings(PAINEL_DISJUNTOR_FALHAS=2)
+class PainelDegradadoTests(TestCase):
+    """Banco lento ou fora: a TV recebe o último snapshot bom, sem prender o worker."""
+
+    def setUp(self):
+        _limpar_caches()
+        disjuntor = mock.patch.object(snapshots, "disjuntor", snapshots.Disjuntor())
+        self.disjuntor = disjuntor.start()
+        self.addCleanup(disjuntor.stop)
+
+    def _mudar_fila(self):
+        # Versão nova da fila de chamados: o snapshot da TV precisa ser remontado
+        snapshots.incrementar_versoes(UNIDADE, "CHAMADO_TRIAGEM")
+
+    def test_banco_fora_serve_ultimo_snapshot_marcado(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ficha = _nova_ficha()
+            chamar_para_triagem(ficha.id)
+        bom = self.client.get("/painel/tv/snapshot/")
+        self.assertNotIn("desatualizado", bom.json())
+
+        self._mudar_fila()
+        with self.assertLogs("attendance.snapshots", "WARNING"), mock.patch.dict(snapshots.MONTADORES, {"tv": _banco_fora}):
+            resposta = self.client.get("/painel/tv/snapshot/", HTTP_IF_NONE_MATCH=bom["ETag"])
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta["ETag"], bom["ETag"])
+        dados = resposta.json()
+        self.assertTrue(dados["desatualizado"])
+        self.assertIsNotNone(dados["gerado_em"])
+        self.assertEqual(dados["chamados_triagem"][0]["codigo"], ficha.codigo)
+
+        # Banco de volta: snapshot novo, sem a marca
+        resposta = self.client.get("/painel/tv/snapshot/", HTTP_IF_NONE_MATCH=resposta["ETag"])
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotIn("desatualizado", resposta.json())
+
+    # Tentativas na requisição: dá para contar as idas ao montador
+    @override_settings(PAINEL_REMONTAR_EM_SEGUNDO_PLANO=False)
+    def test_disjuntor_para_de_ir_ao_banco_depois_de_falhas_seguidas(self):
+        self.client.get("/painel/tv/snapshot/")
+        montador = mock.Mock(side_effect=_banco_fora)
+        with mock.patch.dict(snapshots.MONTADORES, {"tv": montador}):
+            with self.assertLogs("attendance.snapshots", "WARNING") as logs:
+                for _ in range(4):
+                    self._mudar_fila()
+                    self.assertTrue(self.client.get("/painel/tv/snapshot/").json()["desatualizado"])
+            self.assertEqual(montador.call_count, 2)
+            self.assertIn("painel_disjuntor_aberto", [getattr(r, "evento", None) for r in logs.records])
+
+            # Passada a janela, uma tentativa; deu certo, fecha
+            self.disjuntor.aberto_ate = 0
+            montador.side_effect = snapshots._montar_tv
+            with self.assertLogs("attendance.snapshots", "INFO"):
+                self.assertNotIn("desatualizado", self.client.get("/painel/tv/snapshot/").json())
+        self.assertEqual(self.disjuntor.falhas, 0)
+
+    def test_sem_snapshot_anterior_responde_503(self):
+        with self.assertLogs("attendance.snapshots", "WARNING"), self.assertLogs("django.request", "ERROR"):
+            with mock.patch.dict(snapshots.MONTADORES, {"tv": _banco_fora}):
+                resposta = self.client.get("/painel/tv/snapshot/")
+        self.assertEqual(resposta.status_code, 503)
+        self.assertEqual(resposta["Retry-After"], "10")
+
+    def test_outra_requisicao_remontando_recebe_o_anterior(self):
+        bom = self.client.get("/painel/tv/snapshot/")
+        self._mudar_fila()
+        _, chave_snapshot = snapshots._chaves("tv", UNIDADE)
+        cache.add(snapshots._chave_trava(chave_snapshot), 1, snapshots.TRAVA_SEGUNDOS)
+        with self.assertNumQueries(0), mock.patch.dict(snapshots.MONTADORES, {"tv": _banco_fora}):
+            resposta = self.client.get("/painel/tv/snapshot/", HTTP_IF_NONE_MATCH=bom["ETag"])
+        self.assertEqual(resposta.status_code, 304)
+
+
+@skipUnless(connection.vendor == "postgresql", "statement_timeout do PostgreSQL")
+@override_settings(PAINEL_TEMPO_LIMITE_MS=100)
+class PainelTempoLimiteTests(TransactionTestCase):
+    """O statement_timeout só vale fora de transação alheia: aqui não há a do TestCase."""
+
+    databases = "__all__"  # com DB_REPLICAS, o painel lê da réplica
+    serialized_rollback = True
+
+    def setUp(self):
+        _limpar_caches()
+        self.addCleanup(_limpar_caches)
+        disjuntor = mock.patch.object(snapshots, "disjuntor", snapshots.Disjuntor())
+        self.disjuntor = disjuntor.start()
+        self.addCleanup(disjuntor.stop)
+
+    def test_consulta_lenta_e_cancelada_e_painel_segue_no_anterior(self):
+        self.client.get("/painel/tv/snapshot/")
+        snapshots.incrementar_versoes(UNIDADE, "CHAMADO_TRIAGEM")
+        inicio = timezone.now()
+        with self.assertLogs("attendance.snapshots", "WARNING"), mock.patch.dict(snapshots.MONTADORES, {"tv": _banco_lento}):
+            resposta = self.client.get("/painel/tv/snapshot/")
+        self.assertLess(timezone.now() - inicio, timedelta(seconds=1))
+        self.assertTrue(resposta.json()["desatualizado"])
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW statement_timeout")
+            self.assertEqual(cursor.fetchone()[0], "0")
+
+    def test_banco_ok_a_primeira_tv_depois_da_mudanca_ja_ve_a_mudanca(self):
+        self.client.get("/painel/tv/snapshot/")
+        ficha = _nova_ficha()
+        chamar_para_triagem(ficha.id)
+        dados = self.client.get("/painel/tv/snapshot/").json()
+        self.assertEqual([f["codigo"] for f in dados["chamados_triagem"]], [ficha.codigo])
+        self.assertNotIn("desatualizado", dados)
+
+    def test_disjuntor_aberto_tenta_o_banco_fora_da_requisicao(self):
+        self.client.get("/painel/tv/snapshot/")
+        self.disjuntor.falhas = settings.PAINEL_DISJUNTOR_FALHAS  # aberto, janela vencida
+        liberar = threading.Event()
+
+        def montador_preso(unidade_id, agora):
+            liberar.wait(5)
+            return {"chamados_triagem": [], "chamados_medico": [], "marca": "novo"}, None
+
+        remontadores = ThreadPoolExecutor(max_workers=1)
+        snapshots.incrementar_versoes(UNIDADE, "CHAMADO_TRIAGEM")
+        with mock.patch.object(snapshots, "_remontadores", remontadores), \
+                mock.patch.dict(snapshots.MONTADORES, {"tv": montador_preso}):
+            # Tentativa presa na thread: a TV recebe o último snapshot bom, na hora
+            self.assertTrue(self.client.get("/painel/tv/snapshot/").json()["desatualizado"])
+            liberar.set()
+            remontadores.shutdown(wait=True)
+        self.assertEqual(self.client.get("/painel/tv/snapshot/").json()["marca"], "novo")
+        self.assertEqual(self.disjuntor.falhas, 0)
+
+    async def test_consulta_lenta_no_caminho_assincrono(self):
+        await self.async_client.get("/painel/tv/snapshot/")
+        await sync_to_async(snapshots.incrementar_versoes)(UNIDADE, "CHAMADO_TRIAGEM")
+        inicio = timezone.now()
+        with self.assertLogs("attendance.snapshots", "WARNING"), mock.patch.dict(snapshots.MONTADORES, {"tv": _banco_lento}):
+            resposta = await self.async_client.get("/painel/tv/snapshot/")
+        self.assertLess(timezone.now() - inicio, timedelta(seconds=1))
+        self.assertTrue(resposta.json()["desatualizado"])
+
+
+class SequenciaSenhaTests(TestCase):
+    def test_numeracao_recomeca_a_cada_dia_e_por_prefixo(self):
+        self.assertEqual(_proximo_codigo(UNIDADE, "A", date(2026, 3, 1)), "A001")
+        self.assertEqual(_proximo_codigo(UNIDADE, "A", date(2026, 3, 1)), "A002")
+        self.assertEqual(_proximo_codigo(UNIDADE, "P", date(2026, 3, 1)), "P001")
+        self.assertEqual(_proximo_codigo(UNIDADE, "A", date(2026, 3, 2)), "A001")
+
+    def test_rollback_devolve_o_numero(self):
+        _nova_ficha(cpf="000.000.000-01")
+        try:
+            with transaction.atomic():
+                _nova_ficha(cpf="000.000.000-02")
+                raise RuntimeError("falha na recepção")
+        except RuntimeError:
+            pass
+        self.assertEqual(_nova_ficha(cpf="000.000.000-03").codigo, "A002")
+
+
+class SequenciaSenhaConcorrenciaTests(TransactionTestCase):
+    # A unidade principal vem da migration: o flush do TransactionTestCase a apagaria
+    serialized_rollback = True
+    TOTAL = 200
+
+    def _registrar(self, i):
+        try:
+            return criar_ficha_por_cpf(unidade_id=UNIDADE, nome=f"Paciente {i}", cpf=f"{i:011d}").ficha.codigo
+        finally:
+            connection.close()
+
+    def test_recepcoes_simultaneas_nao_geram_senha_repetida_nem_buraco(self):
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            codigos = list(pool.map(self._registrar, range(self.TOTAL)))
+
+        self.assertEqual(len(set(codigos)), self.TOTAL)
+        self.assertEqual(set(codigos), {f"A{n:03d}" for n in range(1, self.TOTAL + 1)})
+
+
+class PrioridadeManchesterTests(TestCase):
+    def test_fila_segue_gravidade_manchester_e_depois_chegada(self):
+        cores = ["VERDE", "AZUL", "VERMELHO", "AMARELO", "LARANJA", "VERMELHO"]
+        for i, cor in enumerate(cores):
+            ficha = _nova_ficha(cpf=f"{i:011d}")
+            chamar_para_triagem(ficha.id)
+            finalizar_triagem(ficha.id, {"prioridade": cor})
+
+        fila = FichaAtendimento.objects.filter(status=FichaAtendimento.Status.TRIADO)
+        self.assertEqual(
+            [(f.prioridade, f.codigo) for f in fila],
+            [("VERMELHO", "A003"), ("VERMELHO", "A006"), ("LARANJA", "A005"),
+             ("AMARELO", "A004"), ("VERDE", "A001"), ("AZUL", "A002")],
+        )
+
+    def test_save_com_update_fields_mantem_ordem_sincronizada(self):
+        ficha = _nova_ficha()
+        self.assertEqual(ficha.prioridade_ordem, FichaAtendimento.SEM_PRIORIDADE)
+        ficha.prioridade = FichaAtendimento.Prioridade.LARANJA
+        ficha.save(update_fields=["prioridade"])
+        ficha.refresh_from_db()
+        self.assertEqual(ficha.prioridade_ordem, 2)
+
+
+@tag("lento")
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN do PostgreSQL")
+class IndicesFilasTests(TestCase):
+    """Com 1 milhão de fichas antigas, nenhuma fila pode cair em Seq Scan."""
+
+    HISTORICO = 1_000_000
+    TABELA = FichaAtendimento._meta.db_table
+
+    @classmethod
+    def setUpTestData(cls):
+        paciente = Patient.objects.create(nome="Paciente Antigo", cpf="999.999.999-99")
+        with connection.cursor() as cursor:
+            # Histórico: FINALIZADO (e alguns CANCELADO) espalhados nos últimos 2 anos
+            cursor.execute(
+                f"""
+                INSERT INTO {cls.TABELA}
+                    (unidade_id, codigo, data_senha, paciente_id, status, prioridade, prioridade_ordem,
+                     criado_em, atualizado_em, chamado_em, finalizado_em)
+                SELECT %s, 'H' || n, DATE '2024-01-01', %s,
+                       CASE WHEN n %% 20 = 0 THEN 'CANCELADO' ELSE 'FINALIZADO' END,
+                       (ARRAY['VERMELHO','LARANJA','AMARELO','VERDE','AZUL'])[1 + n %% 5], 1 + n %% 5,
+                       now() - interval '1 minute' * n, now() - interval '1 minute' * n,
+                       now() - interval '1 minute' * n, now() - interval '1 minute' * n
+                FROM generate_series(1, %s) AS n
+                """,
+                [UNIDADE, paciente.id, cls.HISTORICO],
+            )
+            # Movimento do dia
+            cursor.execute(
+                f"""
+                INSERT INTO {cls.TABELA}
+                    (unidade_id, codigo, data_senha, paciente_id, status, prioridade, prioridade_ordem,
+                     criado_em, atualizado_em, chamado_em)
+                SELECT %s, 'A' || n, CURRENT_DATE, %s,
+                       (ARRAY['CHEGADA','CHEGADA','TRIADO','CHAMADO_TRIAGEM','EM_TRIAGEM','CHAMADO_MEDICO'])[1 + n %% 6],
+                       CASE WHEN n %% 6 IN (2, 5) THEN 'AMARELO' END,
+                       CASE WHEN n %% 6 IN (2, 5) THEN 3 ELSE 9 END,
+                       now() - interval '1 second' * n, now() - interval '1 second' * n,
+                       now() - interval '1 second' * n
+                FROM generate_series(1, 300) AS n
+                """,
+                [UNIDADE, paciente.id],
+            )
+            cursor.execute(f"ANALYZE {cls.TABELA}")
+        cls.usuario = get_user_model().objects.create_user(
+            "enfermeira", password="x", is_staff=True, unidade_id=UNIDADE,
+        )
+
+    def _planos(self, url):
+        _limpar_caches()
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        planos = []
+        with connection.cursor() as cursor:
+            for consulta in consultas.captured_queries:
+                sql = consulta["sql"]
+                if sql.startswith("SELECT") and f'FROM "{self.TABELA}"' in sql:
+                    cursor.execute("EXPLAIN " + sql)
+                    planos.append("\n".join(linha[0] for linha in cursor.fetchall()))
+        self.assertTrue(planos, f"{url} não consultou fichas")
+        return planos
+
+    def test_filas_usam_indice(self):
+        self.client.force_login(self.usuario)
+        for url in [
+            "/triagem/",
+            "/lancamento/",
+            "/painel/recepcao/snapshot/",
+            "/painel/medico/snapshot/",
+            "/painel/tv/snapshot/",
+        ]:
+            for plano in self._planos(url):
+                with self.subTest(url=url, plano=plano):
+                    self.assertNotIn(f"Seq Scan on {self.TABELA}", plano)
+                    self.assertIn("Index", plano)
+
+    # Lista do admin (core/listas.py): nem Seq Scan, nem COUNT(*) da tabela, em qualquer profundidade
+    LIMITE_MS = 100
+
+    def _conferir_lista_admin(self, params):
+        with CaptureQueriesContext(connection) as consultas:
+            resposta = self.client.get("/admin/attendance/fichaatendimento/", params)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.context_data["cl"].result_list), FichaAtendimentoAdmin.list_per_page)
+
+        sqls = [c["sql"] for c in consultas.captured_queries if c["sql"].startswith("SELECT") and f'FROM "{self.TABELA}"' in c["sql"]]
+        self.assertTrue(sqls)
+        with connection.cursor() as cursor:
+            for sql in sqls:
+                with self.subTest(params=params, sql=sql):
+                    # COUNT só do trecho filtrado (abaixo de CONTAGEM_EXATA_ATE); a tabela toda é estimada
+                    if "COUNT(" in sql:
+                        self.assertIn("WHERE", sql)
+                    cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql)
+                    analise = cursor.fetchone()[0][0]
+                    cursor.execute("EXPLAIN " + sql)
+                    plano = "\n".join(linha[0] for linha in cursor.fetchall())
+                    self.assertNotIn(f"Seq Scan on {self.TABELA}", plano)
+                    self.assertIn("Index", plano)
+                    if "COUNT(" not in sql:
+                        # A ordem sai do índice (campo_data, id), sem ordenar o período
+                        self.assertIn("Index Scan Backward using ficha_criado_id_idx", plano)
+                        self.assertNotIn("Sort", plano)
+                    self.assertLess(analise["Execution Time"], self.LIMITE_MS, plano)
+        return resposta
+
+    def test_lista_do_admin_usa_indice_em_qualquer_pagina(self):
+        self.client.force_login(get_user_model().objects.create_superuser("admin", password="x"))
+        self._conferir_lista_admin({})
+        primeira = self._conferir_lista_admin({"periodo": "tudo"})
+        self.assertTrue(primeira.context_data["cl"].paginator.estimado)
+
+        # Página ~9000 (900 mil fichas para trás): o OFFSET leria e descartaria todas elas
+        funda = FichaAtendimento.objects.order_by("-criado_em", "-id").values_list("criado_em", "id")[900_000]
+        self._conferir_lista_admin({"periodo": "tudo", "apos": f"{funda[0].isoformat()}_{funda[1]}"})
+
+
+class FilaCacheTestsMixin:
+    """Mesmos cenários para os dois backends do cache das filas."""
+
+    backend_path = None
+
+    def setUp(self):
+        cache.clear()
+        with override_settings(FILA_CACHE_BACKEND=self.backend_path):
+            get_backend = fila_cache.get_backend
+            get_backend.cache_clear()
+            self.backend = get_backend(UNIDADE)
+        self.backend.limpar()
+        self.addCleanup(fila_cache.get_backend.cache_clear)
+        self.addCleanup(self.backend.limpar)
+
+    def _triar(self, cpf, cor):
+        with self.captureOnCommitCallbacks(execute=True):
+            ficha = _nova_ficha(cpf=cpf)
+        with self.captureOnCommitCallbacks(execute=True):
+            chamar_para_triagem(ficha.id)
+            return finalizar_triagem(ficha.id, {"prioridade": cor})
+
+    def test_cache_frio_e_reconstruido_do_banco(self):
+        _nova_ficha()  # sem rodar o on_commit: o cache não sabe dela
+        self.assertIsNone(self.backend.ler("CHEGADA"))
+        with self.assertNumQueries(1):
+            self.assertEqual([f["codigo"] for f in fila_cache.fila(UNIDADE, "CHEGADA")], ["A001"])
+        with self.assertNumQueries(0):
+            fila_cache.fila(UNIDADE, "CHEGADA")
+
+    def test_transicoes_movem_ficha_entre_filas_na_ordem_manchester(self):
+        fila_cache.reconstruir(UNIDADE)
+        self._triar("00000000001", "VERDE")
+        self._triar("00000000002", "VERMELHO")
+        with self.captureOnCommitCallbacks(execute=True):
+            _nova_ficha(cpf="00000000003")
+
+        with self.assertNumQueries(0):
+            self.assertEqual([f["codigo"] for f in fila_cache.fila(UNIDADE, "TRIADO")], ["A002", "A001"])
+            self.assertEqual([f["codigo"] for f in fila_cache.fila(UNIDADE, "CHEGADA")], ["A003"])
+            self.assertEqual(fila_cache.fila(UNIDADE, "TRIADO", 1)[0]["prioridade"], "VERMELHO")
+
+    def test_atualizacao_fora_de_ordem_e_ignorada(self):
+        fila_cache.reconstruir(UNIDADE)
+        ficha = self._triar("00000000001", "AMARELO")
+        atrasada = ficha.resumo() | {"status": "CHEGADA"}
+        self.assertFalse(self.backend.aplicar(ficha.id, 0.0, [("CHEGADA", 1.0)], atrasada))
+        self.assertEqual(fila_cache.fila(UNIDADE, "CHEGADA"), [])
+        self.assertEqual(len(fila_cache.fila(UNIDADE, "TRIADO")), 1)
+
+    def test_contar_fichas_na_frente_pela_prioridade(self):
+        fila_cache.reconstruir(UNIDADE)
+        verde = self._triar("00000000001", "VERDE")
+        self._triar("00000000002", "AMARELO")
+        vermelho = self._triar("00000000003", "VERMELHO")
+
+        score_verde = fila_cache.score_prioridade(verde.prioridade_ordem, verde.criado_em)
+        score_vermelho = fila_cache.score_prioridade(vermelho.prioridade_ordem, vermelho.criado_em)
+        with self.assertNumQueries(0):
+            self.assertEqual(fila_cache.contar(UNIDADE, "TRIADO"), 3)
+            self.assertEqual(fila_cache.contar(UNIDADE, "TRIADO", score_verde), 2)
+            self.assertEqual(fila_cache.contar(UNIDADE, "TRIADO", score_vermelho), 0)
+        self.backend.limpar()
+        with self.assertNumQueries(1):  # frio: reconstrói e conta
+            self.assertEqual(fila_cache.contar(UNIDADE, "TRIADO", score_verde), 2)
+
+    def test_reconstrucao_desiste_se_houve_transicao_no_meio(self):
+        mudancas = self.backend.mudancas()
+        self.backend.aplicar(99, 1.0, [("CHEGADA", 1.0)], {"id": 99})
+        self.assertFalse(self.backend.substituir(mudancas, []))
+        self.assertIsNone(self.backend.ler("CHEGADA"))
+
+
+class MemoriaFilaCacheTests(FilaCacheTestsMixin, TestCase):
+    backend_path = "attendance.fila_cache.MemoriaFilaBackend"
+
+
+def _redis_disponivel():
+    try:
+        import redis
+
+        return redis.Redis.from_url(settings.REDIS_URL or "redis://127.0.0.1:6379/15").ping()
+    except Exception:
+        return False
+
+
+@skipUnless(_redis_disponivel(), "Redis não disponível")
+@override_settings(REDIS_URL=settings.REDIS_URL or "redis://127.0.0.1:6379/15")
+class RedisFilaCacheTests(FilaCacheTestsMixin, TestCase):
+    backend_path = "attendance.fila_cache.RedisFilaBackend"
+
+
+class FilaCacheConfiguracaoTests(SimpleTestCase):
+    """Sem Redis fora do DEBUG cada worker teria a sua fila: o settings recusa subir."""
+
+    def _settings(self, **env):
+        base = {"SECRET_KEY": "x", "REDIS_URL": "", "FILA_CACHE_BACKEND": ""}
+        with mock.patch.dict(os.environ, {**base, **env}), mock.patch("dotenv.load_dotenv"):
+            return runpy.run_path(str(Path(settings.BASE_DIR) / "config" / "settings.py"))
+
+    def test_sem_redis_em_producao_nao_sobe(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self._settings(DEBUG="False")
+
+    def test_sem_redis_em_debug_usa_memoria(self):
+        self.assertEqual(
+            self._settings(DEBUG="True")["FILA_CACHE_BACKEND"], "attendance.fila_cache.MemoriaFilaBackend"
+        )
+
+    def test_com_redis_ou_backend_explicito(self):
+        self.assertEqual(
+            self._settings(DEBUG="False", REDIS_URL="redis://127.0.0.1:6379/0")["FILA_CACHE_BACKEND"],
+            "attendance.fila_cache.RedisFilaBackend",
+        )
+        self.assertEqual(
+            self._settings(DEBUG="False", FILA_CACHE_BACKEND="attendance.fila_cache.MemoriaFilaBackend")[
+                "FILA_CACHE_BACKEND"
+            ],
+            "attendance.fila_cache.MemoriaFilaBackend",
+        )
+
+
+class ConsultasFilasTests(TestCase):
+    """O número de consultas de cada tela não pode crescer com o tamanho da fila."""
+
+    # url -> consultas com o cache das filas frio (sessão e usuário incluídos;
+    # as telas sem login também leem o usuário logado, para saber a unidade)
+    TELAS = {
+        # + cursor da trilha para o long-poll da página
+        "/triagem/": 4,
+        "/lancamento/": 7,
+        "/medico/": 4,
+        # Filas + ritmo de chamadas da previsão (caches zerados a cada tela)
+        "/painel/recepcao/": 4,
+        "/painel/medico/": 4,
+        "/painel/tv/snapshot/": 3,
+    }
+    FILAS = ["CHEGADA", "CHAMADO_TRIAGEM", "EM_TRIAGEM", "TRIADO", "AGUARDANDO_MEDICO", "CHAMADO_MEDICO"]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = get_user_model().objects.create_user(
+            "medico", password="x", first_name="Ana", last_name="Souza", is_staff=True, unidade_id=UNIDADE,
+        )
+
+    def setUp(self):
+        _limpar_caches()
+        self.addCleanup(_limpar_caches)
+        self.client.force_login(self.medico)
+        self.total = 0
+
+    def _popular(self, quantidade):
+        # `quantidade` fichas novas em cada fila que aparece nas telas
+        for _ in range(quantidade):
+            self.total += 1
+            for j, status in enumerate(self.FILAS):
+                paciente = Patient.objects.create(nome=f"Paciente {self.total}-{j}", cpf=f"{self.total:05d}{j:06d}")
+                do_medico = status in ("AGUARDANDO_MEDICO", "CHAMADO_MEDICO")
+                FichaAtendimento.objects.create(
+                    unidade_id=UNIDADE, codigo=f"X{self.total}-{j}", paciente=paciente, status=status, prioridade="AMARELO",
+                    medico_atendente=self.medico if do_medico else None,
+                    local_atendimento="Sala 01" if do_medico else None, chamado_em=timezone.now(),
+                )
+
+    def _conferir_telas(self):
+        for url, consultas in self.TELAS.items():
+            with self.subTest(url=url, fichas=self.total):
+                _limpar_caches()
+                with self.assertNumQueries(consultas):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_telas_com_numero_fixo_de_consultas(self):
+        self._popular(1)
+        self._conferir_telas()
+        self._popular(20)
+        self._conferir_telas()
+
+    def test_triagem_form_carrega_paciente_junto(self):
+        self._popular(1)
+        ficha = FichaAtendimento.objects.filter(status="CHEGADA").first()
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(f"/triagem/finalizar/{ficha.id}/").status_code, 200)
+
+    def test_filas_do_banco_nao_fazem_consulta_por_ficha(self):
+        # Caminho usado quando o cache das filas está fora do ar
+        self._popular(15)
+        for nome in [*self.FILAS, fila_cache.fila_medico(self.medico.id)]:
+            with self.subTest(fila=nome), self.assertNumQueries(1):
+                self.assertTrue(fila_cache._fila_do_banco(UNIDADE, nome))
+        with self.assertNumQueries(1):
+            self.assertEqual(len([f.resumo() for f in FichaAtendimento.fila.ativas()]), 15 * len(self.FILAS))
+
+
+class ArquivamentoTests(TestCase):
+    def _ficha(self, cpf, status, dias_atras):
+        ficha = _nova_ficha(cpf=cpf)
+        criado_em = timezone.now() - timedelta(days=dias_atras)
+        FichaAtendimento.objects.filter(id=ficha.id).update(status=status, criado_em=criado_em)
+        return ficha.id
+
+    def test_move_so_encerradas_antigas_em_lotes(self):
+        antigas = {
+            self._ficha("00000000001", "FINALIZADO", 10),
+            self._ficha("00000000002", "CANCELADO", 10),
+            self._ficha("00000000003", "FINALIZADO", 5),
+        }
+        vivas = {
+            self._ficha("00000000004", "FINALIZADO", 0),  # dentro da janela
+            self._ficha("00000000005", "CHEGADA", 10),    # ainda no fluxo
+        }
+        saida = StringIO()
+        with self.settings(ARQUIVO_FICHAS_DIAS=2):
+            call_command("arquivar_fichas", lote=2, pausa=0, stdout=saida)
+
+        self.assertIn("3 ficha(s) arquivada(s) em 2 lote(s)", saida.getvalue())
+        self.assertEqual(set(FichaAtendimento.objects.values_list("id", flat=True)), vivas)
+        self.assertEqual(set(FichaArquivada.objects.values_list("id", flat=True)), antigas)
+
+        # O histórico continua enxergando tudo, com os dados originais
+        historico = {f.id: f for f in FichaHistorico.objects.select_related("paciente")}
+        self.assertEqual(set(historico), antigas | vivas)
+        self.assertTrue(all(historico[i].arquivada for i in antigas))
+        self.assertEqual(historico[min(antigas)].paciente.cpf, "00000000001")
+
+    def test_lote_nunca_passa_do_tamanho_pedido(self):
+        for i in range(5):
+            self._ficha(f"0000000000{i}", "FINALIZADO", 10)
+        # Força o semi join em laço aninhado: com a subquery dentro do DELETE ... IN,
+        # ela era reexecutada para cada linha da tabela e o lote passava do tamanho
+        with connection.cursor() as cursor:
+            for opcao in ("hashagg", "sort", "hashjoin", "mergejoin", "material"):
+                cursor.execute(f"SET LOCAL enable_{opcao} = off")
+        self.assertEqual(arquivar_lote(timezone.now(), tamanho=2), 2)
+        self.assertEqual(FichaArquivada.objects.count(), 2)
+        self.assertEqual(FichaAtendimento.objects.count(), 3)
+
+    def test_admin_do_historico_lista_fichas_arquivadas(self):
+        self._ficha("00000000001", "FINALIZADO", 10)
+        call_command("arquivar_fichas", stdout=StringIO())
+        admin = get_user_model().objects.create_superuser("admin", password="x")
+        self.client.force_login(admin)
+        resposta = self.client.get("/admin/attendance/fichahistorico/")
+        self.assertContains(resposta, "A001")
+
+
+class AdminFichasTests(TestCase):
+    """Lista do admin de fichas (core/listas.py): cursor, período padrão e busca indexada."""
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser("admin", password="x"))
+
+    def _codigos(self, resposta):
+        return [f.codigo for f in resposta.context_data["cl"].result_list]
+
+    def test_paginas_por_cursor_sem_n_mais_um(self):
+        for i in range(5):
+            _nova_ficha(cpf=f"0000000000{i}")
+        lista = "/admin/attendance/fichaatendimento/"
+        codigos, consultas, proxima = [], [], ""
+        with mock.patch.object(FichaAtendimentoAdmin, "list_per_page", 2):
+            while proxima is not None:
+                with CaptureQueriesContext(connection) as capturadas:
+                    resposta = self.client.get(lista + proxima)
+                codigos += self._codigos(resposta)
+                consultas.append(len(capturadas))
+                proxima = resposta.context_data["cl"].paginator.proxima_url
+                if proxima:
+                    self.assertContains(resposta, "Mais antigos")
+        self.assertEqual(codigos, ["A005", "A004", "A003", "A002", "A001"])
+        # Paciente e unidade vêm no mesmo SELECT: páginas de 2 ou de 1 linha custam igual
+        self.assertEqual(len(set(consultas)), 1, consultas)
+
+    def test_periodo_padrao_e_busca_exata(self):
+        antiga = _nova_ficha(cpf="11122233344", nome="Joana Prado")
+        FichaAtendimento.objects.filter(id=antiga.id).update(criado_em=timezone.now() - timedelta(days=30))
+        _nova_ficha(cpf="55566677788", nome="Pedro Lima")
+        url = "/admin/attendance/fichaatendimento/"
+
+        self.assertEqual(self._codigos(self.client.get(url)), ["A002"])
+        self.assertEqual(self._codigos(self.client.get(url, {"periodo": "tudo"})), ["A002", "A001"])
+        # Com busca, o período só vale se escolhido
+        self.assertEqual(self._codigos(self.client.get(url, {"q": "a001"})), ["A001"])
+        self.assertEqual(self._codigos(self.client.get(url, {"q": "111.222.333-44"})), ["A001"])
+        self.assertEqual(self._codigos(self.client.get(url, {"q": "joana"})), ["A001"])
+        self.assertEqual(self._codigos(self.client.get(url, {"q": "joana", "periodo": "7"})), [])
+
+
+class RecepcaoGerarSenhaTests(TestCase):
+    def setUp(self):
+        _limpar_caches()
+
+    def test_paciente_escolhido_na_busca_so_abre_a_ficha(self):
+        paciente = Patient.objects.create(nome="José Antônio", cpf="123.456.789-01", telefone="9999")
+
+        response = self.client.post("/recepcao/", {"paciente": paciente.id})
+
+        self.assertEqual(response.context["senha_gerada"], "A001")
+        ficha = FichaAtendimento.objects.get()
+        self.assertEqual(ficha.paciente_id, paciente.id)
+        paciente.refresh_from_db()
+        self.assertEqual((paciente.nome, paciente.telefone), ("José Antônio", "9999"))
+
+    def test_sem_paciente_escolhido_exige_nome_e_cpf(self):
+        response = self.client.post("/recepcao/", {"nome": "Maria"})
+
+        self.assertFormError(response.context["form"], "cpf", "Este campo é obrigatório.")
+        self.assertFalse(FichaAtendimento.objects.exists())
+
+
+class TrilhaEventosTests(TestCase):
+    def setUp(self):
+        _limpar_caches()
+
+    def test_cada_transicao_grava_evento_com_quem_fez(self):
+        enfermeira = get_user_model().objects.create_user("enfermeira")
+        ficha = _nova_ficha()
+        chamar_para_triagem(ficha.id, ator=enfermeira)
+        iniciar_triagem(ficha.id, ator=enfermeira)
+        finalizar_triagem(ficha.id, {"prioridade": "VERDE"}, ator=enfermeira)
+
+        eventos = trilha.linha_do_tempo(ficha.id)
+        self.assertEqual(
+            [(e.de, e.para) for e in eventos],
+            [(None, "CHEGADA"), ("CHEGADA", "CHAMADO_TRIAGEM"),
+             ("CHAMADO_TRIAGEM", "EM_TRIAGEM"), ("EM_TRIAGEM", "TRIADO")],
+        )
+        self.assertEqual([e.ator_id for e in eventos], [None, enfermeira.id, enfermeira.id, enfermeira.id])
+
+    def test_rollback_da_transicao_leva_o_evento_junto(self):
+        ficha = _nova_ficha()
+        try:
+            with transaction.atomic():
+                chamar_para_triagem(ficha.id)
+                raise RuntimeError("falha na triagem")
+        except RuntimeError:
+            pass
+        self.assertEqual(FichaEvento.objects.filter(ficha_id=ficha.id).count(), 1)
+
+    def test_evento_sobrevive_ao_arquivamento(self):
+        ficha = _nova_ficha()
+        FichaAtendimento.objects.filter(id=ficha.id).update(
+            status="FINALIZADO", criado_em=timezone.now() - timedelta(days=10),
+        )
+        call_command("arquivar_fichas", stdout=StringIO())
+        self.assertEqual([e.para for e in trilha.linha_do_tempo(ficha.id)], ["CHEGADA"])
+
+
+class TrilhaCursorTests(TransactionTestCase):
+    """Aqui as transições precisam comitar de verdade: o cursor só entrega transações encerradas."""
+
+    serialized_rollback = True
+
+    def setUp(self):
+        _limpar_caches()
+
+    def test_le_em_lotes_sem_repetir_nem_pular(self):
+        fichas = [_nova_ficha(cpf=f"0000000000{i}") for i in range(3)]
+        for ficha in fichas:
+            chamar_para_triagem(ficha.id)
+
+        lidos, cursor = [], None
+        while True:
+            eventos, cursor = trilha.eventos_apos(cursor, limite=2)
+            if not eventos:
+                break
+            lidos += [e.id for e in eventos]
+        self.assertEqual(sorted(lidos), sorted(FichaEvento.objects.values_list("id", flat=True)))
+        self.assertEqual(len(lidos), 6)
+
+    def test_transacao_aberta_segura_eventos_posteriores(self):
+        ficha_lenta, ficha_rapida = _nova_ficha("00000000001"), _nova_ficha("00000000002")
+        _, cursor = trilha.eventos_apos(None)
+
+        gravou, liberar = threading.Event(), threading.Event()
+
+        def estacao_lenta():
+            try:
+                with transaction.atomic():
+                    chamar_para_triagem(ficha_lenta.id)  # pega um id antes da outra estação
+                    gravou.set()
+                    liberar.wait(5)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            lenta = pool.submit(estacao_lenta)
+            gravou.wait(5)
+            chamar_para_triagem(ficha_rapida.id)  # comita com id maior
+
+            # A estação lenta ainda não comitou: nada sai, senão o cursor pularia o evento dela
+            self.assertEqual(trilha.eventos_apos(cursor)[0], [])
+            liberar.set()
+            lenta.result()
+
+        eventos, _ = trilha.eventos_apos(cursor)
+        self.assertEqual({e.ficha_id for e in eventos}, {ficha_lenta.id, ficha_rapida.id})
+
+    def test_api_com_cursor(self):
+        _nova_ficha()
+        self.client.force_login(get_user_model().objects.create_user("integracao"))
+
+        resposta = self.client.get("/fichas/eventos/").json()
+        self.assertEqual([e["para"] for e in resposta["eventos"]], ["CHEGADA"])
+        self.assertEqual(self.client.get(f"/fichas/eventos/?cursor={resposta['cursor']}").json()["eventos"], [])
+        self.assertEqual(self.client.get("/fichas/eventos/?cursor=abc").status_code, 400)
+
+
+@override_settings(EVENTOS_BROKER="attendance.eventos.LocalBroker")
+class EsperaMudancaTests(TransactionTestCase):
+    """Long-poll /painel/aguardar/: lê a trilha, então as transições precisam comitar."""
+
+    serialized_rollback = True
+    databases = "__all__"  # as telas das estações leem da réplica
+
+    def setUp(self):
+        _limpar_caches()
+        get_broker.cache_clear()
+        self.addCleanup(get_broker.cache_clear)
+
+    def test_sem_cursor_devolve_o_atual_e_mudanca_ja_feita_responde_na_hora(self):
+        _nova_ficha("00000000001")
+        inicio = self.client.get("/painel/aguardar/").json()
+        self.assertEqual(inicio["fichas"], [])
+        self.assertFalse(inicio["mudou"])
+
+        ficha = _nova_ficha("00000000002")
+        resposta = self.client.get("/painel/aguardar/", {"cursor": inicio["cursor"], "timeout": 5}).json()
+        self.assertTrue(resposta["mudou"])
+        self.assertEqual([(f["id"], f["status"], f["anterior"]) for f in resposta["fichas"]], [(ficha.id, "CHEGADA", None)])
+
+        resposta = self.client.get("/painel/aguardar/", {"cursor": resposta["cursor"], "timeout": 0}).json()
+        self.assertFalse(resposta["mudou"])
+
+    def test_filtra_por_status_e_unidade(self):
+        outra = Unidade.objects.create(nome="Outra", slug="outra")
+        cursor = self.client.get("/painel/aguardar/").json()["cursor"]
+        ficha = _nova_ficha("00000000001")
+        _nova_ficha("00000000002", unidade_id=outra.id)
+
+        dados = {"cursor": cursor, "timeout": 0}
+        self.assertFalse(self.client.get("/painel/aguardar/", {**dados, "status": "TRIADO"}).json()["mudou"])
+        resposta = self.client.get("/painel/aguardar/", {**dados, "status": "CHEGADA"}).json()
+        self.assertEqual([f["id"] for f in resposta["fichas"]], [ficha.id])
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get("/painel/aguardar/", {"cursor": "abc"}).status_code, 400)
+
+    def test_eventos_das_outras_unidades_nem_saem_do_banco(self):
+        outra = Unidade.objects.create(nome="Outra", slug="outra")
+        cursor = trilha.cursor_atual()
+        ficha = _nova_ficha("00000000001")
+        _nova_ficha("00000000002", unidade_id=outra.id)
+
+        eventos, _ = trilha.eventos_apos(cursor, unidade_id=UNIDADE)
+        self.assertEqual([e.ficha_id for e in eventos], [ficha.id])
+        with CaptureQueriesContext(connection) as consultas:
+            espera.mudancas(UNIDADE, cursor)
+        self.assertIn("unidade_id =", consultas.captured_queries[-1]["sql"])
+
+    def test_transacao_esquecida_aberta_nao_segura_a_tv(self):
+        cursor = self.client.get("/painel/aguardar/").json()["cursor"]
+        # Outra conexão grava e fica com a transação aberta (um psql esquecido)
+        esquecida = connections.create_connection(DEFAULT_DB_ALIAS)
+        self.addCleanup(esquecida.close)
+        with esquecida.cursor() as outro:
+            outro.execute("BEGIN")
+            outro.execute("SELECT pg_current_xact_id()")
+        ficha = _nova_ficha("00000000001")
+
+        # Leitor estrito (API de integração): continua esperando a transação
+        self.assertEqual(trilha.eventos_apos(cursor)[0], [])
+        with mock.patch.object(trilha, "PARADA_MAXIMA", 0.5), \
+                self.assertLogs("attendance.trilha", "WARNING") as logs:
+            resposta = self.client.get("/painel/aguardar/", {"cursor": cursor, "timeout": 3}).json()
+        self.assertEqual([f["id"] for f in resposta["fichas"]], [ficha.id])
+        self.assertEqual(logs.records[0].evento, "trilha_transacao_parada")
+
+    def test_telas_das_estacoes_esperam_pelo_long_poll(self):
+        _nova_ficha("00000000001")
+        cursor = trilha.cursor_atual()
+        self.client.force_login(get_user_model().objects.create_user("lancamento", password="x", is_staff=True))
+        for url, status in (("/triagem/", "CHEGADA,CHAMADO_TRIAGEM,EM_TRIAGEM"), ("/lancamento/", "TRIADO,AGUARDANDO_MEDICO")):
+            resposta = self.client.get(url)
+            self.assertContains(resposta, "/painel/aguardar/")
+            self.assertContains(resposta, f"status={status}")
+            self.assertEqual(resposta.context["cursor_aguardar"], cursor)
+
+    async def test_segura_ate_a_fila_mudar(self):
+        ficha = await sync_to_async(_nova_ficha)()
+        cursor = (await self.async_client.get("/painel/aguardar/")).json()["cursor"]
+
+        pedido = asyncio.ensure_future(
+            self.async_client.get("/painel/aguardar/", {"cursor": cursor, "timeout": 5, "status": "CHAMADO_TRIAGEM"})
+        )
+        await asyncio.sleep(0.2)
+        self.assertFalse(pedido.done())
+        await sync_to_async(chamar_para_triagem)(ficha.id)
+
+        resposta = (await asyncio.wait_for(pedido, 4)).json()
+        self.assertEqual(
+            [(f["id"], f["status"], f["anterior"]) for f in resposta["fichas"]], [(ficha.id, "CHAMADO_TRIAGEM", "CHEGADA")],
+        )
+
+
+class PostgresBrokerTests(TransactionTestCase):
+    """NOTIFY só é entregue depois do commit."""
+
+    serialized_rollback = True
+
+    async def test_entrega_por_listen_notify_so_para_a_unidade(self):
+        broker = PostgresBroker()
+        self.addCleanup(broker.encerrar)
+        assinatura = broker.assinar(UNIDADE)
+        self.assertTrue(await asyncio.to_thread(broker.escutando.wait, 5))
+
+        await sync_to_async(broker.publicar)({"id": 1, "unidade_id": UNIDADE + 1, "status": "CHEGADA"})
+        await sync_to_async(broker.publicar)({"id": 2, "unidade_id": UNIDADE, "status": "CHEGADA"})
+        self.assertEqual((await assinatura.receber(timeout=5))["id"], 2)
+        await assinatura.fechar()
+
+
+class TransicoesTests(TestCase):
+    def setUp(self):
+        _limpar_caches()
+
+    def test_transicao_e_um_unico_comando(self):
+        ficha = _nova_ficha()
+        with CaptureQueriesContext(connection) as consultas:
+            chamada = chamar_para_triagem(ficha.id)
+
+        comandos = [q["sql"] for q in consultas.captured_queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(comandos), 1)
+        self.assertEqual((chamada.status, chamada.status_anterior), ("CHAMADO_TRIAGEM", "CHEGADA"))
+        self.assertIsNotNone(chamada.chamado_em)
+
+    def test_resumo_da_ficha_transicionada_nao_volta_ao_banco(self):
+        ficha = _nova_ficha()
+        chamar_para_triagem(ficha.id)
+        finalizar_triagem(ficha.id, {"prioridade": "AMARELO", "temperatura": "38.2"})
+        medico = get_user_model().objects.create_user("drcarlos", first_name="Carlos")
+
+        roteada = rotear_para_medico(ficha.id, medico.id, "Consultório 2")
+        with self.assertNumQueries(0):
+            resumo = roteada.resumo()
+        self.assertEqual(
+            (resumo["paciente"]["nome"], resumo["medico"], resumo["temperatura"], resumo["status"]),
+            ("Maria da Silva", "Carlos", "38.2", "CHAMADO_MEDICO"),
+        )
+        self.assertEqual(roteada.criado_em, FichaAtendimento.objects.get(id=ficha.id).criado_em)
+        chamada = chamar_para_triagem(_nova_ficha("222.333.444-55").id)
+        with self.assertNumQueries(0):
+            self.assertIsNone(chamada.medico_atendente)
+
+    def test_transicao_ilegal_e_recusada_sem_mudar_nada(self):
+        ficha = _nova_ficha()
+        with self.assertRaises(TransicaoInvalida) as erro:
+            finalizar_atendimento_medico(ficha.id)
+
+        self.assertEqual(erro.exception.atual, "CHEGADA")
+        ficha.refresh_from_db()
+        self.assertEqual((ficha.status, ficha.finalizado_em), ("CHEGADA", None))
+        self.assertEqual(FichaEvento.objects.filter(ficha_id=ficha.id).count(), 1)  # só a criação
+
+        with self.assertRaises(FichaAtendimento.DoesNotExist):
+            chamar_para_triagem(ficha.id + 1000)
+
+    def test_triagem_grava_dados_convertidos_e_ordem_manchester(self):
+        ficha = _nova_ficha()
+        chamar_para_triagem(ficha.id)
+        triada = finalizar_triagem(ficha.id, {"prioridade": "LARANJA", "pa_sistolica": "120", "temperatura": "37.5"})
+
+        self.assertEqual((triada.status, triada.prioridade_ordem, triada.pa_sistolica), ("TRIADO", 2, 120))
+        self.assertEqual(str(triada.temperatura), "37.5")
+
+    def test_views_respondem_conflito_no_segundo_clique(self):
+        ficha = _nova_ficha()
+        chamar_para_triagem(ficha.id)
+
+        self.assertEqual(self.client.get(f"/triagem/atendimento/{ficha.id}/").status_code, 200)
+        resposta = self.client.get(f"/triagem/atendimento/{ficha.id}/")
+        self.assertEqual(resposta.status_code, 409)
+        self.assertEqual(resposta.json()["atual"], "EM_TRIAGEM")
+        self.assertEqual(self.client.get("/triagem/atendimento/999999/").status_code, 404)
+
+
+class VisitasTests(TestCase):
+    """Resumo de visitas do paciente (attendance/visitas.py)."""
+
+    def setUp(self):
+        _limpar_caches()
+        self.client.force_login(get_user_model().objects.create_superuser("enfermeira", password="x"))
+
+    def _visita(self, sinais, finalizar=False):
+        ficha = _nova_ficha(cpf="11122233344")
+        chamar_para_triagem(ficha.id)
+        finalizar_triagem(ficha.id, sinais)
+        if finalizar:
+            rotear_para_medico(ficha.id, get_user_model().objects.get().id, "Consultório 1")
+            finalizar_atendimento_medico(ficha.id)
+        return ficha
+
+    def test_triagem_e_consulta_atualizam_o_resumo(self):
+        primeira = self._visita({"prioridade": "VERDE", "pa_sistolica": "120", "temperatura": "36.5"}, finalizar=True)
+        segunda = self._visita({"prioridade": "LARANJA", "pa_sistolica": "150", "temperatura": "38.2"})
+
+        with self.assertNumQueries(1):
+            resumo = visitas.resumo(primeira.paciente_id)
+        self.assertEqual(resumo["total"], 2)
+        self.assertEqual(resumo["ultima_prioridade"], "LARANJA")
+        self.assertEqual((resumo["sinais"]["pa_sistolica"], resumo["sinais"]["temperatura"]), (150, "38.2"))
+        self.assertEqual([v["id"] for v in resumo["visitas"]], [segunda.id, primeira.id])
+        self.assertEqual(resumo["visitas"][1]["status"], "FINALIZADO")
+        self.assertEqual(resumo["visitas"][1]["medico"], "enfermeira")
+        self.assertIsNone(resumo["proximo"])
+
+        # A próxima triagem do paciente já mostra o histórico
+        terceira = _nova_ficha(cpf="11122233344")
+        self.assertContains(self.client.get(f"/triagem/finalizar/{terceira.id}/"), "2 visitas")
+
+    def test_api_pagina_visitas_antigas_por_cursor(self):
+        fichas = [self._visita({"prioridade": "AZUL", "frequencia_cardiaca": str(70 + i)}) for i in range(8)]
+        url = f"/pacientes/{fichas[0].paciente_id}/visitas/"
+
+        resumo = self.client.get(url).json()
+        self.assertEqual(resumo["total"], 8)
+        self.assertEqual(len(resumo["visitas"]), visitas.VISITAS_NO_RESUMO)
+        pagina = self.client.get(url, {"apos": resumo["proximo"], "limite": 2}).json()
+        self.assertEqual([v["id"] for v in pagina["visitas"]], [fichas[2].id, fichas[1].id])
+        pagina = self.client.get(url, {"apos": pagina["proximo"], "limite": 2}).json()
+        self.assertEqual(([v["id"] for v in pagina["visitas"]], pagina["proximo"]), ([fichas[0].id], None))
+        self.assertEqual(self.client.get(url, {"apos": "lixo"}).status_code, 400)
+
+    def test_comando_monta_resumo_de_quem_nao_tem(self):
+        ficha = self._visita({"prioridade": "AMARELO", "pa_diastolica": "90"}, finalizar=True)
+        esperado = visitas.resumo(ficha.paciente_id)
+        ResumoVisitas.objects.all().delete()
+        with self.settings(ARQUIVO_FICHAS_DIAS=0):
+            call_command("arquivar_fichas", stdout=StringIO())  # o histórico vem também do arquivo
+        self.assertTrue(FichaArquivada.objects.filter(id=ficha.id).exists())
+
+        call_command("resumir_visitas", stdout=StringIO())
+        self.assertEqual(visitas.resumo(ficha.paciente_id), esperado)
+
+
+class TransicoesConcorrenciaTests(TransactionTestCase):
+    # A unidade principal vem da migration: o flush do TransactionTestCase a apagaria
+    serialized_rollback = True
+    ESTACOES = 8
+
+    def setUp(self):
+        _limpar_caches()
+
+    def test_cliques_simultaneos_so_um_vence(self):
+        ficha = _nova_ficha()
+        chamar_para_triagem(ficha.id)
+        largada = threading.Barrier(self.ESTACOES)
+
+        def estacao(_):
+            try:
+                largada.wait(5)
+                iniciar_triagem(ficha.id)
+                return "ok"
+            except TransicaoInvalida as exc:
+                return exc.atual
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.ESTACOES) as pool:
+            resultados = list(pool.map(estacao, range(self.ESTACOES)))
+
+        self.assertEqual(resultados.count("ok"), 1)
+        self.assertEqual(resultados.count("EM_TRIAGEM"), self.ESTACOES - 1)
+        self.assertEqual(FichaEvento.objects.filter(ficha_id=ficha.id, para="EM_TRIAGEM").count(), 1)
+
+
+class DespachoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.ana = User.objects.create_user("ana", password="x", is_staff=True)
+        cls.beto = User.objects.create_user("beto", password="x", is_staff=True)
+
+    def setUp(self):
+        _limpar_caches()
+        self.addCleanup(_limpar_caches)
+        fila_cache.reconstruir(UNIDADE)
+
+    def _triar(self, cpf, cor):
+        with self.captureOnCommitCallbacks(execute=True):
+            ficha = _nova_ficha(cpf=cpf)
+        with self.captureOnCommitCallbacks(execute=True):
+            chamar_para_triagem(ficha.id)
+            finalizar_triagem(ficha.id, {"prioridade": cor})
+        return FichaAtendimento.objects.get(id=ficha.id)
+
+    def test_sem_plantao_ficha_fica_para_o_lancamento(self):
+        ficha = self._triar("00000000001", "AMARELO")
+        self.assertEqual((ficha.status, ficha.medico_atendente_id), ("TRIADO", None))
+
+    def test_encaminha_para_a_fila_mais_curta(self):
+        PlantaoMedico.objects.create(unidade_id=UNIDADE, medico=self.ana, sala="Sala 01")
+        PlantaoMedico.objects.create(unidade_id=UNIDADE, medico=self.beto, sala="Sala 02")
+
+        medicos = [self._triar(f"0000000000{i}", "VERDE").medico_atendente_id for i in range(1, 5)]
+
+        self.assertEqual(sorted(medicos), sorted([self.ana.id, self.beto.id] * 2))
+        ficha = FichaAtendimento.objects.get(medico_atendente=self.beto, codigo="A002")
+        self.assertEqual((ficha.status, ficha.local_atendimento), ("AGUARDANDO_MEDICO", "Sala 02"))
+        self.assertEqual(fila_cache.contar(UNIDADE, fila_cache.fila_medico(self.ana.id)), 2)
+
+    def test_grave_nao_conta_quem_fica_atras_e_desempata_pelo_tempo_de_consulta(self):
+        PlantaoMedico.objects.create(unidade_id=UNIDADE, medico=self.ana, sala="Sala 01")
+        for i in range(3):
+            self._triar(f"0000000001{i}", "VERDE")  # todos para a Ana
+        PlantaoMedico.objects.create(unidade_id=UNIDADE, medico=self.beto, sala="Sala 02")
+        despacho.registrar_consulta(self.beto.id, 60)  # Beto bem mais lento
+
+        # Na fila da Ana o VERMELHO passa na frente dos três VERDES
+        self.assertEqual(self._triar("00000000020", "VERMELHO").medico_atendente_id, self.ana.id)
+        self.assertEqual(self._triar("00000000021", "VERDE").medico_atendente_id, self.beto.id)
+
+    def test_entrar_no_plantao_distribui_os_triados_pendentes(self):
+        self._triar("00000000001", "VERDE")
+        self._triar("00000000002", "VERMELHO")
+        self.client.force_login(self.ana)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/medico/plantao/", {"sala": "Sala 03"})
+
+        self.assertEqual(fila_cache.contar(UNIDADE, "TRIADO"), 0)
+        fila = fila_cache.fila(UNIDADE, fila_cache.fila_medico(self.ana.id))
+        self.assertEqual([(f["codigo"], f["local"]) for f in fila], [("A002", "Sala 03"), ("A001", "Sala 03")])
+        self.assertContains(self.client.get("/medico/"), "A002")
+
+        self.client.post("/medico/plantao/", {"sair": "1"})
+        self.assertFalse(PlantaoMedico.objects.exists())
+
+    def test_lancamento_troca_o_medico_escolhido(self):
+        PlantaoMedico.objects.create(unidade_id=UNIDADE, medico=self.ana, sala="Sala 01")
+        ficha = self._triar("00000000001", "AMARELO")
+        self.client.force_login(self.beto)
+
+        self.assertContains(self.client.get("/lancamento/"), "Encaminhados automaticamente")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/lancamento/rotear/{ficha.id}/", {"medico_id": self.beto.id, "local": "Sala 09"})
+
+        ficha.refresh_from_db()
+        self.assertEqual((ficha.status, ficha.medico_atendente_id, ficha.local_atendimento),
+                         ("CHAMADO_MEDICO", self.beto.id, "Sala 09"))
+        self.assertEqual(fila_cache.contar(UNIDADE, fila_cache.fila_medico(self.ana.id)), 0)
+
+    def test_finalizar_atualiza_o_tempo_medio_do_medico(self):
+        PlantaoMedico.objects.create(unidade_id=UNIDADE, medico=self.ana, sala="Sala 01")
+        ficha = self._triar("00000000001", "AMARELO")
+        with self.captureOnCommitCallbacks(execute=True):
+            chamar_para_medico(ficha.id)
+        FichaAtendimento.objects.filter(id=ficha.id).update(chamado_em=timezone.now() - timedelta(minutes=25))
+        with self.captureOnCommitCallbacks(execute=True):
+            finalizar_atendimento_medico(ficha.id)
+
+        # 0.2 * 25 + 0.8 * 15 (padrão)
+        self.assertAlmostEqual(despacho.tempos_de_consulta([self.ana.id])[self.ana.id], 17, places=1)
+
+
+class PrevisaoEsperaTests(TestCase):
+    def setUp(self):
+        _limpar_caches()
+        self.addCleanup(_limpar_caches)
+        fila_cache.reconstruir(UNIDADE)
+        self.relogio = timezone.now()
+
+    def _chegar(self, cpf):
+        with self.captureOnCommitCallbacks(execute=True):
+            return _nova_ficha(cpf=cpf)
+
+    def _chamar_triagem(self, ficha, minutos_depois):
+        self.relogio += timedelta(minutes=minutos_depois)
+        with mock.patch("attendance.transicoes.timezone.now", return_value=self.relogio), \
+                self.captureOnCommitCallbacks(execute=True):
+            return chamar_para_triagem(ficha.id)
+
+    def test_ritmo_aprendido_a_cada_chamada(self):
+        fichas = [self._chegar(f"0000000000{i}") for i in range(1, 5)]
+        self.assertEqual(previsao.intervalos(UNIDADE)["triagem"], previsao.INTERVALO_PADRAO["triagem"])
+
+        self._chamar_triagem(fichas[0], 0)
+        self._chamar_triagem(fichas[1], 10)
+        self.assertEqual(previsao.intervalos(UNIDADE)["triagem"], 10)
+        self._chamar_triagem(fichas[2], 60)  # pausa longa: não entra na média
+        self._chamar_triagem(fichas[3], 5)
+        self.assertEqual(previsao.intervalos(UNIDADE)["triagem"], 9)  # 0.2 * 5 + 0.8 * 10
+
+        # Cache frio: reaprende com a trilha de eventos numa consulta só
+        cache.delete(previsao._chave(UNIDADE))
+        with mock.patch("attendance.previsao.timezone.now", return_value=self.relogio), \
+                self.assertNumQueries(1):
+            self.assertEqual(previsao.intervalos(UNIDADE)["triagem"], 9)
+
+    def test_paineis_e_senha_trazem_a_previsao(self):
+        for i in range(1, 4):
+            self._chegar(f"0000000000{i}")
+
+        dados = self.client.get("/painel/recepcao/snapshot/").json()
+        self.assertEqual([p["espera_min"] for p in dados["proximos"]], [5, 10, 15])
+        self.assertEqual(dados["minutos_por_chamada"], 5)
+
+        resposta = self.client.post("/recepcao/", {"nome": "Quarto", "cpf": "00000000004"})
+        self.assertEqual(resposta.context["espera_min"], 20)
+        self.assertContains(resposta, "~20 min")
+
+    def test_consultorio_conta_encaminhados_mais_graves_na_frente(self):
+        verde, vermelho = self._chegar("00000000001"), self._chegar("00000000002")
+        with self.captureOnCommitCallbacks(execute=True):
+            for ficha, cor in ((verde, "VERDE"), (vermelho, "VERMELHO")):
+                chamar_para_triagem(ficha.id)
+                finalizar_triagem(ficha.id, {"prioridade": cor})
+        medico = get_user_model().objects.create_user("medico")
+        with self.captureOnCommitCallbacks(execute=True):
+            transicionar(vermelho.id, "encaminhar_medico", medico_atendente_id=medico.id)
+
+        fila = self.client.get("/painel/medico/snapshot/").json()["fila"]
+        self.assertEqual([(f["codigo"], f["espera_min"]) for f in fila], [("A001", 30)])
+        self.assertEqual(previsao.prever_ficha(FichaAtendimento.objects.get(id=vermelho.id)), 15)
+
+        # Ritmo por cor: verdes chamados a cada 15 min, com vermelhos entre eles
+        estado = {}
+        for minuto, ordem in [(0, 4), (5, 1), (10, 1), (15, 4), (20, 1), (30, 4)]:
+            previsao._observar_chamada(estado, "medico", minuto * 60, ordem)
+        cache.set(previsao._chave(UNIDADE), estado, timeout=None)
+        self.assertEqual(previsao.intervalos(UNIDADE)["medico"], 6)  # geral: 5, 5, 5, 5, 10
+        # O verde tem o vermelho na frente (ritmo geral) e sai no ritmo dos verdes
+        self.assertEqual(previsao.prever_ficha(FichaAtendimento.objects.get(id=verde.id)), 6 + 15)
+        self.assertEqual(previsao.prever_ficha(FichaAtendimento.objects.get(id=vermelho.id)), 6)
+        snapshots.incrementar_versoes(UNIDADE, "TRIADO")
+        fila = self.client.get("/painel/medico/snapshot/").json()["fila"]
+        self.assertEqual([(f["codigo"], f["espera_min"]) for f in fila], [("A001", 21)])
+
+    def test_cache_frio_reaprende_o_ritmo_de_cada_cor(self):
+        fichas = [self._chegar(f"0000000000{i}") for i in range(1, 4)]
+        medico = get_user_model().objects.create_user("medico")
+        with self.captureOnCommitCallbacks(execute=True):
+            for ficha, cor in zip(fichas, ("VERDE", "VERMELHO", "VERDE")):
+                chamar_para_triagem(ficha.id)
+                finalizar_triagem(ficha.id, {"prioridade": cor})
+        for ficha, minutos in zip(fichas, (0, 4, 20)):
+            self.relogio += timedelta(minutes=minutos)
+            with mock.patch("attendance.transicoes.timezone.now", return_value=self.relogio), \
+                    self.captureOnCommitCallbacks(execute=True):
+                transicionar(ficha.id, "rotear_medico", medico_atendente_id=medico.id, local_atendimento="Sala 01")
+
+        # Cache frio: a gravidade de cada chamada vem da ficha, na mesma consulta da trilha
+        cache.delete(previsao._chave(UNIDADE))
+        with self.assertNumQueries(1):
+            estado = previsao._estado(UNIDADE)
+        self.assertEqual(previsao.intervalo_da_prioridade(estado, "medico", 4), 24)
+        self.assertEqual(previsao.intervalo_da_prioridade(estado, "medico", 1), previsao.intervalos(UNIDADE)["medico"])
+
+
+class MultiUnidadeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.norte = Unidade.objects.create(nome="UPA Norte", slug="norte")
+        cls.medico = get_user_model().objects.create_user("medico", password="x", unidade=cls.norte)
+
+    def setUp(self):
+        _limpar_caches()
+        self.addCleanup(_limpar_caches)
+
+    def _ficha(self, cpf, unidade_id):
+        with self.captureOnCommitCallbacks(execute=True):
+            return _nova_ficha(cpf=cpf, unidade_id=unidade_id)
+
+    def test_cada_unidade_tem_suas_senhas_filas_e_paineis(self):
+        principal = self._ficha("00000000001", UNIDADE)
+        norte = self._ficha("00000000002", self.norte.id)
+        self.assertEqual((principal.codigo, norte.codigo), ("A001", "A001"))
+
+        self.assertEqual([f["id"] for f in fila_cache.fila(UNIDADE, "CHEGADA")], [principal.id])
+        self.assertEqual([f["id"] for f in fila_cache.fila(self.norte.id, "CHEGADA")], [norte.id])
+
+        # TV sem login: a unidade vem da URL; sem ela, a padrão
+        resposta = self.client.get("/painel/recepcao/snapshot/", {"unidade": "norte"})
+        self.assertEqual([f["id"] for f in resposta.json()["proximos"]], [norte.id])
+        resposta = self.client.get("/painel/recepcao/snapshot/")
+        self.assertEqual([f["id"] for f in resposta.json()["proximos"]], [principal.id])
+        self.assertEqual(self.client.get("/painel/recepcao/snapshot/", {"unidade": "sul"}).status_code, 404)
+
+        # Mudança numa unidade não invalida o painel da outra
+        etag = self.client.get("/painel/recepcao/snapshot/")["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            chamar_para_triagem(norte.id)
+        with self.assertNumQueries(0):
+            resposta = self.client.get("/painel/recepcao/snapshot/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+    def test_despacho_so_usa_plantao_da_mesma_unidade(self):
+        self.client.force_login(self.medico)
+        self.client.post("/medico/plantao/", {"sala": "Sala 01"})
+        self.assertEqual(PlantaoMedico.objects.get(medico=self.medico).unidade_id, self.norte.id)
+
+        for cpf, unidade_id in [("00000000001", UNIDADE), ("00000000002", self.norte.id)]:
+            ficha = self._ficha(cpf, unidade_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                chamar_para_triagem(ficha.id)
+                finalizar_triagem(ficha.id, {"prioridade": "VERDE"})
+
+        self.assertEqual(
+            dict(FichaAtendimento.objects.values_list("unidade_id", "status")),
+            {UNIDADE: "TRIADO", self.norte.id: "AGUARDANDO_MEDICO"},
+        )
+        self.assertEqual(len(self.client.get("/medico/").context["fila_espera"]), 1)
+
+
+class TesteCargaTests(TransactionTestCase):
+    """As threads do teste de carga usam conexões próprias: os dados precisam estar comitados."""
+
+    databases = "__all__"  # com DB_REPLICAS, painéis e listas leem das réplicas
+    serialized_rollback = True
+
+    def setUp(self):
+        _limpar_caches()
+        self.addCleanup(_limpar_caches)
+
+    def test_semeia_simula_grava_e_compara(self):
+        self.assertEqual(carga.semear_pacientes(50), 50)
+        self.assertEqual(carga.semear_pacientes(50), 0)
+        self.assertEqual(carga.semear_fichas(400, [UNIDADE], dias=30), 400)
+        self.assertEqual(carga.semear_fichas(400, [UNIDADE], dias=30), 0)
+        self.assertEqual(FichaHistorico.objects.filter(codigo__startswith="H").count(), 400)
+        self.assertTrue(FichaArquivada.objects.filter(codigo__startswith="H").exists())
+
+        with tempfile.TemporaryDirectory() as pasta:
+            saida = Path(pasta) / "carga.jsonl"
+            argumentos = ["--duracao", "2", "--pausa", "0.05", "--intervalo-tv", "0.2", "--saida", str(saida)]
+            call_command("teste_carga", *argumentos, stdout=StringIO())
+            call_command("teste_carga", *argumentos, stdout=StringIO())
+            primeira, segunda = [json.loads(linha) for linha in saida.read_text().splitlines()]
+
+        self.assertEqual(segunda["falhas"], [])
+        self.assertEqual(primeira["parametros"], segunda["parametros"])
+        endpoints = segunda["endpoints"]
+        for endpoint in [
+            "POST attendance:recepcao_gerar_senha", "GET attendance:triagem_lista",
+            "GET attendance:medico_atendimento", "GET attendance:painel_snapshot",
+        ]:
+            self.assertGreater(endpoints[endpoint]["requisicoes"], 0, endpoint)
+            self.assertEqual(endpoints[endpoint]["erros"], 0, endpoint)
+        triagem = endpoints["GET attendance:triagem_lista"]
+        self.assertLessEqual(triagem["p50_ms"], triagem["p95_ms"])
+        self.assertLessEqual(triagem["p95_ms"], triagem["p99_ms"])
+        # Médicos saem do plantão no fim
+        self.assertFalse(PlantaoMedico.objects.exists())
+
+        pior = json.loads(json.dumps(segunda))
+        pior["endpoints"]["GET attendance:triagem_lista"]["p95_ms"] *= 2
+        self.assertEqual(
+            [r[0] for r in carga.comparar(pior, segunda)], ["GET attendance:triagem_lista"],
+        )
+
+    def test_compara_caminho_sincrono_e_assincrono_do_painel(self):
+        _nova_ficha()
+        saida = StringIO()
+        call_command("teste_carga", "--conexoes", "4", "--duracao", "0.5", stdout=saida)
+        self.assertIn("async", saida.getvalue())
+
+        resultado = carga.comparar_caminhos(Unidade.objects.get(id=UNIDADE), 4, 0.5, caminhos=("async",))
+        self.assertEqual(list(resultado), ["async"])
+        self.assertGreater(resultado["async"]["requisicoes"], 0)
+        self.assertEqual(resultado["async"]["erros"], 0)
+        self.assertEqual(resultado["async"]["threads"], 1)
+
+
+class CargaResultadosTests(SimpleTestCase):
+    def test_periodo_sem_respostas_vira_zero_requisicoes(self):
+        estatisticas = carga._estatisticas([], 1.0)
+        self.assertEqual(estatisticas["requisicoes"], 0)
+        self.assertEqual(estatisticas["p95_ms"], 0)
+        self.assertEqual(estatisticas["consultas_max"], 0)
+
+    def test_ator_sem_passo_nao_instancia(self):
+        class Parado(carga._Ator):
+            pass
+
+        with self.assertRaises(TypeError):
+            Parado(None, None)
@@ -0,0 +1,189 @@
+"""
+Máquina de estados da ficha: quem pode ir para onde.
+
+TRANSICOES é a tabela declarativa (nome -> status de origem permitidos,
+status de destino, carimbos de data). transicionar() aplica uma transição
+num único comando:
+
+    UPDATE ficha SET status = ..., <campos> WHERE id = ... AND status IN (<origens>)
+    RETURNING ...
+
+junto com o INSERT do evento na trilha (FichaEvento), via CTE. Sem
+SELECT ... FOR UPDATE antes: a linha fica travada só durante o próprio
+UPDATE, e só as colunas que mudaram são escritas. Se outra estação mudou a
+ficha antes (dois cliques, duas enfermeiras), o WHERE não casa mais e
+a transição é recusada com TransicaoInvalida em vez de sobrescrever.
+
+O SELECT final já junta paciente e médico à linha do RETURNING: o resumo()
+que os ouvintes do signal montam (painéis, cache das filas) não volta ao banco.
+"""
+from dataclasses import dataclass
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import FichaAtendimento, FichaEvento
+from .signals import ficha_transicionada
+
+Status = FichaAtendimento.Status
+
+
+class TransicaoInvalida(Exception):
+    """A ficha não está num status de onde essa transição pode sair."""
+
+    def __init__(self, ficha_id, transicao, atual):
+        self.ficha_id = ficha_id
+        self.transicao = transicao
+        self.atual = atual
+        super().__init__(f"Ficha {ficha_id} em {atual}: não pode {transicao}.")
+
+
+@dataclass(frozen=True)
+class Transicao:
+    origens: tuple
+    destino: str
+    # Colunas de data preenchidas com o horário da transição
+    carimbos: tuple = ()
+    # Colunas que quem chama pode (ou deve) informar
+    campos: tuple = ()
+
+
+TRANSICOES = {
+    # TV 01: chamar de novo quem não apareceu também vale
+    "chamar_triagem": Transicao(
+        origens=(Status.CHEGADA, Status.CHAMADO_TRIAGEM), destino=Status.CHAMADO_TRIAGEM,
+        carimbos=("chamado_em",),
+    ),
+    "iniciar_triagem": Transicao(origens=(Status.CHAMADO_TRIAGEM,), destino=Status.EM_TRIAGEM),
+    "finalizar_triagem": Transicao(
+        origens=(Status.CHAMADO_TRIAGEM, Status.EM_TRIAGEM), destino=Status.TRIADO,
+        campos=("prioridade", "pa_sistolica", "pa_diastolica", "temperatura",
+                "frequencia_cardiaca", "observacoes_triagem"),
+    ),
+    # Lançamento: manda para o consultório (e a TV 02 já chama)
+    "rotear_medico": Transicao(
+        origens=(Status.TRIADO, Status.AGUARDANDO_MEDICO), destino=Status.CHAMADO_MEDICO,
+        carimbos=("chamado_em",), campos=("medico_atendente_id", "local_atendimento"),
+    ),
+    # Despacho automático (despacho.py) ou troca manual no lançamento: entra na
+    # fila do médico sem chamar ainda
+    "encaminhar_medico": Transicao(
+        origens=(Status.TRIADO, Status.AGUARDANDO_MEDICO), destino=Status.AGUARDANDO_MEDICO,
+        campos=("medico_atendente_id", "local_atendimento"),
+    ),
+    "chamar_medico": Transicao(
+        origens=(Status.AGUARDANDO_MEDICO, Status.CHAMADO_MEDICO), destino=Status.CHAMADO_MEDICO,
+        carimbos=("chamado_em",),
+    ),
+    "finalizar_atendimento": Transicao(
+        origens=(Status.CHAMADO_MEDICO, Status.EM_ATENDIMENTO), destino=Status.FINALIZADO,
+        carimbos=("finalizado_em",),
+    ),
+}
+
+
+def _valores(transicao: Transicao, campos: dict, agora) -> dict:
+    """{coluna: valor já convertido para o banco}, do jeito que o save() converteria."""
+    desconhecidos = set(campos) - set(transicao.campos)
+    if desconhecidos:
+        raise TypeError(f"Campos não aceitos nessa transição: {', '.join(sorted(desconhecidos))}.")
+
+    valores = {}
+    for nome, valor in campos.items():
+        field = FichaAtendimento._meta.get_field(nome)
+        valores[field.column] = field.get_db_prep_save(field.to_python(valor), connection)
+    if "prioridade" in campos:
+        valores["prioridade_ordem"] = FichaAtendimento.ordem_da_prioridade(campos["prioridade"])
+    for carimbo in (*transicao.carimbos, "atualizado_em"):
+        valores[carimbo] = agora
+    return valores
+
+
+# FKs que FichaAtendimento.resumo() lê: vêm no mesmo comando da transição
+RELACIONADAS = ("paciente", "medico_atendente")
+
+
+def _colunas(model, tabela: str, prefixo: str = "") -> list:
+    quote = connection.ops.quote_name
+    return [f"{tabela}.{quote(f.column)} AS {quote(prefixo + f.attname)}" for f in model._meta.concrete_fields]
+
+
+def _instancia(model, valores):
+    """Instância carregada do banco, com os mesmos conversores que o ORM aplicaria."""
+    fields = model._meta.concrete_fields
+    convertidos = []
+    for field, valor in zip(fields, valores):
+        coluna = field.get_col(model._meta.db_table)
+        for converter in connection.ops.get_db_converters(coluna) + coluna.get_db_converters(connection):
+            valor = converter(valor, coluna, connection)
+        convertidos.append(valor)
+    return model.from_db(connection.alias, [f.attname for f in fields], convertidos)
+
+
+def _montar(linha: tuple) -> FichaAtendimento:
+    """A ficha do RETURNING com as RELACIONADAS já no cache (None se a FK é nula)."""
+    inicio = len(FichaAtendimento._meta.concrete_fields)
+    ficha = _instancia(FichaAtendimento, linha[:inicio])
+    for nome in RELACIONADAS:
+        model = FichaAtendimento._meta.get_field(nome).related_model
+        valores = linha[inicio:inicio + len(model._meta.concrete_fields)]
+        inicio += len(valores)
+        setattr(ficha, nome, _instancia(model, valores) if valores[0] is not None else None)
+    return ficha
+
+
+def transicionar(ficha_id: int, nome: str, ator=None, **campos) -> FichaAtendimento:
+    """
+    Aplica TRANSICOES[nome] na ficha e devolve a ficha já atualizada.
+    TransicaoInvalida se o status atual não permite; DoesNotExist se a ficha não existe.
+    Painéis e ouvintes são avisados depois do commit (signal ficha_transicionada).
+    """
+    transicao = TRANSICOES[nome]
+    agora = timezone.now()
+    valores = _valores(transicao, campos, agora)
+
+    quote = connection.ops.quote_name
+    ficha_tabela = quote(FichaAtendimento._meta.db_table)
+    atribuicoes = ", ".join(f"{quote(coluna)} = %s" for coluna in valores)
+    origens = ", ".join(["%s"] * len(transicao.origens))
+    selecionadas = _colunas(FichaAtendimento, "alterada")
+    juncoes = []
+    for indice, relacionada in enumerate(RELACIONADAS):
+        field = FichaAtendimento._meta.get_field(relacionada)
+        apelido = f"r{indice}"
+        selecionadas += _colunas(field.related_model, apelido, f"{relacionada}__")
+        juncoes.append(
+            f"LEFT JOIN {quote(field.related_model._meta.db_table)} {apelido} "
+            f"ON {apelido}.{quote(field.target_field.column)} = alterada.{quote(field.column)}"
+        )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH alterada AS (
+                UPDATE {ficha_tabela}
+                SET status_anterior = status, status = %s, {atribuicoes}
+                WHERE id = %s AND status IN ({origens})
+                RETURNING *
+            ), evento AS (
+                INSERT INTO {quote(FichaEvento._meta.db_table)} (ficha_id, unidade_id, de, para, ator_id, em)
+                SELECT id, unidade_id, status_anterior, status, %s, %s FROM alterada
+            )
+            SELECT {", ".join(selecionadas)} FROM alterada {" ".join(juncoes)}
+            """,
+            [transicao.destino, *valores.values(), ficha_id, *transicao.origens, getattr(ator, "pk", ator), agora],
+        )
+        linha = cursor.fetchone()
+        if linha is None:
+            # Caminho raro (clique repetido, corrida): descobre o porquê
+            atual = FichaAtendimento.objects.filter(id=ficha_id).values_list("status", flat=True).first()
+            if atual is None:
+                raise FichaAtendimento.DoesNotExist(f"Ficha {ficha_id} não existe.")
+            raise TransicaoInvalida(ficha_id, nome, atual)
+
+        ficha = _montar(linha)
+        transaction.on_commit(
+            lambda: ficha_transicionada.send(sender=FichaAtendimento, ficha=ficha, anterior=ficha.status_anterior),
+            robust=True,
+        )
+    return ficha
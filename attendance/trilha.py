@@ -0,0 +1,150 @@
+"""
+Trilha de eventos das fichas (FichaEvento): gravação e leitura por cursor.
+
+Toda transição feita em services.py grava um evento na MESMA transação da
+mudança de status: se a transição sofrer rollback, o evento some junto.
+
+Leitura (painéis, reports, integrações): eventos_apos(cursor) devolve os
+eventos seguintes em lotes. O cursor NÃO é só o id: ids saem da sequence
+antes do commit, então um evento de id menor pode aparecer depois de um de
+id maior já lido. Cada evento guarda o xid da transação que o gravou, e a
+leitura só entrega eventos de transações mais antigas que a mais antiga
+ainda em andamento (pg_snapshot_xmin). Ordenando por (transacao, id),
+nada que ainda vai aparecer fica para trás do cursor.
+
+Consequência: enquanto uma transação de escrita estiver aberta, os eventos
+gravados depois dela esperam. As transações das services duram milissegundos,
+e os lotes (importação de pacientes, arquivamento, carga de teste) comitam
+a cada lote: não rode nenhum deles dentro de uma transação maior.
+
+Mesmo assim uma transação esquecida aberta (psql, script) seguraria a trilha
+inteira. Quem prefere seguir a esperar (long-poll das TVs, espera.py) passa
+parada_maxima: transação em andamento há mais que isso (vista por este
+processo) deixa de segurar a leitura, e os eventos que ela gravar ficam
+para trás do cursor, ou seja, perdidos para esse leitor. A API de
+integração continua no modo estrito.
+"""
+import logging
+import threading
+import time
+
+from django.db import connection
+
+from .models import FichaEvento
+
+logger = logging.getLogger(__name__)
+
+CURSOR_INICIAL = "0.0"
+LIMITE_MAXIMO = 1000
+# Segundos que o long-poll espera uma transação aberta antes de passar por ela
+PARADA_MAXIMA = 10
+
+# xid em andamento -> {"desde": quando este processo o viu primeiro, "avisado"}
+_em_andamento = {}
+_em_andamento_lock = threading.Lock()
+
+
+def registrar(ficha, anterior, ator=None) -> FichaEvento:
+    """Grava a transição que acabou de acontecer (chamar dentro da transação dela)."""
+    return FichaEvento.objects.create(
+        ficha_id=ficha.id, unidade_id=ficha.unidade_id, de=anterior, para=ficha.status, ator=ator,
+    )
+
+
+def registrar_varios(eventos) -> None:
+    """Vários eventos num único INSERT (operações em lote)."""
+    FichaEvento.objects.bulk_create(eventos)
+
+
+def _ler_cursor(cursor: str | None) -> tuple[int, int]:
+    transacao, _, ultimo_id = (cursor or CURSOR_INICIAL).partition(".")
+    try:
+        return int(transacao), int(ultimo_id)
+    except ValueError:
+        raise ValueError(f"Cursor inválido: {cursor!r}.")
+
+
+def _limite_tolerante(parada_maxima: float) -> int:
+    """
+    Primeiro xid que a leitura ainda espera: o menor em andamento que não
+    passou de parada_maxima segundos (ou o xmax do snapshot, se nenhum).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT pg_snapshot_xmax(s)::text::bigint, ARRAY(SELECT pg_snapshot_xip(s)::text::bigint)
+            FROM pg_current_snapshot() AS s
+            """
+        )
+        xmax, em_andamento = cursor.fetchone()
+    agora = time.monotonic()
+    esperando, novos_parados = [], []
+    with _em_andamento_lock:
+        for xid in set(_em_andamento) - set(em_andamento):
+            del _em_andamento[xid]
+        for xid in em_andamento:
+            visto = _em_andamento.setdefault(xid, {"desde": agora, "avisado": False})
+            if agora - visto["desde"] < parada_maxima:
+                esperando.append(xid)
+            elif not visto["avisado"]:
+                visto["avisado"] = True
+                novos_parados.append(xid)
+    for xid in novos_parados:
+        logger.warning(
+            "Transação %s aberta há mais de %s s: a trilha segue sem ela", xid, parada_maxima,
+            extra={"evento": "trilha_transacao_parada", "xid": xid},
+        )
+    return min(esperando, default=xmax)
+
+
+def eventos_apos(
+    cursor: str | None = None, limite: int = 500, unidade_id: int | None = None, parada_maxima: float | None = None,
+) -> tuple[list, str]:
+    """
+    (eventos, próximo cursor). Começa do início com cursor None; repita com o
+    cursor devolvido até vir uma lista vazia. ValueError se o cursor não vale.
+    Com unidade_id, só os eventos da unidade (índice unidade+cursor): o
+    cursor continua o mesmo da trilha toda, só pula o que é das outras.
+    Com parada_maxima, não espera transação aberta há mais que isso (ver docstring do módulo).
+    """
+    transacao, ultimo_id = _ler_cursor(cursor)
+    tabela = connection.ops.quote_name(FichaEvento._meta.db_table)
+    da_unidade, parametros = ("AND unidade_id = %s", [unidade_id]) if unidade_id is not None else ("", [])
+    if parada_maxima is None:
+        ate, parametros_ate = "pg_snapshot_xmin(pg_current_snapshot())::text::bigint", []
+    else:
+        ate, parametros_ate = "%s", [_limite_tolerante(parada_maxima)]
+    eventos = list(FichaEvento.objects.raw(
+        f"""
+        SELECT * FROM {tabela}
+        WHERE (transacao, id) > (%s, %s) {da_unidade}
+          AND transacao < {ate}
+        ORDER BY transacao, id
+        LIMIT %s
+        """,
+        [transacao, ultimo_id, *parametros, *parametros_ate, min(limite, LIMITE_MAXIMO)],
+    ))
+    if not eventos:
+        return [], f"{transacao}.{ultimo_id}"
+    return eventos, f"{eventos[-1].transacao}.{eventos[-1].id}"
+
+
+def cursor_atual() -> str:
+    """Cursor do fim da trilha agora: quem começa daqui só recebe o que vier depois."""
+    tabela = connection.ops.quote_name(FichaEvento._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT transacao, id FROM {tabela}
+            WHERE transacao < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+            ORDER BY transacao DESC, id DESC
+            LIMIT 1
+            """
+        )
+        linha = cursor.fetchone()
+    return f"{linha[0]}.{linha[1]}" if linha else CURSOR_INICIAL
+
+
+def linha_do_tempo(ficha_id: int) -> list:
+    """Eventos de uma ficha, do primeiro ao último."""
+    return list(FichaEvento.objects.filter(ficha_id=ficha_id).order_by("id"))
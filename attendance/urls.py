@@ -11,6 +11,8 @@ urlpatterns = [
     path('triagem/', views.triagem_lista, name='triagem_lista'),
     path('triagem/chamar/<int:ficha_id>/', views.triagem_chamar, name='triagem_chamar'),
     path('triagem/finalizar/<int:ficha_id>/', views.triagem_finalizar, name='triagem_finalizar'),
+    # Visitas anteriores do paciente (resumo + histórico por cursor)
+    path('pacientes/<int:paciente_id>/visitas/', views.paciente_visitas, name='paciente_visitas'),
 
     # --- 3. ESTAÇÃO LANÇAMENTO (Segundo PC - Corredor) ---
     path('lancamento/', views.lancamento_lista, name='lancamento_lista'),
@@ -21,8 +23,18 @@ urlpatterns = [
     path('painel/recepcao/', views.painel_recepcao, name='painel_recepcao'),
     # TV 02: Fica no Corredor dos Consultórios
     path('painel/medico/', views.painel_medico, name='painel_medico'),
+    # Snapshot JSON com ETag (recepcao, medico, tv) para as TVs consultarem
+    path('painel/<slug:painel>/snapshot/', views.painel_snapshot, name='painel_snapshot'),
+    # Eventos em tempo real (SSE) para as duas TVs
+    path('painel/eventos/', views.painel_eventos, name='painel_eventos'),
+    # Long-poll (TVs sem EventSource): segura até a fila mudar
+    path('painel/aguardar/', views.painel_aguardar, name='painel_aguardar'),
+    # Trilha de transições (FichaEvento) lida por cursor
+    path('fichas/eventos/', views.fichas_eventos, name='fichas_eventos'),
     
     path('medico/', views.medico_atendimento, name='medico_atendimento'),
+    path('medico/plantao/', views.medico_plantao, name='medico_plantao'),
     path('medico/chamar/<int:ficha_id>/', views.chamar_paciente_medico, name='chamar_medico'),
+    path('medico/finalizar/<int:ficha_id>/', views.finalizar_atendimento, name='finalizar_atendimento'),
     path('triagem/atendimento/<int:ficha_id>/', views.triagem_marcar_atendimento, name='triagem_marcar_atendimento'),
 ]
\ No newline at end of file
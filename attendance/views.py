@@ -1,103 +1,131 @@
-from django.http import JsonResponse
+import json
+import logging
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
 from django.utils import timezone
+from django.utils.http import parse_etags
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
-from django.db.models import Case, When, Value, IntegerField
+from django.core.exceptions import ValidationError
+from django.db.models import Case, When, Value, IntegerField, Q
+
+from core.replicas import ler_da_replica
+from core.unidades import aunidade_da_requisicao, unidade_da_requisicao
 
+from . import despacho, espera, fila_cache, previsao, trilha, visitas
+from .eventos import get_broker
 from .forms import RecepcaoGerarSenhaForm
 from .services import (
-    criar_ficha_por_cpf, chamar_para_triagem, 
+    criar_ficha_por_cpf, criar_ficha_para_paciente, chamar_para_triagem, iniciar_triagem,
     finalizar_triagem, rotear_para_medico, chamar_para_medico,
     finalizar_atendimento_medico
 )
-from .models import FichaAtendimento
+from .models import FichaAtendimento, PlantaoMedico
+from .snapshots import PAINEIS, PainelIndisponivel, aobter_snapshot
+from .transicoes import TransicaoInvalida
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+def _ator(request):
+    """Quem fez a transição (vai para a trilha de eventos); None nas estações sem login."""
+    return request.user if request.user.is_authenticated else None
+
 
 # --- 1. RECEPÇÃO (Ajustada para garantir que a service cuide da senha) ---
 def recepcao_gerar_senha(request):
     senha_gerada = None
+    espera_min = None
     if request.method == "POST":
         form = RecepcaoGerarSenhaForm(request.POST)
         if form.is_valid():
-            # A service criar_ficha_por_cpf já usa o _proximo_codigo() corrigido
-            result = criar_ficha_por_cpf(**form.cleaned_data)
+            dados = dict(form.cleaned_data)
+            paciente = dados.pop("paciente")
+            # Paciente escolhido na busca: só abre a ficha (cadastro já existe)
+            if paciente:
+                result = criar_ficha_para_paciente(paciente, unidade_da_requisicao(request), ator=_ator(request))
+            else:
+                result = criar_ficha_por_cpf(**dados, unidade_id=unidade_da_requisicao(request), ator=_ator(request))
             senha_gerada = result.ficha.codigo
+            # Vai impresso/dito ao paciente: previsão de chamada para a triagem
+            espera_min = previsao.prever_ficha(result.ficha)
             messages.success(request, f"Senha {senha_gerada} gerada!")
             form = RecepcaoGerarSenhaForm()
     else:
         form = RecepcaoGerarSenhaForm()
-    return render(request, "attendance/recepcao_gerar_senha.html", {"form": form, "senha_gerada": senha_gerada})
+    return render(request, "attendance/recepcao_gerar_senha.html", {
+        "form": form, "senha_gerada": senha_gerada, "espera_min": espera_min,
+    })
 
 # --- TRIAGEM (A parte que não estava funcionando) ---
-def triagem_lista(request):
-    # BUSCA O STATUS 'CHEGADA' (O mesmo que a recepção cria)
-    aguardando = FichaAtendimento.objects.filter(
-        status=FichaAtendimento.Status.CHEGADA
-    ).order_by('criado_em')
-    
-    # BUSCA QUEM ESTÁ SENDO CHAMADO AGORA
-    em_triagem = FichaAtendimento.objects.filter(
-        status__in=[FichaAtendimento.Status.CHAMADO_TRIAGEM, FichaAtendimento.Status.EM_TRIAGEM]
-    ).order_by('-chamado_em')
-
-    return render(request, "attendance/triagem_lista.html", {
-        "aguardando": aguardando, 
-        "em_triagem": em_triagem
-    })
-    
-    
 def triagem_chamar(request, ficha_id):
     """Aciona o chamado visual/sonoro na TV 01."""
-    chamar_para_triagem(ficha_id)
+    try:
+        chamar_para_triagem(ficha_id, ator=_ator(request))
+    except FichaAtendimento.DoesNotExist:
+        raise Http404("Ficha inexistente.")
+    except TransicaoInvalida:
+        messages.error(request, "Essa ficha já foi chamada por outra estação.")
     return redirect('attendance:triagem_lista')
 
 @login_required
 def triagem_finalizar(request, ficha_id):
-    ficha = get_object_or_404(FichaAtendimento, id=ficha_id)
+    # Resumo das visitas anteriores junto, no mesmo SELECT (LEFT JOIN pela chave primária)
+    ficha = get_object_or_404(
+        FichaAtendimento.objects.select_related("paciente", "paciente__resumo_visitas"), id=ficha_id,
+    )
+    anteriores = visitas.dados(getattr(ficha.paciente, "resumo_visitas", None))
 
     if request.method == "POST":
-        # Pegando os dados que vêm do seu HTML
-        ficha.pa_sistolica = request.POST.get('pa_sistolica')
-        ficha.pa_diastolica = request.POST.get('pa_diastolica')
-        ficha.temperatura = request.POST.get('temperatura')
-        ficha.frequencia_cardiaca = request.POST.get('frequencia_cardiaca')
-        ficha.observacoes_triagem = request.POST.get('observacoes_triagem')
-        ficha.prioridade = request.POST.get('prioridade')
-        
+        # Pegando os dados que vêm do seu HTML (campo vazio vira None)
+        campos = ('pa_sistolica', 'pa_diastolica', 'temperatura',
+                  'frequencia_cardiaca', 'observacoes_triagem', 'prioridade')
+        dados_triagem = {campo: request.POST.get(campo) or None for campo in campos}
+
         # Muda o status para TRIADO para ele aparecer na tela de LANÇAMENTO
-        ficha.status = FichaAtendimento.Status.TRIADO
-        ficha.triado_em = timezone.now()
-        ficha.triado_por = request.user
-        
-        ficha.save()
-        
+        # (pela service, para os painéis serem avisados)
+        try:
+            finalizar_triagem(ficha.id, dados_triagem, ator=request.user)
+        except ValidationError as exc:
+            messages.error(request, " ".join(exc.messages))
+            return render(request, "attendance/triagem_form.html", {"ficha": ficha, "visitas": anteriores})
+        except TransicaoInvalida:
+            messages.error(request, f"A triagem de {ficha.paciente.nome} já tinha sido finalizada.")
+            return redirect('attendance:triagem_lista')
+
         messages.success(request, f"Triagem de {ficha.paciente.nome} finalizada com sucesso!")
         return redirect('attendance:triagem_lista')
 
-    return render(request, "attendance/triagem_form.html", {"ficha": ficha})
+    return render(request, "attendance/triagem_form.html", {"ficha": ficha, "visitas": anteriores})
 
 # --- 3. LANÇAMENTO (Roteamento Corredor) ---
+@ler_da_replica
 def triagem_lista(request):
     """Garante a exibição de quem acabou de chegar."""
-    # O segredo é usar exatamente o Status.CHEGADA
-    aguardando = FichaAtendimento.objects.filter(
-        status=FichaAtendimento.Status.CHEGADA
-    ).order_by('criado_em')
+    # O segredo é usar exatamente o Status.CHEGADA (lido do cache das filas da unidade)
+    unidade_id = unidade_da_requisicao(request)
+    # Antes de ler as filas: o long-poll da página pega o que mudar depois daqui
+    cursor = trilha.cursor_atual()
+    aguardando = fila_cache.com_datas(fila_cache.fila(unidade_id, FichaAtendimento.Status.CHEGADA))
+    logger.debug("Pacientes aguardando triagem: %d", len(aguardando), extra={"unidade_id": unidade_id})
     
-    # DEBUG: Ver no terminal quantos pacientes o Django está encontrando
-    print(f"DEBUG: Pacientes aguardando triagem: {aguardando.count()}")
-    
-    em_triagem = FichaAtendimento.objects.filter(
-        status__in=[FichaAtendimento.Status.CHAMADO_TRIAGEM, FichaAtendimento.Status.EM_TRIAGEM]
-    ).order_by('-chamado_em')
+    em_triagem = fila_cache.com_datas(sorted(
+        fila_cache.fila(unidade_id, FichaAtendimento.Status.CHAMADO_TRIAGEM)
+        + fila_cache.fila(unidade_id, FichaAtendimento.Status.EM_TRIAGEM),
+        key=lambda f: f['chamado_em'] or '', reverse=True,
+    ))
     
     return render(request, "attendance/triagem_lista.html", {
         "aguardando": aguardando, 
-        "em_triagem": em_triagem
+        "em_triagem": em_triagem,
+        "cursor_aguardar": cursor,
+        "status_aguardar": "CHEGADA,CHAMADO_TRIAGEM,EM_TRIAGEM",
     })
 
 @require_http_methods(["POST"])
@@ -110,162 +138,310 @@ def lancamento_rotear(request, ficha_id):
         messages.error(request, "Selecione o médico e a sala.")
         return redirect('attendance:lancamento_lista')
 
-    ficha = get_object_or_404(FichaAtendimento, id=ficha_id)
     medico = get_object_or_404(User, id=medico_id)
 
-    # AJUSTE NOS NOMES DOS CAMPOS (Conforme seu models.py)
-    ficha.medico_atendente = medico
-    ficha.local_atendimento = local # No model é 'local_atendimento'
-    ficha.status = FichaAtendimento.Status.CHAMADO_MEDICO
-    ficha.chamado_em = timezone.now()
-    ficha.save()
+    try:
+        ficha = rotear_para_medico(ficha_id, medico.id, local, ator=_ator(request))
+    except FichaAtendimento.DoesNotExist:
+        raise Http404("Ficha inexistente.")
+    except TransicaoInvalida:
+        messages.error(request, "Esse paciente já foi encaminhado por outra estação.")
+        return redirect('attendance:lancamento_lista')
 
     messages.success(request, f"Paciente {ficha.paciente.nome} encaminhado!")
     return redirect('attendance:lancamento_lista')
 
 # --- 4. MÉDICO ---
+@login_required
+@ler_da_replica
 def medico_atendimento(request):
     """Interface do Médico: Fila própria e atendimento atual."""
-    # Filtra pacientes que foram designados para o médico logado
-    fila_espera = FichaAtendimento.objects.filter(
-        medico=request.user,
-        status=FichaAtendimento.Status.AGUARDANDO_MEDICO
-    ).order_by('-prioridade', 'criado_em')
+    # A fila do médico logado sai do cache das filas (já na ordem Manchester)
+    fichas = fila_cache.fila(unidade_da_requisicao(request), fila_cache.fila_medico(request.user.id))
 
-    paciente_atendimento = FichaAtendimento.objects.filter(
-        medico=request.user,
-        status__in=[FichaAtendimento.Status.CHAMADO_MEDICO, FichaAtendimento.Status.EM_CONSULTA]
-    ).first()
+    fila_espera = [f for f in fichas if f["status"] == FichaAtendimento.Status.AGUARDANDO_MEDICO]
+    paciente_atendimento = next(
+        (f for f in fichas if f["status"] != FichaAtendimento.Status.AGUARDANDO_MEDICO), None
+    )
+    plantao = PlantaoMedico.objects.filter(medico=request.user).first()
 
     return render(request, "attendance/medico_atendimento.html", {
         "fila_espera": fila_espera,
-        "paciente_atendimento": paciente_atendimento
+        "paciente_atendimento": paciente_atendimento,
+        "plantao": plantao,
+        "local_atual": paciente_atendimento["local"] if paciente_atendimento else getattr(plantao, "sala", None),
     })
 
+@login_required
+@require_http_methods(["POST"])
+def medico_plantao(request):
+    """Entra/sai do plantão: só quem está de plantão recebe fichas do despacho automático."""
+    if "sair" in request.POST:
+        despacho.sair_plantao(request.user)
+        messages.success(request, "Você saiu do plantão. Sua fila atual continua com você.")
+        return redirect('attendance:medico_atendimento')
+
+    sala = request.POST.get('sala', '').strip()
+    if not sala:
+        messages.error(request, "Informe a sala.")
+        return redirect('attendance:medico_atendimento')
+
+    encaminhados = despacho.entrar_plantao(request.user, sala, unidade_da_requisicao(request), ator=_ator(request))
+    messages.success(request, f"Plantão na {sala}. {encaminhados} paciente(s) da fila encaminhado(s).")
+    return redirect('attendance:medico_atendimento')
+
 def chamar_paciente_medico(request, ficha_id):
     """Médico chama o paciente do corredor (TV 02 toca som)."""
-    chamar_para_medico(ficha_id) 
+    try:
+        chamar_para_medico(ficha_id, ator=_ator(request))
+    except FichaAtendimento.DoesNotExist:
+        raise Http404("Ficha inexistente.")
+    except TransicaoInvalida:
+        messages.error(request, "Esse paciente não está mais aguardando.")
     return redirect('attendance:medico_atendimento')
 
 def finalizar_atendimento(request, ficha_id):
     """Encerra a consulta e remove o paciente das TVs."""
-    finalizar_atendimento_medico(ficha_id)
-    messages.success(request, "Atendimento finalizado.")
+    try:
+        finalizar_atendimento_medico(ficha_id, ator=_ator(request))
+    except FichaAtendimento.DoesNotExist:
+        raise Http404("Ficha inexistente.")
+    except TransicaoInvalida:
+        messages.error(request, "Esse atendimento já tinha sido finalizado.")
+    else:
+        messages.success(request, "Atendimento finalizado.")
     return redirect('attendance:medico_atendimento')
 
 
 def triagem_marcar_atendimento(request, ficha_id):
-    from django.http import JsonResponse
-    from .models import FichaAtendimento
-    
-    ficha = get_object_or_404(FichaAtendimento, id=ficha_id)
-    # Este status 'EM_TRIAGEM' deve ser o mesmo que você usa no 
-    # template da TV para ativar a cor azul.
-    ficha.status = 'EM_TRIAGEM' 
-    ficha.save()
+    # EM_TRIAGEM é o status que ativa a cor azul no template da TV.
+    try:
+        iniciar_triagem(ficha_id, ator=_ator(request))
+    except FichaAtendimento.DoesNotExist:
+        raise Http404("Ficha inexistente.")
+    except TransicaoInvalida as exc:
+        return JsonResponse({'status': 'conflito', 'atual': exc.atual}, status=409)
     return JsonResponse({'status': 'ok'})
 
 # --- AJUSTE A VIEW DO PAINEL ---
-from django.utils import timezone
-from datetime import timedelta
-
-# No seu views.py
-def painel_recepcao(request):
-    agora = timezone.now()
-    
-    # SÓ BUSCA QUEM FOI CHAMADO NOS ÚLTIMOS 2 MINUTOS
-    # Isso impede que um erro de salvamento trave a TV o dia todo.
-    limite_chamada = agora - timedelta(minutes=2)
-
-    atual = FichaAtendimento.objects.filter(
-        status=FichaAtendimento.Status.CHAMADO_TRIAGEM,
-        atualizado_em__gte=limite_chamada # Trava de segurança
-    ).order_by('-atualizado_em').first()
-
-    if not atual:
-        # Mostra o azul (em atendimento) por apenas 30 segundos
-        limite_azul = agora - timedelta(seconds=30)
-        atual = FichaAtendimento.objects.filter(
-            status=FichaAtendimento.Status.EM_TRIAGEM,
-            atualizado_em__gte=limite_azul
-        ).order_by('-atualizado_em').first()
-
-    # ... resto do código ...
-
-    # Log de depuração atualizado
-    if atual:
-        print(f"DEBUG: Paciente ATIVO na TV: {atual.paciente.nome} | Status: {atual.status}")
-    else:
-        print("DEBUG: TELA LIMPA - Nenhum chamado recente.")
-
-    proximos = FichaAtendimento.objects.filter(
-        status=FichaAtendimento.Status.CHEGADA
-    ).order_by('criado_em')[:6]
 
+def _estado_inicial(snapshot):
+    """Snapshot + hora do servidor, embutidos na página para o JS da TV."""
+    return {
+        "agora": timezone.now().isoformat(),
+        "etag": snapshot["etag"],
+        "dados": snapshot["dados"],
+    }
+
+
+# Os painéis são assíncronos (servir via config/asgi.py): uma TV esperando
+# resposta é uma corrotina, não uma thread do worker. O que eles leem do
+# banco pode vir de uma réplica (core/replicas.py).
+
+def _painel_degradavel(view):
+    """Sem snapshot nenhum e sem banco (snapshots.PainelIndisponivel): 503, e a TV tenta de novo."""
+    @wraps(view)
+    async def envolvida(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except PainelIndisponivel:
+            response = HttpResponse(
+                '<meta http-equiv="refresh" content="10">Painel indisponível no momento. Tentando de novo...',
+                status=503,
+            )
+            response["Retry-After"] = "10"
+            return response
+    return envolvida
+
+
+@_painel_degradavel
+@ler_da_replica
+async def painel_recepcao(request):
+    # As travas de tempo (chamado 2 min, azul 30 s) ficam em snapshots.py
+    snapshot = await aobter_snapshot("recepcao", await aunidade_da_requisicao(request))
     return render(request, 'attendance/painel_recepcao.html', {
-        'atual': atual,
-        'proximos': proximos,
+        'atual': snapshot['dados']['atual'],
+        'proximos': snapshot['dados']['proximos'],
+        'estado': _estado_inicial(snapshot),
     })
-    
-    
-    
-def painel_medico(request):
+
+
+@_painel_degradavel
+@ler_da_replica
+async def painel_medico(request):
     """TV 02 - Consultórios."""
-    # O paciente que o médico ACABOU de chamar (Destaque na TV)
-    chamado = FichaAtendimento.objects.filter(
-        status=FichaAtendimento.Status.CHAMADO_MEDICO
-    ).order_by('-chamado_em').first()
-    
-    # A fila que fica na lateral da TV (Quem já passou pela triagem)
-    # Importante: Use o mesmo status que você definiu no triagem_finalizar
-    fila_corredor = FichaAtendimento.objects.filter(
-        status=FichaAtendimento.Status.TRIADO 
-    ).order_by('-prioridade', 'criado_em')[:8]
-    
+    # atual = quem o médico ACABOU de chamar; fila = quem já passou pela triagem
+    snapshot = await aobter_snapshot("medico", await aunidade_da_requisicao(request))
     return render(request, "attendance/painel_medico.html", {
-        "atual": chamado, 
-        "fila": fila_corredor
+        "atual": snapshot["dados"]["atual"],
+        "fila": snapshot["dados"]["fila"],
+        "estado": _estado_inicial(snapshot),
     })
 
 
+@_painel_degradavel
+@ler_da_replica
+async def painel_snapshot(request, painel):
+    """
+    JSON enxuto do painel (chamado atual + próximos da fila) com ETag.
+    Se nada mudou desde o ETag que a TV mandou, responde 304 sem tocar no banco.
+    Com o banco fora, vem o último snapshot bom com "desatualizado": true.
+    """
+    if painel not in PAINEIS:
+        raise Http404("Painel inexistente.")
+
+    snapshot = await aobter_snapshot(painel, await aunidade_da_requisicao(request))
+    if snapshot["etag"] in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = JsonResponse(snapshot["dados"])
+    response["ETag"] = snapshot["etag"]
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
 # --- 3. LANÇAMENTO (Simplificada e conectada à Service) ---
 @login_required
+@ler_da_replica
 def lancamento_lista(request):
     """Lista pacientes triados aguardando encaminhamento."""
-    triados = FichaAtendimento.objects.filter(
-        status=FichaAtendimento.Status.TRIADO
-    ).order_by('-prioridade', 'criado_em') 
-    
-    # Busca usuários no grupo 'Medicos' ou staff
-    medicos = User.objects.filter(groups__name='Medicos')
+    # Já vem ordenado por prioridade Manchester e chegada (cache das filas da unidade)
+    unidade_id = unidade_da_requisicao(request)
+    cursor = trilha.cursor_atual()
+    triados = fila_cache.fila(unidade_id, FichaAtendimento.Status.TRIADO)
+    # Encaminhados pelo despacho automático: o lançamento ainda pode trocar
+    encaminhados = fila_cache.fila(unidade_id, FichaAtendimento.Status.AGUARDANDO_MEDICO)
+
+    # Busca usuários no grupo 'Medicos' ou staff (da unidade ou sem unidade fixa)
+    da_unidade = Q(unidade_id=unidade_id) | Q(unidade__isnull=True)
+    medicos = User.objects.filter(da_unidade, groups__name='Medicos')
     if not medicos.exists():
-        medicos = User.objects.filter(is_staff=True)
-    
+        medicos = User.objects.filter(da_unidade, is_staff=True)
+
+    plantoes = [
+        {"plantao": p, "fila": fila_cache.contar(unidade_id, fila_cache.fila_medico(p.medico_id))}
+        for p in PlantaoMedico.objects.filter(unidade_id=unidade_id).select_related("medico").order_by("sala")
+    ]
+
     return render(request, "attendance/lancamento_lista.html", {
-        "triados": triados, 
-        "medicos": medicos
+        "triados": triados,
+        "encaminhados": encaminhados,
+        "medicos": medicos,
+        "plantoes": plantoes,
+        "cursor_aguardar": cursor,
+        "status_aguardar": "TRIADO,AGUARDANDO_MEDICO",
     })
     
 
-def tv_painel(request):
-    # Pacientes chamados para TRIAGEM
-    chamados_triagem = FichaAtendimento.objects.filter(
-        status=FichaAtendimento.Status.CHAMADO_TRIAGEM
-    ).order_by('-chamado_em')[:5]
-
-    # Pacientes chamados para CONSULTA MÉDICA (Pós-triagem)
-    chamados_medico = FichaAtendimento.objects.filter(
-        status=FichaAtendimento.Status.CHAMADO_MEDICO 
-    ).order_by('-chamado_em')[:5]
-
+@_painel_degradavel
+@ler_da_replica
+async def tv_painel(request):
+    # Chamados para TRIAGEM e para CONSULTA MÉDICA (pós-triagem)
+    snapshot = await aobter_snapshot("tv", await aunidade_da_requisicao(request))
     return render(request, "attendance/tv_painel.html", {
-        "chamados_triagem": chamados_triagem,
-        "chamados_medico": chamados_medico,
+        "chamados_triagem": snapshot["dados"]["chamados_triagem"],
+        "chamados_medico": snapshot["dados"]["chamados_medico"],
     })
     
 # No seu views.py (exemplo da função que para a chamada)
 def parar_chamada(request, pk):
-    ficha = get_object_status(FichaAtendimento, pk=pk)
-    ficha.status = FichaAtendimento.Status.EM_TRIAGEM
-    ficha.save() # Se isso aqui falhar, o Android nunca vai parar de gritar na TV!
-    return JsonResponse({'status': 'success'})
\ No newline at end of file
+    try:
+        iniciar_triagem(pk, ator=_ator(request)) # Se isso aqui falhar, o Android nunca vai parar de gritar na TV!
+    except FichaAtendimento.DoesNotExist:
+        raise Http404("Ficha inexistente.")
+    except TransicaoInvalida:
+        # Já não está mais em CHAMADO_TRIAGEM (outra TV parou antes): a chamada já acabou
+        pass
+    return JsonResponse({'status': 'success'})
+
+
+async def painel_eventos(request):
+    """
+    Canal Server-Sent Events das TVs (servir via config/asgi.py).
+    ?status=CHEGADA,TRIADO filtra só os eventos que interessam ao painel;
+    ?unidade=<slug> escolhe a unidade (como nos outros painéis).
+    """
+    filtro = {s for s in request.GET.get("status", "").split(",") if s}
+    unidade_id = await aunidade_da_requisicao(request)
+    assinatura = get_broker().assinar(unidade_id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                evento = await assinatura.receber(timeout=15)
+                if evento is None:
+                    yield ": ping\n\n"  # mantém a conexão viva em proxies
+                    continue
+                if filtro and not ({evento["status"], evento.get("anterior")} & filtro):
+                    continue
+                yield f"event: ficha\ndata: {json.dumps(evento, cls=DjangoJSONEncoder)}\n\n"
+        finally:
+            await assinatura.fechar()
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+async def painel_aguardar(request):
+    """
+    Long-poll para TVs/telas sem EventSource (ver espera.py).
+    ?cursor=<o "cursor" da resposta anterior>&status=CHEGADA,TRIADO&timeout=25;
+    sem cursor, responde na hora só com o cursor atual.
+    """
+    filtro = frozenset(s for s in request.GET.get("status", "").split(",") if s)
+    unidade_id = await aunidade_da_requisicao(request)
+    try:
+        timeout = max(0.0, min(float(request.GET.get("timeout", espera.TIMEOUT_PADRAO)), espera.TIMEOUT_MAXIMO))
+        resultado = await espera.aguardar(unidade_id, request.GET.get("cursor"), filtro, timeout)
+    except ValueError as exc:
+        return JsonResponse({"erro": str(exc)}, status=400)
+    response = JsonResponse(resultado)
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+@login_required
+def fichas_eventos(request):
+    """
+    Trilha de transições para consumidores externos (reports, integrações).
+    ?cursor=<o "cursor" da resposta anterior>&limite=500; sem cursor, do começo.
+    """
+    try:
+        limite = max(1, int(request.GET.get("limite", 500)))
+        eventos, cursor = trilha.eventos_apos(request.GET.get("cursor"), limite)
+    except ValueError as exc:
+        return JsonResponse({"erro": str(exc)}, status=400)
+    return JsonResponse({
+        "eventos": [
+            {
+                "id": e.id, "ficha_id": e.ficha_id, "unidade_id": e.unidade_id,
+                "de": e.de, "para": e.para, "ator_id": e.ator_id, "em": e.em,
+            }
+            for e in eventos
+        ],
+        "cursor": cursor,
+    })
+
+
+@login_required
+@ler_da_replica
+def paciente_visitas(request, paciente_id):
+    """
+    Visitas anteriores do paciente. Sem cursor: o resumo (total, últimos
+    sinais, últimas visitas). ?apos=<"proximo" da resposta anterior>: as
+    visitas mais antigas, por cursor.
+    """
+    apos = request.GET.get("apos")
+    if not apos:
+        return JsonResponse(visitas.resumo(paciente_id) or {
+            "total": 0, "ultima_prioridade": None, "sinais": None, "visitas": [], "proximo": None,
+        })
+    try:
+        limite = min(max(1, int(request.GET.get("limite", visitas.HISTORICO_POR_PAGINA))), 100)
+        anteriores, proximo = visitas.historico(paciente_id, apos, limite)
+    except ValueError as exc:
+        return JsonResponse({"erro": str(exc)}, status=400)
+    return JsonResponse({"visitas": anteriores, "proximo": proximo})
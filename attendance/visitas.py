@@ -0,0 +1,165 @@
+"""
+Histórico de visitas do paciente para a triagem.
+
+Abrir paciente.fichas a cada triagem varreria a vida inteira do paciente
+(fichas vivas + arquivo). Em vez disso cada paciente tem um ResumoVisitas,
+uma linha pela chave primária com:
+
+- total de visitas (fichas que passaram pela triagem);
+- a última prioridade e os últimos sinais vitais;
+- as VISITAS_NO_RESUMO visitas mais recentes, prontas para a tela (JSON).
+
+O resumo é atualizado na mesma transação de finalizar_triagem e
+finalizar_atendimento_medico (services.py): nunca mostra uma triagem que
+sofreu rollback. Duas estações mexendo no mesmo paciente se enfileiram no
+SELECT ... FOR UPDATE da linha do resumo (nunca da ficha).
+
+Para ir além das últimas visitas, historico() pagina FichaHistorico por
+cursor em (criado_em, id), pelos índices de paciente das duas tabelas.
+Pacientes de antes do resumo existir: comando resumir_visitas.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from core.listas import ler_cursor
+
+from .models import FichaAtendimento, FichaHistorico, ResumoVisitas
+
+VISITAS_NO_RESUMO = 5
+HISTORICO_POR_PAGINA = 20
+
+Status = FichaAtendimento.Status
+# Visita = ficha que passou pela triagem
+STATUS_VISITA = (
+    Status.TRIADO, Status.AGUARDANDO_MEDICO, Status.CHAMADO_MEDICO, Status.EM_ATENDIMENTO, Status.FINALIZADO,
+)
+SINAIS = ("pa_sistolica", "pa_diastolica", "temperatura", "frequencia_cardiaca")
+
+
+def _momento(valor):
+    return valor.isoformat() if valor else None
+
+
+def _visita(ficha, medico=None) -> dict:
+    """Uma visita como vai para o JSON (ficha viva, arquivada ou do histórico)."""
+    return {
+        "id": ficha.id,
+        "unidade_id": ficha.unidade_id,
+        "codigo": ficha.codigo,
+        "status": ficha.status,
+        "prioridade": ficha.prioridade,
+        "pa_sistolica": ficha.pa_sistolica,
+        "pa_diastolica": ficha.pa_diastolica,
+        "temperatura": str(ficha.temperatura) if ficha.temperatura is not None else None,
+        "frequencia_cardiaca": ficha.frequencia_cardiaca,
+        "observacoes_triagem": ficha.observacoes_triagem,
+        "medico": (medico.get_full_name() or medico.username) if medico else None,
+        "criado_em": _momento(ficha.criado_em),
+        "finalizado_em": _momento(ficha.finalizado_em),
+    }
+
+
+def cursor_da_visita(visita: dict) -> str:
+    return f"{visita['criado_em']}_{visita['id']}"
+
+
+def registrar(ficha: FichaAtendimento) -> ResumoVisitas:
+    """
+    Põe (ou atualiza) a ficha no resumo do paciente. Chame dentro da
+    transação que mudou a ficha (services.py).
+    """
+    with transaction.atomic():
+        ResumoVisitas.objects.bulk_create([ResumoVisitas(paciente_id=ficha.paciente_id)], ignore_conflicts=True)
+        resumo = ResumoVisitas.objects.select_for_update().get(paciente_id=ficha.paciente_id)
+
+        visita = _visita(ficha, ficha.medico_atendente if ficha.medico_atendente_id else None)
+        ultimas = [v for v in resumo.ultimas if v["id"] != ficha.id]
+        if len(ultimas) == len(resumo.ultimas):
+            resumo.total += 1  # primeira vez que a ficha entra no resumo
+        ultimas.append(visita)
+        ultimas.sort(key=lambda v: (v["criado_em"], v["id"]), reverse=True)
+        resumo.ultimas = ultimas[:VISITAS_NO_RESUMO]
+
+        # Sinais e prioridade são os da visita mais recente
+        if resumo.ultima_ficha_id is None or ficha.id >= resumo.ultima_ficha_id:
+            resumo.ultima_ficha_id = ficha.id
+            resumo.ultima_prioridade = ficha.prioridade
+            for campo in SINAIS:
+                setattr(resumo, campo, getattr(ficha, campo))
+            resumo.sinais_em = ficha.criado_em
+        resumo.save()
+    return resumo
+
+
+def resumo(paciente_id: int) -> dict | None:
+    """Resumo para a API, numa consulta pela chave primária. None se o paciente nunca foi triado."""
+    return dados(ResumoVisitas.objects.filter(paciente_id=paciente_id).first())
+
+
+def dados(resumo: ResumoVisitas | None) -> dict | None:
+    """
+    O ResumoVisitas como vai para a tela/JSON. A triagem o traz no mesmo
+    SELECT da ficha: select_related("paciente__resumo_visitas").
+    """
+    if resumo is None:
+        return None
+    ultimas = resumo.ultimas
+    return {
+        "total": resumo.total,
+        "ultima_prioridade": resumo.ultima_prioridade,
+        "sinais": {
+            "pa_sistolica": resumo.pa_sistolica,
+            "pa_diastolica": resumo.pa_diastolica,
+            "temperatura": str(resumo.temperatura) if resumo.temperatura is not None else None,
+            "frequencia_cardiaca": resumo.frequencia_cardiaca,
+            "em": _momento(resumo.sinais_em),
+        },
+        "visitas": ultimas,
+        # Mais antigas que as do resumo: historico(apos=proximo)
+        "proximo": cursor_da_visita(ultimas[-1]) if ultimas and resumo.total > len(ultimas) else None,
+    }
+
+
+def historico(paciente_id: int, apos=None, limite=HISTORICO_POR_PAGINA) -> tuple[list, str | None]:
+    """
+    (visitas, cursor da próxima página) do paciente, da mais nova para a mais
+    antiga, depois do cursor `apos` (texto de cursor_da_visita). ValueError se o cursor não vale.
+    """
+    fichas = (
+        FichaHistorico.objects.filter(paciente_id=paciente_id, status__in=STATUS_VISITA)
+        .select_related("medico_atendente")
+        .order_by("-criado_em", "-id")
+    )
+    if apos:
+        cursor = ler_cursor(apos)
+        if cursor is None:
+            raise ValueError(f"Cursor inválido: {apos!r}")
+        momento, ficha_id = cursor
+        fichas = fichas.filter(criado_em__lte=momento).filter(
+            Q(criado_em__lt=momento) | Q(criado_em=momento, id__lt=ficha_id)
+        )
+    pagina = list(fichas[: limite + 1])
+    visitas = [_visita(f, f.medico_atendente) for f in pagina[:limite]]
+    return visitas, (cursor_da_visita(visitas[-1]) if len(pagina) > limite else None)
+
+
+def reconstruir(paciente_id: int) -> ResumoVisitas | None:
+    """Refaz o resumo do paciente a partir do histórico (carga inicial, correções)."""
+    fichas = FichaHistorico.objects.filter(paciente_id=paciente_id, status__in=STATUS_VISITA)
+    visitas, _ = historico(paciente_id, limite=VISITAS_NO_RESUMO)
+    if not visitas:
+        ResumoVisitas.objects.filter(paciente_id=paciente_id).delete()
+        return None
+    ultima = fichas.order_by("-criado_em", "-id").first()
+    resumo, _ = ResumoVisitas.objects.update_or_create(
+        paciente_id=paciente_id,
+        defaults={
+            "total": fichas.count(),
+            "ultimas": visitas,
+            "ultima_ficha_id": ultima.id,
+            "ultima_prioridade": ultima.prioridade,
+            "sinais_em": ultima.criado_em,
+            **{campo: getattr(ultima, campo) for campo in SINAIS},
+        },
+    )
+    return resumo
@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
+
+As TVs ficam conectadas em /painel/eventos/ (Server-Sent Events), então em
+produção sirva por aqui (ex.: uvicorn config.asgi:application) em vez do WSGI:
+cada conexão aberta custa só uma corrotina, não uma thread. Os painéis
+(/painel/recepcao/, /painel/medico/ e os snapshots) também são views
+assíncronas; `manage.py teste_carga --conexoes N` compara os dois caminhos.
 """
 
 import os
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/6.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 import os
 
@@ -29,7 +30,7 @@ SECRET_KEY = os.getenv('SECRET_KEY')
 
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv("DEBUG", "True") == "True"
 
 ALLOWED_HOSTS = ["127.0.0.1", "localhost"]
 
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Apps do sistema
     'core',
     'accounts',
@@ -54,6 +56,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro: mede também sessão/autenticação (ver core/instrumentacao.py)
+    'core.instrumentacao.InstrumentacaoMiddleware',
+    # Read-your-writes com réplicas de leitura (ver core/replicas.py)
+    'core.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,7 +73,8 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates cronometrado (ver core/instrumentacao.py)
+        'BACKEND': 'core.instrumentacao.TemplatesInstrumentados',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -94,9 +101,38 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "HOST": os.getenv("DB_HOST"),
         "PORT": os.getenv("DB_PORT"),
+        # Conexões persistentes (segundos; 0 fecha a cada requisição), conferidas antes de reusar
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# Sem o pool de conexões do Django ("pool": True): ele só existe no psycopg 3,
+# e a importação de pacientes (copy_expert) e o PostgresBroker (poll/notifies)
+# usam a API do psycopg2. No ASGI (uvicorn) as conexões persistentes não são
+# reaproveitadas entre requisições: lá use DB_CONN_MAX_AGE=0.
+
+# Réplicas de leitura (ver core/replicas.py): DB_REPLICAS=host[:porta][/banco],...
+# Mesmo usuário e senha da primária. Nos testes elas espelham o banco de teste.
+REPLICAS_LEITURA = []
+for numero, endereco in enumerate(filter(None, os.getenv("DB_REPLICAS", "").split(",")), start=1):
+    servidor, _, nome = endereco.strip().partition("/")
+    host, _, porta = servidor.partition(":")
+    alias = f"replica{numero}"
+    DATABASES[alias] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": porta or DATABASES["default"]["PORT"],
+        "NAME": nome or DATABASES["default"]["NAME"],
+        "TEST": {"MIRROR": "default"},
+    }
+    REPLICAS_LEITURA.append(alias)
+
+DATABASE_ROUTERS = ["core.replicas.RoteadorReplicas"]
+# Réplica mais atrasada que isto deixa de receber leituras; também é por
+# quanto tempo quem escreveu continua lendo da primária
+REPLICA_ATRASO_MAXIMO_S = float(os.getenv("DB_REPLICA_ATRASO_MAXIMO", "5"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -139,3 +175,90 @@ STATICFILES_DIRS = [
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 AUTH_USER_MODEL = 'accounts.User'
+
+
+# Redis do docker-compose. Sem REDIS_URL tudo roda em memória (um processo só).
+REDIS_URL = os.getenv("REDIS_URL", "")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+
+# Eventos em tempo real dos painéis (ver attendance/eventos.py)
+EVENTOS_BROKER = os.getenv("EVENTOS_BROKER", "attendance.eventos.LocalBroker")
+
+# Fichas encerradas há mais de N dias saem da tabela viva (manage.py arquivar_fichas)
+ARQUIVO_FICHAS_DIAS = int(os.getenv("ARQUIVO_FICHAS_DIAS", "2"))
+
+# Cache quente das filas (ver attendance/fila_cache.py). Em memória cada worker
+# teria a sua fila, então fora do DEBUG sem Redis é erro de configuração (a não
+# ser que FILA_CACHE_BACKEND seja escolhido explicitamente)
+FILA_CACHE_BACKEND = os.getenv("FILA_CACHE_BACKEND", "")
+if not FILA_CACHE_BACKEND:
+    if REDIS_URL:
+        FILA_CACHE_BACKEND = "attendance.fila_cache.RedisFilaBackend"
+    elif DEBUG:
+        FILA_CACHE_BACKEND = "attendance.fila_cache.MemoriaFilaBackend"
+    else:
+        raise ImproperlyConfigured(
+            "REDIS_URL não configurado: o cache das filas precisa do Redis com DEBUG=False "
+            "(ou defina FILA_CACHE_BACKEND=attendance.fila_cache.MemoriaFilaBackend para um processo só)."
+        )
+
+# Painéis com o banco lento (ver attendance/snapshots.py): tempo máximo de cada
+# consulta ao remontar um painel e o disjuntor que para de tentar o banco
+PAINEL_TEMPO_LIMITE_MS = int(os.getenv("PAINEL_TEMPO_LIMITE_MS", "1000"))
+PAINEL_DISJUNTOR_FALHAS = int(os.getenv("PAINEL_DISJUNTOR_FALHAS", "3"))
+PAINEL_DISJUNTOR_SEGUNDOS = float(os.getenv("PAINEL_DISJUNTOR_SEGUNDOS", "30"))
+# Disjuntor aberto: a TV recebe o último snapshot bom na hora e a tentativa
+# no banco roda numa thread. 0 tenta na própria requisição
+PAINEL_REMONTAR_EM_SEGUNDO_PLANO = os.getenv("PAINEL_REMONTAR_EM_SEGUNDO_PLANO", "1") == "1"
+
+# Instrumentação das requisições e /metricas/ (ver core/instrumentacao.py)
+INSTRUMENTACAO_ATIVA = os.getenv("INSTRUMENTACAO_ATIVA", "1") == "1"
+INSTRUMENTACAO_CONSULTA_LENTA_MS = float(os.getenv("INSTRUMENTACAO_CONSULTA_LENTA_MS", "200"))
+# Mesma consulta repetida N vezes numa requisição: log de possível N+1
+INSTRUMENTACAO_N_MAIS_UM = int(os.getenv("INSTRUMENTACAO_N_MAIS_UM", "5"))
+# Com token, o Prometheus manda "Authorization: Bearer <token>"; sem, só staff logado
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")
+
+# Logs: LOG_FORMATO=json em produção (uma linha JSON por registro, ver core/logs.py)
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "core.logs.FormatadorJSON"},
+        "texto": {"format": "%(asctime)s %(levelname)s %(name)s: %(message)s"},
+    },
+    "filters": {
+        "require_debug_false": {"()": "django.utils.log.RequireDebugFalse"},
+    },
+    "handlers": {
+        "saida": {"()": "core.logs.FilaHandler", "formatter": os.getenv("LOG_FORMATO", "texto")},
+        # O mesmo do padrão do Django: 500 por e-mail para os ADMINS fora do DEBUG
+        "mail_admins": {
+            "level": "ERROR",
+            "filters": ["require_debug_false"],
+            "class": "django.utils.log.AdminEmailHandler",
+        },
+    },
+    "root": {"handlers": ["saida"], "level": os.getenv("LOG_NIVEL", "INFO")},
+    "loggers": {
+        # 4xx (django.request WARNING) é ruído; 500 e erros do Django aparecem
+        "django": {
+            "handlers": ["saida", "mail_admins"],
+            "level": os.getenv("LOG_NIVEL_DJANGO", "ERROR"),
+            "propagate": False,
+        },
+        # Linhas de acesso do runserver (INFO), fora do nível do "django" acima
+        "django.server": {"handlers": ["saida"], "level": "INFO", "propagate": False},
+    },
+}
+
+# Despacho automático para os médicos de plantão (ver attendance/despacho.py):
+# tempo de consulta assumido até o médico finalizar os primeiros atendimentos
+DESPACHO_CONSULTA_PADRAO_MIN = float(os.getenv("DESPACHO_CONSULTA_PADRAO_MIN", "15"))
@@ -14,4 +14,7 @@ urlpatterns = [
     
     # Inclui as rotas do seu app de atendimento
     path('', include('attendance.urls')), 
+    path('', include('patients.urls')),
+    path('', include('reports.urls')),
+    path('', include('core.urls')),
 ]
\ No newline at end of file
@@ -3,3 +3,13 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import instrumentacao, replicas
+
+        # Toda conexão nova passa a contar/cronometrar as consultas da requisição
+        connection_created.connect(instrumentacao.instalar_em_conexao)
+        # e, na primária, a marcar quem escreveu (read-your-writes com réplicas)
+        connection_created.connect(replicas.instalar_em_conexao)
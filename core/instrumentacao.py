@@ -0,0 +1,281 @@
+"""
+Instrumentação de cada requisição: latência da view, consultas SQL (quantas
+e quanto tempo) e tempo de renderização dos templates.
+
+- InstrumentacaoMiddleware abre uma Medicao por requisição (ContextVar: vale
+  também dentro do sync_to_async das views assíncronas) e, no fim, soma tudo
+  nos histogramas do processo.
+- As consultas passam por medir_consulta, instalado em toda conexão nova
+  (signal connection_created, ver CoreConfig.ready). Fora de requisição
+  (cron, shell) ele só repassa a consulta.
+- Os templates são cronometrados pelo backend TemplatesInstrumentados
+  (settings.TEMPLATES).
+- /metricas/ expõe os histogramas no formato texto do Prometheus.
+
+Também detecta, e registra no log estruturado (logger "core.instrumentacao"):
+- consulta lenta: uma consulta acima de INSTRUMENTACAO_CONSULTA_LENTA_MS;
+- N+1: a mesma consulta (mesmo SQL, parâmetros diferentes) repetida
+  INSTRUMENTACAO_N_MAIS_UM vezes ou mais na mesma requisição.
+
+Memória limitada: os histogramas têm faixas fixas e uma série por view
+(nome da rota, nunca a URL com ids), no máximo MAX_SERIES. Custo por
+requisição: alguns perf_counter() e um lock curto no fim; por consulta, uma
+soma num dicionário. Dá para deixar ligado em produção.
+
+Os números são do processo: com vários workers, cada um expõe os seus
+(o Prometheus soma as instâncias).
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+# Faixas (limite superior) de cada histograma
+FAIXAS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAIXAS_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+MAX_SERIES = 500
+METODOS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+SQL_NO_LOG = 500  # caracteres do SQL que vão para o log
+
+_medicao_atual = ContextVar("medicao_atual", default=None)
+
+
+class Histograma:
+    """Contagens cumulativas por faixa + soma, como o histogram do Prometheus."""
+
+    __slots__ = ("faixas", "contagens", "soma", "total")
+
+    def __init__(self, faixas):
+        self.faixas = faixas
+        self.contagens = [0] * len(faixas)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor) -> None:
+        for i, limite in enumerate(self.faixas):
+            if valor <= limite:
+                self.contagens[i] += 1
+                break
+        self.soma += valor
+        self.total += 1
+
+    def cumulativo(self):
+        acumulado = 0
+        for limite, contagem in zip(self.faixas, self.contagens):
+            acumulado += contagem
+            yield limite, acumulado
+
+
+# nome -> (tipo, ajuda, faixas ou None para contador)
+METRICAS = {
+    "clinicflow_requisicao_segundos": ("histogram", "Latência da requisição por view.", FAIXAS_SEGUNDOS),
+    "clinicflow_requisicao_consultas": ("histogram", "Consultas SQL por requisição.", FAIXAS_CONSULTAS),
+    "clinicflow_sql_segundos": ("histogram", "Tempo total de SQL por requisição.", FAIXAS_SEGUNDOS),
+    "clinicflow_template_segundos": ("histogram", "Tempo de templates por requisição.", FAIXAS_SEGUNDOS),
+    "clinicflow_respostas_total": ("counter", "Respostas por view e classe de status.", None),
+    "clinicflow_consultas_lentas_total": ("counter", "Consultas acima do limite de lentidão.", None),
+    "clinicflow_n_mais_um_total": ("counter", "Requisições com a mesma consulta repetida (N+1).", None),
+}
+
+
+class Registro:
+    """Séries de todas as métricas do processo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {nome: {} for nome in METRICAS}
+
+    def _serie(self, nome, rotulos):
+        series = self._series[nome]
+        if rotulos not in series and len(series) >= MAX_SERIES:
+            rotulos = tuple((chave, "outras") for chave, _ in rotulos)
+        if rotulos not in series:
+            faixas = METRICAS[nome][2]
+            series[rotulos] = Histograma(faixas) if faixas else 0
+        return rotulos
+
+    def observar(self, nome, rotulos, valor) -> None:
+        with self._lock:
+            self._series[nome][self._serie(nome, rotulos)].observar(valor)
+
+    def incrementar(self, nome, rotulos, quanto=1) -> None:
+        with self._lock:
+            rotulos = self._serie(nome, rotulos)
+            self._series[nome][rotulos] += quanto
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._series = {nome: {} for nome in METRICAS}
+
+    def valor(self, nome, **rotulos):
+        """Contador ou histograma da série (None se não existe)."""
+        with self._lock:
+            return self._series[nome].get(tuple(rotulos.items()))
+
+    def exportar(self) -> str:
+        """Texto no formato de exposição do Prometheus (0.0.4)."""
+        linhas = []
+        with self._lock:
+            for nome, (tipo, ajuda, _) in METRICAS.items():
+                linhas.append(f"# HELP {nome} {ajuda}")
+                linhas.append(f"# TYPE {nome} {tipo}")
+                for rotulos, serie in sorted(self._series[nome].items()):
+                    if tipo == "counter":
+                        linhas.append(f"{nome}{_rotulos(rotulos)} {serie}")
+                        continue
+                    for limite, acumulado in serie.cumulativo():
+                        linhas.append(f"{nome}_bucket{_rotulos(rotulos, le=limite)} {acumulado}")
+                    linhas.append(f"{nome}_bucket{_rotulos(rotulos, le='+Inf')} {serie.total}")
+                    linhas.append(f"{nome}_sum{_rotulos(rotulos)} {serie.soma:.6f}")
+                    linhas.append(f"{nome}_count{_rotulos(rotulos)} {serie.total}")
+        return "\n".join(linhas) + "\n"
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _rotulos(rotulos, **extra) -> str:
+    pares = [*rotulos, *extra.items()]
+    return "{" + ",".join(f'{chave}="{_escapar(valor)}"' for chave, valor in pares) + "}"
+
+
+registro = Registro()
+
+
+class Medicao:
+    """O que uma requisição gastou até agora."""
+
+    __slots__ = ("caminho", "consultas", "sql_segundos", "template_segundos", "repeticoes", "lentas")
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.consultas = 0
+        self.sql_segundos = 0.0
+        self.template_segundos = 0.0
+        self.repeticoes = Counter()
+        self.lentas = 0
+
+
+def medir_consulta(execute, sql, params, many, context):
+    """execute_wrapper de todas as conexões (ver CoreConfig.ready)."""
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        segundos = time.perf_counter() - inicio
+        medicao.consultas += 1
+        medicao.sql_segundos += segundos
+        medicao.repeticoes[sql] += 1
+        if segundos * 1000 >= settings.INSTRUMENTACAO_CONSULTA_LENTA_MS:
+            medicao.lentas += 1
+            logger.warning(
+                "Consulta lenta (%.0f ms)", segundos * 1000,
+                extra={
+                    "evento": "consulta_lenta", "caminho": medicao.caminho,
+                    "ms": round(segundos * 1000, 1), "sql": sql[:SQL_NO_LOG],
+                },
+            )
+
+
+def instalar_em_conexao(sender, connection, **kwargs):
+    """Receiver de connection_created."""
+    if medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(medir_consulta)
+
+
+class _TemplateInstrumentado(Template):
+    def render(self, context=None, request=None):
+        medicao = _medicao_atual.get()
+        if medicao is None:
+            return super().render(context, request)
+        inicio = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            medicao.template_segundos += time.perf_counter() - inicio
+
+
+class TemplatesInstrumentados(DjangoTemplates):
+    """O backend padrão de templates, cronometrando cada render() de página."""
+
+    def from_string(self, template_code):
+        return _TemplateInstrumentado(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return _TemplateInstrumentado(super().get_template(template_name).template, self)
+
+
+class InstrumentacaoMiddleware:
+    """Mede cada requisição (ver docstring do módulo). Desligue com INSTRUMENTACAO_ATIVA=False."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTACAO_ATIVA:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        medicao = Medicao(request.path)
+        token = _medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+        self._registrar(request, response, medicao, time.perf_counter() - inicio)
+        return response
+
+    async def __acall__(self, request):
+        medicao = Medicao(request.path)
+        token = _medicao_atual.set(medicao)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicao_atual.reset(token)
+        self._registrar(request, response, medicao, time.perf_counter() - inicio)
+        return response
+
+    def _registrar(self, request, response, medicao, segundos):
+        # Nome da rota (nunca a URL: ids criariam uma série por ficha)
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "nao_encontrada"
+        metodo = request.method if request.method in METODOS else "OUTRO"
+
+        registro.observar("clinicflow_requisicao_segundos", (("view", view), ("metodo", metodo)), segundos)
+        registro.observar("clinicflow_requisicao_consultas", (("view", view),), medicao.consultas)
+        registro.observar("clinicflow_sql_segundos", (("view", view),), medicao.sql_segundos)
+        registro.observar("clinicflow_template_segundos", (("view", view),), medicao.template_segundos)
+        registro.incrementar(
+            "clinicflow_respostas_total", (("view", view), ("status", f"{response.status_code // 100}xx")),
+        )
+        if medicao.lentas:
+            registro.incrementar("clinicflow_consultas_lentas_total", (("view", view),), medicao.lentas)
+
+        if medicao.repeticoes:
+            sql, vezes = medicao.repeticoes.most_common(1)[0]
+            if vezes >= settings.INSTRUMENTACAO_N_MAIS_UM:
+                registro.incrementar("clinicflow_n_mais_um_total", (("view", view),))
+                logger.warning(
+                    "Possível N+1 em %s: mesma consulta %d vezes", view, vezes,
+                    extra={"evento": "n_mais_um", "view": view, "repeticoes": vezes, "sql": sql[:SQL_NO_LOG]},
+                )
@@ -0,0 +1,174 @@
+"""
+Listas do admin para tabelas enormes (fichas, pacientes).
+
+O changelist padrão não aguenta dezenas de milhões de linhas: faz COUNT(*)
+da tabela a cada página (duas vezes, com filtro), pagina com OFFSET (a
+página 5000 lê e descarta 250 mil linhas) e ordena pelo que o usuário clicar.
+ListaGrandeAdmin troca isso por:
+
+- contagem estimada pelo planner (EXPLAIN) quando passa de CONTAGEM_EXATA_ATE;
+  abaixo disso, o COUNT de verdade é barato;
+- paginação por cursor (keyset) em (campo_data, id), do mais novo para o
+  mais antigo: "próxima página" é WHERE (campo_data, id) < (último da
+  página), direto no índice (campo_data, id), em qualquer profundidade;
+- sem ordenação por coluna (cada uma precisaria de índice próprio);
+- filtro de período com padrão (últimos `dias_padrao` dias), para a lista
+  inicial não varrer a tabela. Com busca, o período só vale se escolhido.
+
+A busca de cada admin (get_search_results) deve tentar primeiro o que é
+exato e indexado (CPF, código da senha) antes de cair na busca por nome.
+"""
+from datetime import datetime, timedelta
+
+from django.contrib import admin
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.core.paginator import Page, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+CONTAGEM_EXATA_ATE = 10_000
+CURSOR_VAR = "apos"
+
+
+def contagem_estimada(queryset) -> int | None:
+    """Linhas que o planner espera para o queryset (None se não deu para estimar)."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plano = cursor.fetchone()[0]
+    try:
+        return int(plano[0]["Plan"]["Plan Rows"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+class PaginadorEstimado(Paginator):
+    """Paginator cujo count vem do planner quando a lista é grande."""
+
+    estimado = False
+
+    @cached_property
+    def count(self):
+        estimativa = contagem_estimada(self.object_list)
+        if estimativa is None or estimativa < CONTAGEM_EXATA_ATE:
+            return super().count
+        self.estimado = True
+        return estimativa
+
+
+class PaginadorKeyset(PaginadorEstimado):
+    """
+    Páginas por cursor em (campo, pk), decrescente. page() ignora o número:
+    devolve a página depois de `apos` (None: a primeira). O cursor da próxima
+    fica em `proximo` (None na última).
+    """
+
+    def __init__(self, object_list, per_page, campo, apos=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.campo = campo
+        self.apos = apos
+        self.proximo = None
+
+    def validate_number(self, number):
+        # Não há página N (?p= é ignorado)
+        return 1
+
+    def page(self, number):
+        itens = self.object_list
+        if self.apos is not None:
+            valor, pk = self.apos
+            # O <= sozinho já delimita o trecho do índice; o OR desempata pelo id
+            itens = itens.filter(**{f"{self.campo}__lte": valor}).filter(
+                Q(**{f"{self.campo}__lt": valor}) | Q(**{self.campo: valor, "pk__lt": pk})
+            )
+        itens = list(itens[: self.per_page + 1])
+        if len(itens) > self.per_page:
+            ultimo = itens[self.per_page - 1]
+            self.proximo = f"{getattr(ultimo, self.campo).isoformat()}_{ultimo.pk}"
+        return Page(itens[: self.per_page], 1, self)
+
+
+def ler_cursor(valor):
+    """(datetime, pk) do parâmetro da URL; None se ausente ou inválido (volta à primeira página)."""
+    momento, _, pk = (valor or "").rpartition("_")
+    try:
+        return datetime.fromisoformat(momento), int(pk)
+    except ValueError:
+        return None
+
+
+def filtro_periodo(campo, dias_padrao):
+    """Filtro lateral "Período" em `campo`, com os últimos `dias_padrao` dias já escolhidos."""
+
+    class FiltroPeriodo(admin.SimpleListFilter):
+        title = "período"
+        parameter_name = "periodo"
+        padrao = str(dias_padrao)
+
+        def lookups(self, request, model_admin):
+            opcoes = {dias_padrao, 7, 30, 90, 365}
+            return [(str(d), f"Últimos {d} dias") for d in sorted(opcoes)] + [("tudo", "Tudo")]
+
+        def value(self):
+            valor = super().value()
+            if valor is None and not self.buscando:
+                return self.padrao
+            return valor
+
+        def queryset(self, request, queryset):
+            valor = self.value()
+            if valor is None or valor == "tudo" or not valor.isdigit():
+                return queryset
+            return queryset.filter(**{f"{campo}__gte": timezone.now() - timedelta(days=int(valor))})
+
+        def choices(self, changelist):
+            # Sem o "Todos" do Django: "Tudo" é uma opção explícita
+            for valor, titulo in self.lookup_choices:
+                yield {
+                    "selected": self.value() == valor,
+                    "query_string": changelist.get_query_string({self.parameter_name: valor}),
+                    "display": titulo,
+                }
+
+        def __init__(self, request, params, model, model_admin):
+            self.buscando = bool(request.GET.get(SEARCH_VAR))
+            super().__init__(request, params, model, model_admin)
+
+    return FiltroPeriodo
+
+
+class ListaGrandeAdmin(admin.ModelAdmin):
+    """ModelAdmin para tabelas enormes (ver docstring do módulo)."""
+
+    campo_data = "criado_em"
+    dias_padrao = 7
+    show_full_result_count = False
+    sortable_by = ()
+    list_max_show_all = 0
+
+    def get_ordering(self, request):
+        return (f"-{self.campo_data}", "-pk")
+
+    def get_list_filter(self, request):
+        return (filtro_periodo(self.campo_data, self.dias_padrao), *super().get_list_filter(request))
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return PaginadorKeyset(
+            queryset, per_page, self.campo_data, getattr(request, "cursor_lista", None),
+            orphans=orphans, allow_empty_first_page=allow_empty_first_page,
+        )
+
+    def changelist_view(self, request, extra_context=None):
+        # O cursor não é filtro: sai do GET antes do ChangeList validar os parâmetros
+        if CURSOR_VAR in request.GET:
+            request.GET = request.GET.copy()
+            request.cursor_lista = ler_cursor(request.GET.pop(CURSOR_VAR)[-1])
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, "context_data", {}).get("cl")
+        if changelist is not None:
+            paginador = changelist.paginator
+            paginador.proxima_url = paginador.proximo and changelist.get_query_string({CURSOR_VAR: paginador.proximo})
+            paginador.primeira_url = paginador.apos and changelist.get_query_string(remove=[CURSOR_VAR])
+        return response
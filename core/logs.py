@@ -0,0 +1,54 @@
+"""
+Log estruturado (uma linha JSON por registro) e sem travar a requisição.
+
+FormatadorJSON: os campos passados em extra={...} viram chaves do JSON, para
+o agregador de logs filtrar por evento/view/ms sem expressão regular.
+
+FilaHandler: quem loga só põe o registro numa fila em memória; uma thread
+separada formata e escreve no stderr. Um stdout/stderr lento (terminal,
+docker logs sob carga) não segura mais o worker no meio da requisição.
+"""
+import atexit
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# Atributos que todo LogRecord tem: o que sobrar veio do extra=
+_PADRAO = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class FormatadorJSON(logging.Formatter):
+    def format(self, record):
+        dados = {
+            "em": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensagem": record.getMessage(),
+        }
+        dados.update({chave: valor for chave, valor in vars(record).items() if chave not in _PADRAO})
+        if record.exc_info:
+            dados["excecao"] = self.formatException(record.exc_info)
+        return json.dumps(dados, ensure_ascii=False, default=str)
+
+
+class FilaHandler(QueueHandler):
+    """StreamHandler atrás de uma fila: a escrita acontece noutra thread."""
+
+    def __init__(self):
+        super().__init__(queue.SimpleQueue())
+        self.saida = logging.StreamHandler()
+        self.listener = QueueListener(self.queue, self.saida)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def setFormatter(self, fmt):
+        # Quem formata é a thread de saída
+        self.saida.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Mesma memória, sem pickle: só congela a mensagem (os args podem
+        # mudar depois) e deixa exc_info para o formatador
+        record.msg = record.getMessage()
+        record.args = None
+        return record
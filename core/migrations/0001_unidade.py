@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+from . import UNIDADE_INICIAL
+
+
+def criar_unidade_inicial(apps, schema_editor):
+    Unidade = apps.get_model("core", "Unidade")
+    Unidade.objects.create(id=UNIDADE_INICIAL, nome="Unidade Principal", slug="principal")
+    # id explícito não avança a sequence: a próxima unidade sairia com id 1
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT setval(pg_get_serial_sequence('core_unidade', 'id'), (SELECT max(id) FROM core_unidade))")
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Unidade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100)),
+                ('slug', models.SlugField(unique=True)),
+            ],
+            options={
+                'verbose_name': 'Unidade',
+                'verbose_name_plural': 'Unidades',
+                'ordering': ['nome'],
+            },
+        ),
+        migrations.RunPython(criar_unidade_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,3 @@
+# Id da unidade criada em 0001_unidade: fichas, senhas e eventos que já
+# existiam passam a ser dela (attendance 0012_unidade)
+UNIDADE_INICIAL = 1
@@ -1,3 +1,19 @@
 from django.db import models
 
-# Create your models here.
+
+class Unidade(models.Model):
+    """
+    Uma clínica/UPA. Cada unidade tem suas próprias filas, senhas, painéis e
+    plantões; o cadastro de pacientes é único para todas.
+    """
+    nome = models.CharField(max_length=100)
+    # Identifica a unidade nas URLs das TVs (?unidade=<slug>)
+    slug = models.SlugField(max_length=50, unique=True)
+
+    class Meta:
+        verbose_name = "Unidade"
+        verbose_name_plural = "Unidades"
+        ordering = ["nome"]
+
+    def __str__(self):
+        return self.nome
@@ -0,0 +1,278 @@
+"""
+Réplicas de leitura do PostgreSQL.
+
+As TVs, as listas das estações, os relatórios e a exportação só leem, e
+competem com as transições (UPDATE das fichas) pelo mesmo servidor. Com
+réplicas configuradas (settings.REPLICAS_LEITURA, ver DB_REPLICAS no
+.env.example), o RoteadorReplicas manda para elas as leituras de quem
+pediu:
+
+- views com @ler_da_replica (painéis, listas, relatórios, exportação);
+- código com `with em_replica():` (comandos de relatório/exportação).
+
+Todo o resto (e toda escrita) continua na primária. Mesmo dentro de
+em_replica, a leitura volta para a primária quando:
+
+- há uma transação aberta na primária (ler o que se acabou de escrever) e
+  nenhuma numa réplica (quem abriu transação numa réplica continua nela);
+- a requisição já escreveu, ou o mesmo navegador escreveu há menos de
+  REPLICA_ATRASO_MAXIMO_S segundos (ReplicaMiddleware guarda isso num
+  cookie): o redirect depois de chamar um paciente não mostra a lista velha.
+  "Escreveu" é qualquer INSERT/UPDATE/DELETE na primária, visto pelo
+  execute_wrapper marcar_escrita (as transições são SQL cru, não passam
+  pelo db_for_write do roteador);
+- nenhuma réplica está com atraso de replicação abaixo de
+  REPLICA_ATRASO_MAXIMO_S (ou nenhuma responde). O atraso de cada uma é
+  medido no máximo a cada VERIFICAR_A_CADA segundos por processo.
+
+Caches preenchidos a partir do banco (fila_cache.reconstruir) leem sempre
+da primária (`with primaria():`): uma réplica atrasada deixaria a fila
+velha no cache até a próxima transição.
+
+Sem réplicas configuradas o roteador não muda nada.
+"""
+import logging
+import math
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+COOKIE = "clinicflow_primaria"
+VERIFICAR_A_CADA = 2.0
+
+# Atraso (segundos) de uma réplica; 0 se ela não está em recovery (banco de
+# teste local apontado como réplica)
+_SQL_ATRASO = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+# Comandos que escrevem (o CTE das transições começa por WITH ... UPDATE)
+_ESCRITA = re.compile(r"\s*(INSERT|UPDATE|DELETE|MERGE|COPY|WITH\b.*\b(INSERT|UPDATE|DELETE)\b)", re.IGNORECASE | re.DOTALL)
+
+_REPLICA, _PRIMARIA = "replica", "primaria"
+_modo = ContextVar("replicas_modo", default=None)
+_requisicao = ContextVar("replicas_requisicao", default=None)
+
+
+class _Fixacao:
+    """Estado da requisição: mutável, para valer também dentro do sync_to_async."""
+
+    __slots__ = ("primaria", "escreveu")
+
+    def __init__(self, primaria=False):
+        self.primaria = primaria
+        self.escreveu = False
+
+
+def replicas() -> list:
+    return settings.REPLICAS_LEITURA
+
+
+# --- ATRASO ------------------------------------------------------------------
+
+_medicoes = {}  # alias -> (quando, atraso)
+_lock = threading.Lock()
+
+
+def medir_atraso(alias) -> float:
+    """Atraso de replicação da réplica em segundos (infinito se não respondeu)."""
+    conexao = connections[alias]
+    if conexao.vendor != "postgresql":
+        return 0.0
+    try:
+        with conexao.cursor() as cursor:
+            cursor.execute(_SQL_ATRASO)
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        logger.exception("Réplica %s não respondeu; lendo da primária", alias)
+        return math.inf
+
+
+def atraso(alias) -> float:
+    """medir_atraso() guardado por VERIFICAR_A_CADA segundos."""
+    agora = time.monotonic()
+    with _lock:
+        medicao = _medicoes.get(alias)
+    if medicao is not None and agora - medicao[0] < VERIFICAR_A_CADA:
+        return medicao[1]
+    valor = medir_atraso(alias)
+    if valor > settings.REPLICA_ATRASO_MAXIMO_S and (medicao is None or medicao[1] <= settings.REPLICA_ATRASO_MAXIMO_S):
+        logger.warning(
+            "Réplica %s atrasada (%.1f s); leituras vão para a primária", alias, valor,
+            extra={"evento": "replica_atrasada", "replica": alias, "atraso_s": valor},
+        )
+    with _lock:
+        _medicoes[alias] = (agora, valor)
+    return valor
+
+
+def esquecer_atrasos() -> None:
+    with _lock:
+        _medicoes.clear()
+
+
+def replica_disponivel():
+    """Uma réplica dentro do atraso aceito (sorteada entre as boas), ou None."""
+    boas = [alias for alias in replicas() if atraso(alias) <= settings.REPLICA_ATRASO_MAXIMO_S]
+    return random.choice(boas) if boas else None
+
+
+# --- ESCOLHA -------------------------------------------------------------------
+
+def _fixada() -> bool:
+    fixacao = _requisicao.get()
+    return fixacao is not None and (fixacao.primaria or fixacao.escreveu)
+
+
+def banco_de_leitura() -> str:
+    """Alias de onde ler agora (para fixar com .using() o que roda depois, como o streaming)."""
+    if _modo.get() != _REPLICA or not replicas() or _fixada():
+        return DEFAULT_DB_ALIAS
+    # Transação aberta numa réplica (ex.: com statement_timeout): fica nela
+    for conexao in connections.all(initialized_only=True):
+        if conexao.in_atomic_block and conexao.alias in replicas():
+            return conexao.alias
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    return replica_disponivel() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def em_replica():
+    """Leituras do bloco podem ir para uma réplica."""
+    token = _modo.set(_REPLICA)
+    try:
+        yield
+    finally:
+        _modo.reset(token)
+
+
+@contextmanager
+def primaria():
+    """Leituras do bloco vão para a primária, mesmo dentro de em_replica()."""
+    token = _modo.set(_PRIMARIA)
+    try:
+        yield
+    finally:
+        _modo.reset(token)
+
+
+def ler_da_replica(view):
+    """Decorator de views (síncronas ou assíncronas) que só leem."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def envolvida(*args, **kwargs):
+            with em_replica():
+                return await view(*args, **kwargs)
+    else:
+        @wraps(view)
+        def envolvida(*args, **kwargs):
+            with em_replica():
+                return view(*args, **kwargs)
+    return envolvida
+
+
+class RoteadorReplicas:
+    """settings.DATABASE_ROUTERS (ver docstring do módulo)."""
+
+    def db_for_read(self, model, **hints):
+        alias = banco_de_leitura()
+        return None if alias == DEFAULT_DB_ALIAS else alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primária e réplicas têm os mesmos dados
+        bancos = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in bancos and obj2._state.db in bancos:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # As réplicas recebem o schema pela replicação
+        return False if db in replicas() else None
+
+
+def marcar_escrita(execute, sql, params, many, context):
+    """execute_wrapper da primária: anota na requisição que ela escreveu."""
+    fixacao = _requisicao.get()
+    if fixacao is not None and not fixacao.escreveu and _ESCRITA.match(sql):
+        fixacao.escreveu = True
+    return execute(sql, params, many, context)
+
+
+def instalar_em_conexao(sender, connection, **kwargs):
+    """Receiver de connection_created (só a primária, e só com réplicas)."""
+    if replicas() and connection.alias == DEFAULT_DB_ALIAS and marcar_escrita not in connection.execute_wrappers:
+        connection.execute_wrappers.append(marcar_escrita)
+
+
+# --- MIDDLEWARE ------------------------------------------------------------
+
+class ReplicaMiddleware:
+    """
+    Read-your-writes entre requisições: quem escreveu lê da primária por
+    REPLICA_ATRASO_MAXIMO_S segundos (cookie). Só existe com réplicas.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        fixacao = self._fixacao(request)
+        token = _requisicao.set(fixacao)
+        try:
+            response = self.get_response(request)
+        finally:
+            _requisicao.reset(token)
+        return self._marcar(response, fixacao)
+
+    async def __acall__(self, request):
+        fixacao = self._fixacao(request)
+        token = _requisicao.set(fixacao)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _requisicao.reset(token)
+        return self._marcar(response, fixacao)
+
+    def _fixacao(self, request):
+        try:
+            ate = float(request.COOKIES.get(COOKIE, 0))
+        except ValueError:
+            ate = 0
+        return _Fixacao(primaria=ate > time.time())
+
+    def _marcar(self, response, fixacao):
+        if fixacao.escreveu:
+            segundos = settings.REPLICA_ATRASO_MAXIMO_S
+            response.set_cookie(
+                COOKIE, f"{time.time() + segundos:.3f}", max_age=math.ceil(segundos), httponly=True, samesite="Lax",
+            )
+        return response
@@ -1,3 +1,201 @@
-from django.test import TestCase
+import json
+import logging
+import math
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from patients.models import Patient
+
+from . import replicas
+from .instrumentacao import InstrumentacaoMiddleware, registro
+from .logs import FormatadorJSON
+
+
+class InstrumentacaoTests(TestCase):
+    def setUp(self):
+        registro.limpar()
+        self.addCleanup(registro.limpar)
+
+    def test_mede_latencia_consultas_e_templates_por_rota(self):
+        # Logado: sessão e usuário são consultados em toda requisição
+        self.client.force_login(get_user_model().objects.create_user("enfermeira"))
+        self.client.get("/triagem/")
+        self.client.get("/triagem/")
+
+        latencia = registro.valor("clinicflow_requisicao_segundos", view="attendance:triagem_lista", metodo="GET")
+        self.assertEqual(latencia.total, 2)
+        consultas = registro.valor("clinicflow_requisicao_consultas", view="attendance:triagem_lista")
+        self.assertGreaterEqual(consultas.soma, 4)
+        self.assertGreater(registro.valor("clinicflow_template_segundos", view="attendance:triagem_lista").soma, 0)
+        self.assertEqual(registro.valor("clinicflow_respostas_total", view="attendance:triagem_lista", status="2xx"), 2)
+
+        # Ids na URL não criam séries novas; URL desconhecida cai numa série só
+        self.client.get("/triagem/finalizar/999999/")
+        self.client.get("/nao-existe/")
+        self.assertIsNotNone(
+            registro.valor("clinicflow_respostas_total", view="attendance:triagem_finalizar", status="4xx"),
+        )
+        self.assertEqual(registro.valor("clinicflow_respostas_total", view="nao_encontrada", status="4xx"), 1)
+
+    @override_settings(INSTRUMENTACAO_N_MAIS_UM=3, INSTRUMENTACAO_CONSULTA_LENTA_MS=0)
+    def test_loga_n_mais_um_e_consulta_lenta(self):
+        User = get_user_model()
+
+        def view(request):
+            for i in range(4):
+                User.objects.filter(id=i).exists()
+            return HttpResponse("ok")
+
+        request = RequestFactory().get("/qualquer/")
+        with self.assertLogs("core.instrumentacao", "WARNING") as logs:
+            InstrumentacaoMiddleware(view)(request)
+
+        eventos = [r.evento for r in logs.records]
+        self.assertEqual(eventos.count("consulta_lenta"), 4)
+        self.assertEqual(eventos.count("n_mais_um"), 1)
+        self.assertEqual(registro.valor("clinicflow_n_mais_um_total", view="nao_encontrada"), 1)
+
+    def test_endpoint_prometheus(self):
+        self.client.get("/triagem/")
+        self.assertEqual(self.client.get("/metricas/").status_code, 403)
+
+        self.client.force_login(get_user_model().objects.create_user("admin", is_staff=True))
+        resposta = self.client.get("/metricas/")
+        self.assertEqual(resposta.status_code, 200)
+        texto = resposta.content.decode()
+        self.assertIn("# TYPE clinicflow_requisicao_segundos histogram", texto)
+        rotulos = 'view="attendance:triagem_lista",metodo="GET"'
+        self.assertIn(f'clinicflow_requisicao_segundos_bucket{{{rotulos},le="+Inf"}} 1', texto)
+        self.assertIn(f'clinicflow_requisicao_segundos_count{{{rotulos}}} 1', texto)
+
+        self.client.logout()
+        with self.settings(METRICAS_TOKEN="segredo"):
+            self.assertEqual(self.client.get("/metricas/", HTTP_AUTHORIZATION="Bearer errado").status_code, 403)
+            self.assertEqual(self.client.get("/metricas/", HTTP_AUTHORIZATION="Bearer segredo").status_code, 200)
+
+
+@override_settings(REPLICAS_LEITURA=["replica_teste"], REPLICA_ATRASO_MAXIMO_S=5)
+class RoteadorReplicasTests(SimpleTestCase):
+    """Decisão do roteador (sem banco: o atraso das réplicas é simulado)."""
+
+    def setUp(self):
+        replicas.esquecer_atrasos()
+        self.addCleanup(replicas.esquecer_atrasos)
+        self.roteador = replicas.RoteadorReplicas()
+        self.atraso = mock.patch.object(replicas, "medir_atraso", return_value=0.5).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def _leitura(self):
+        return self.roteador.db_for_read(Patient)
+
+    def test_so_le_da_replica_quando_pedido(self):
+        self.assertIsNone(self._leitura())
+        with replicas.em_replica():
+            self.assertEqual(self._leitura(), "replica_teste")
+            with replicas.primaria():
+                self.assertIsNone(self._leitura())
+            with mock.patch.object(connections[DEFAULT_DB_ALIAS], "in_atomic_block", True):
+                self.assertIsNone(self._leitura())
+        self.assertEqual(self.roteador.db_for_write(Patient), DEFAULT_DB_ALIAS)
+        self.assertIs(self.roteador.allow_migrate("replica_teste", "patients"), False)
+
+    def test_replica_atrasada_ou_fora_do_ar_volta_para_a_primaria(self):
+        with replicas.em_replica():
+            self._leitura()
+            self._leitura()
+            self.assertEqual(self.atraso.call_count, 1)  # medido uma vez a cada VERIFICAR_A_CADA
+
+            for atraso in (30, math.inf):
+                replicas.esquecer_atrasos()
+                self.atraso.return_value = atraso
+                with self.assertLogs("core.replicas", "WARNING"):
+                    self.assertIsNone(self._leitura())
+
+    def test_cookie_de_quem_escreveu_fixa_a_primaria(self):
+        def view(request):
+            with replicas.em_replica():
+                return HttpResponse(replicas.banco_de_leitura())
+
+        middleware = replicas.ReplicaMiddleware(view)
+        fabrica = RequestFactory()
+        self.assertEqual(middleware(fabrica.get("/")).content, b"replica_teste")
+        fabrica.cookies[replicas.COOKIE] = str(time.time() + 5)
+        self.assertEqual(middleware(fabrica.get("/")).content, b"default")
+        fabrica.cookies[replicas.COOKIE] = str(time.time() - 1)
+        self.assertEqual(middleware(fabrica.get("/")).content, b"replica_teste")
+
+
+@override_settings(REPLICAS_LEITURA=["replica_teste"], REPLICA_ATRASO_MAXIMO_S=5)
+class ReplicaMiddlewareTests(TestCase):
+    def test_escrita_na_primaria_grava_o_cookie(self):
+        def le(request):
+            Patient.objects.filter(cpf="1").exists()
+            return HttpResponse("ok")
+
+        def escreve(request):
+            # Como as transições: SQL cru, sem passar pelo db_for_write
+            with connection.cursor() as cursor:
+                cursor.execute("WITH p AS (UPDATE patients_patient SET nome = nome WHERE cpf = '1' RETURNING id) SELECT 1")
+            return HttpResponse("ok")
+
+        with connection.execute_wrapper(replicas.marcar_escrita):
+            lida = replicas.ReplicaMiddleware(le)(RequestFactory().get("/"))
+            escrita = replicas.ReplicaMiddleware(escreve)(RequestFactory().get("/"))
+        self.assertNotIn(replicas.COOKIE, lida.cookies)
+        self.assertEqual(escrita.cookies[replicas.COOKIE]["max-age"], 5)
+
+
+@skipUnless(settings.REPLICAS_LEITURA, "sem réplicas (DB_REPLICAS)")
+class ReplicasIntegracaoTests(TransactionTestCase):
+    """Com DB_REPLICAS configurado (localmente, p. ex. o mesmo banco: DB_REPLICAS=127.0.0.1:5432)."""
+
+    serialized_rollback = True
+    databases = "__all__"
+
+    def test_lista_le_da_replica_ate_alguem_escrever(self):
+        replicas.esquecer_atrasos()
+        alias = settings.REPLICAS_LEITURA[0]
+        self.client.force_login(get_user_model().objects.create_user("lancamento", is_staff=True))
+
+        with CaptureQueriesContext(connections[alias]) as na_replica:
+            self.assertEqual(self.client.get("/lancamento/").status_code, 200)
+        self.assertTrue(any("accounts_user" in q["sql"] for q in na_replica.captured_queries))
+
+        self.client.post("/medico/plantao/", {"sala": "Consultório 1"})
+        self.assertIn(replicas.COOKIE, self.client.cookies)
+        with CaptureQueriesContext(connections[alias]) as na_replica:
+            self.client.get("/lancamento/")
+        self.assertEqual(na_replica.captured_queries, [])
+
+
+class FormatadorJSONTests(TestCase):
+    def test_extra_vira_campo(self):
+        registro_log = logging.LogRecord("teste", logging.WARNING, __file__, 1, "Fila %s", ("CHEGADA",), None)
+        registro_log.evento = "fila"
+        registro_log.ms = 12.5
+        dados = json.loads(FormatadorJSON().format(registro_log))
+        self.assertEqual(
+            {k: dados[k] for k in ("nivel", "logger", "mensagem", "evento", "ms")},
+            {"nivel": "WARNING", "logger": "teste", "mensagem": "Fila CHEGADA", "evento": "fila", "ms": 12.5},
+        )
+
+
+class LoggingConfigTests(TestCase):
+    @override_settings(ADMINS=["admin@example.com"])
+    def test_erro_do_django_ainda_vai_por_email(self):
+        # Sem assertLogs: ele troca os handlers e o mail_admins não receberia
+        with mock.patch("core.logs.FilaHandler.emit"):
+            logging.getLogger("django.request").error("Internal Server Error: /painel/")
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_acessos_do_runserver_continuam_no_log(self):
+        self.assertTrue(logging.getLogger("django.server").isEnabledFor(logging.INFO))
+        self.assertFalse(logging.getLogger("django.request").isEnabledFor(logging.WARNING))
@@ -0,0 +1,95 @@
+"""
+De qual unidade é esta requisição.
+
+Estações com login usam a unidade do usuário (User.unidade). As TVs não
+fazem login: a URL do painel diz a unidade (?unidade=<slug>). Sem nada disso
+vale a unidade padrão (a primeira cadastrada), então uma instalação com uma
+unidade só continua funcionando sem configurar nada.
+
+slug -> id fica no cache do Django: as TVs consultam o painel a cada poucos
+segundos e a resposta 304 não pode ir ao banco.
+
+Os painéis são views assíncronas: para elas há as versões a* (cache e ORM
+assíncronos, usuário por request.auser()).
+"""
+from django.core.cache import cache
+from django.http import Http404
+
+from .models import Unidade
+
+CACHE_SEGUNDOS = 300
+CHAVE_PADRAO = "unidade:padrao"
+
+
+def _chave_slug(slug):
+    return f"unidade:slug:{slug}"
+
+
+def _padrao():
+    return Unidade.objects.order_by("id").values_list("id", flat=True)
+
+
+def _por_slug(slug):
+    return Unidade.objects.filter(slug=slug).values_list("id", flat=True)
+
+
+def unidade_padrao_id() -> int:
+    return cache.get_or_set(CHAVE_PADRAO, lambda: _padrao().first(), CACHE_SEGUNDOS)
+
+
+def unidade_id_por_slug(slug: str):
+    """Id da unidade (None se o slug não existe)."""
+    # 0 = "não existe", também guardado no cache
+    unidade_id = cache.get_or_set(_chave_slug(slug), lambda: _por_slug(slug).first() or 0, CACHE_SEGUNDOS)
+    return unidade_id or None
+
+
+async def aunidade_padrao_id() -> int:
+    unidade_id = await cache.aget(CHAVE_PADRAO)
+    if unidade_id is None:
+        unidade_id = await _padrao().afirst()
+        await cache.aset(CHAVE_PADRAO, unidade_id, CACHE_SEGUNDOS)
+    return unidade_id
+
+
+async def aunidade_id_por_slug(slug: str):
+    unidade_id = await cache.aget(_chave_slug(slug))
+    if unidade_id is None:
+        unidade_id = await _por_slug(slug).afirst() or 0
+        await cache.aset(_chave_slug(slug), unidade_id, CACHE_SEGUNDOS)
+    return unidade_id or None
+
+
+def unidade_da_requisicao(request) -> int:
+    """Id da unidade da requisição (?unidade=, depois a do usuário, depois a padrão). 404 se o slug não existe."""
+    if not hasattr(request, "unidade_id"):
+        slug = request.GET.get("unidade")
+        user = getattr(request, "user", None)
+        if slug:
+            unidade_id = unidade_id_por_slug(slug)
+            if unidade_id is None:
+                raise Http404("Unidade inexistente.")
+        elif user is not None and user.is_authenticated and user.unidade_id:
+            unidade_id = user.unidade_id
+        else:
+            unidade_id = unidade_padrao_id()
+        request.unidade_id = unidade_id
+    return request.unidade_id
+
+
+async def aunidade_da_requisicao(request) -> int:
+    """unidade_da_requisicao() para views assíncronas."""
+    if not hasattr(request, "unidade_id"):
+        slug = request.GET.get("unidade")
+        if slug:
+            unidade_id = await aunidade_id_por_slug(slug)
+            if unidade_id is None:
+                raise Http404("Unidade inexistente.")
+        else:
+            user = await request.auser() if hasattr(request, "auser") else None
+            if user is not None and user.is_authenticated and user.unidade_id:
+                unidade_id = user.unidade_id
+            else:
+                unidade_id = await aunidade_padrao_id()
+        request.unidade_id = unidade_id
+    return request.unidade_id
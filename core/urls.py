@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = "core"
+
+urlpatterns = [
+    # Instrumentação das requisições para o Prometheus (ver core/instrumentacao.py)
+    path("metricas/", views.metricas, name="metricas"),
+]
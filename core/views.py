@@ -1,4 +1,22 @@
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from .instrumentacao import registro
 
 def home(request):
     return render(request, "home.html")
+
+
+def metricas(request):
+    """Histogramas das requisições no formato texto do Prometheus."""
+    if settings.METRICAS_TOKEN:
+        autorizado = constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {settings.METRICAS_TOKEN}",
+        )
+    else:
+        autorizado = request.user.is_authenticated and request.user.is_staff
+    if not autorizado:
+        return HttpResponse(status=403)
+    return HttpResponse(registro.exportar(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,9 +1,21 @@
 from django.contrib import admin
+
+from core.listas import ListaGrandeAdmin
+
+from .busca import filtro_busca
 from .models import Patient
 
 
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
+class PatientAdmin(ListaGrandeAdmin):
     list_display = ("nome", "cpf", "telefone", "data_nascimento", "criado_em")
     search_fields = ("nome", "cpf")
-    ordering = ("-criado_em",)
+    # Cadastro muda pouco: a lista inicial mostra o último mês
+    dias_padrao = 30
+
+    def get_search_results(self, request, queryset, search_term):
+        # Mesma busca indexada da recepção, em vez de ILIKE '%x%' na tabela inteira
+        if not search_term:
+            return queryset, False
+        filtro = filtro_busca(search_term)
+        return (queryset.filter(filtro) if filtro is not None else queryset.none()), False
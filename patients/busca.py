@@ -0,0 +1,105 @@
+"""
+Busca de pacientes enquanto a recepção digita (CPF, nome ou nome da mãe).
+
+- Só dígitos: começo do CPF (coluna cpf_digitos, índice btree com LIKE '123%').
+- Texto, sem acento e sem diferenciar maiúsculas (colunas *_busca):
+  1. o nome do jeito que foi digitado, pelo começo (btree, LIKE 'maria da s%');
+     é o caso comum na recepção e não custa nada;
+  2. se faltar resultado, cada palavra (3+ letras) em qualquer parte do nome
+     ou do nome da mãe (índices GIN do pg_trgm);
+  3. nada ainda? Por semelhança (erro de digitação), com tempo limitado.
+
+Ordenar todos os "maria" de uma base de 2 milhões custaria caro: a ordenação
+por semelhança é feita só sobre os primeiros CANDIDATOS encontrados no índice.
+"""
+import logging
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import OperationalError, connection, transaction
+from django.db.models import Q
+from django.db.models.functions import Greatest
+
+from .models import ACENTOS, SEM_ACENTOS, Patient
+
+logger = logging.getLogger(__name__)
+
+MIN_CARACTERES = 3
+CANDIDATOS = 200
+LIMITE_SEMELHANCA = "300ms"
+
+_SEM_ACENTO = str.maketrans(ACENTOS, SEM_ACENTOS)
+
+
+def normalizar_busca(texto: str) -> str:
+    """Igual às colunas nome_busca/nome_mae_busca: sem acento, minúsculo, espaços simples."""
+    return " ".join(texto.translate(_SEM_ACENTO).lower().split())
+
+
+def _so_cpf(termo: str) -> str | None:
+    """Dígitos do termo, se ele for um pedaço de CPF (só números e pontuação)."""
+    if any(c.isalpha() for c in termo):
+        return None
+    return "".join(c for c in termo if c.isdigit()) or None
+
+
+def filtro_busca(termo: str) -> Q | None:
+    """Q que usa os índices da busca (também serve para o admin). None se o termo for curto demais."""
+    digitos = _so_cpf(termo)
+    if digitos:
+        return Q(cpf_digitos__startswith=digitos) if len(digitos) >= MIN_CARACTERES else None
+
+    # Palavras curtas ("da", "de") não geram trigramas: só filtrariam sem usar o índice
+    palavras = [p for p in normalizar_busca(termo).split() if len(p) >= MIN_CARACTERES]
+    if not palavras:
+        return None
+    nome, mae = Q(), Q()
+    for palavra in palavras:
+        nome &= Q(nome_busca__contains=palavra)
+        mae &= Q(nome_mae_busca__contains=palavra)
+    return nome | mae
+
+
+def _mais_parecidos(criterio, texto, limite):
+    """Os `limite` mais parecidos entre os primeiros CANDIDATOS que atendem ao critério."""
+    candidatos = Patient.objects.filter(criterio).values("id")[:CANDIDATOS]
+    return list(
+        Patient.objects.filter(id__in=candidatos)
+        .annotate(relevancia=Greatest(
+            TrigramWordSimilarity(texto, "nome_busca"),
+            TrigramWordSimilarity(texto, "nome_mae_busca"),
+        ))
+        .order_by("-relevancia", "nome")[:limite]
+    )
+
+
+def _semelhantes(texto, limite):
+    """
+    Busca por semelhança, só quando nada bate de verdade. Termos com palavras
+    muito comuns casam com milhares de nomes; o autocomplete não espera:
+    passou de LIMITE_SEMELHANCA, fica sem sugestão.
+    """
+    semelhante = Q(nome_busca__trigram_word_similar=texto) | Q(nome_mae_busca__trigram_word_similar=texto)
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", [LIMITE_SEMELHANCA])
+            return _mais_parecidos(semelhante, texto, limite)
+    except OperationalError:
+        logger.warning("Busca por semelhança cancelada por tempo: %r", texto)
+        return []
+
+
+def buscar_pacientes(termo: str, limite: int = 10) -> list:
+    """Até `limite` pacientes para o autocomplete, os mais parecidos primeiro."""
+    filtro = filtro_busca(termo)
+    if filtro is None:
+        return []
+    if _so_cpf(termo):
+        return list(Patient.objects.filter(filtro).order_by("cpf_digitos")[:limite])
+
+    texto = normalizar_busca(termo)
+    pacientes = list(Patient.objects.filter(nome_busca__startswith=texto).order_by("nome_busca")[:limite])
+    if len(pacientes) < limite:
+        # Completa com quem tem as palavras fora de ordem ou no nome da mãe
+        vistos = {p.id for p in pacientes}
+        pacientes += [p for p in _mais_parecidos(filtro, texto, limite) if p.id not in vistos]
+    return pacientes[:limite] or _semelhantes(texto, limite)
@@ -0,0 +1,12 @@
+from django.core.exceptions import ValidationError
+
+
+def normalizar_cpf(cpf: str) -> str:
+    """
+    CPF no formato do cadastro (000.000.000-00), aceitando com ou sem pontuação.
+    Mesma regra da recepção e da importação em massa.
+    """
+    digits = "".join([c for c in cpf if c.isdigit()])
+    if len(digits) != 11:
+        raise ValidationError("CPF inválido.")
+    return f"{digits[0:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:11]}"
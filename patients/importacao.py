@@ -0,0 +1,148 @@
+"""
+Importação em massa de pacientes (CSV do sistema antigo da unidade).
+
+Lê o arquivo em streaming e grava em lotes: cada lote vai por COPY para uma
+tabela temporária e entra no cadastro com um único
+INSERT ... ON CONFLICT (cpf) DO UPDATE. A memória usada depende só do
+tamanho do lote, não do arquivo: dá para importar 1 milhão de linhas sem
+carregar tudo. (bulk_create(update_conflicts=True) faz o mesmo, mas
+montar o SQL de milhares de objetos custava mais que o próprio banco.)
+
+Colunas reconhecidas pelo cabeçalho: nome, cpf (obrigatórias), telefone,
+nome_mae, data_nascimento (AAAA-MM-DD ou DD/MM/AAAA). Paciente que já existe
+só tem atualizadas as colunas que o arquivo traz: CSV antigo sem telefone
+não apaga o telefone cadastrado.
+"""
+import csv
+from dataclasses import dataclass
+from datetime import date
+from io import StringIO
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from .cpf import normalizar_cpf
+from .models import Patient
+
+OBRIGATORIAS = ("nome", "cpf")
+OPCIONAIS = ("telefone", "nome_mae", "data_nascimento")
+
+_TAMANHOS = {c: Patient._meta.get_field(c).max_length for c in ("nome", "telefone", "nome_mae")}
+
+
+@dataclass
+class ResultadoImportacao:
+    lidas: int = 0
+    gravadas: int = 0
+    rejeitadas: int = 0
+
+
+def _data(valor):
+    # strptime é lento para 1 milhão de linhas: os dois formatos na mão
+    try:
+        if "/" in valor:
+            dia, mes, ano = valor.split("/")
+            return date(int(ano), int(mes), int(dia))
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise ValidationError(f"Data de nascimento inválida: {valor!r}.")
+
+
+def _paciente(linha: dict) -> tuple:
+    """
+    Valida e normaliza uma linha do CSV: (nome, cpf, telefone, nome_mae, data_nascimento).
+    ValidationError se não der para aproveitar.
+    """
+    dados = {c: (linha.get(c) or "").strip() for c in (*OBRIGATORIAS, *OPCIONAIS)}
+    if not dados["nome"]:
+        raise ValidationError("Nome vazio.")
+    for campo, tamanho in _TAMANHOS.items():
+        if len(dados[campo]) > tamanho:
+            raise ValidationError(f"{campo} com mais de {tamanho} caracteres.")
+    return (
+        dados["nome"],
+        normalizar_cpf(dados["cpf"]),
+        dados["telefone"],
+        dados["nome_mae"],
+        _data(dados["data_nascimento"]) if dados["data_nascimento"] else None,
+    )
+
+
+def _gravar(pacientes: dict, opcionais=OPCIONAIS) -> int:
+    """
+    COPY do lote para uma tabela temporária + um único upsert no cadastro.
+    No paciente que já existe, só nome e as `opcionais` (as do cabeçalho) mudam.
+    """
+    buffer = StringIO()
+    csv.writer(buffer).writerows(pacientes.values())
+    buffer.seek(0)
+
+    tabela = connection.ops.quote_name(Patient._meta.db_table)
+    atualizar = ", ".join(f"{c} = EXCLUDED.{c}" for c in ("nome", *opcionais, "atualizado_em"))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            """
+            CREATE TEMP TABLE importacao_paciente (
+                nome text, cpf text, telefone text, nome_mae text, data_nascimento date
+            )
+            """
+        )
+        # Campo vazio vira NULL no COPY; telefone/nome_mae são NOT NULL (string vazia)
+        cursor.copy_expert(
+            "COPY importacao_paciente FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (telefone, nome_mae))",
+            buffer,
+        )
+        cursor.execute(
+            f"""
+            INSERT INTO {tabela} (nome, cpf, telefone, nome_mae, data_nascimento, criado_em, atualizado_em)
+            SELECT nome, cpf, telefone, nome_mae, data_nascimento, now(), now() FROM importacao_paciente
+            ON CONFLICT (cpf) DO UPDATE SET
+                {atualizar}
+            """
+        )
+        # DROP explícito (e não ON COMMIT DROP): o lote pode rodar dentro de uma transação maior
+        cursor.execute("DROP TABLE importacao_paciente")
+    return len(pacientes)
+
+
+def importar_csv(arquivo, *, lote=5000, delimitador=",", ao_rejeitar=None, ao_progresso=None):
+    """
+    Importa pacientes de um arquivo texto já aberto. Retorna ResultadoImportacao.
+
+    ao_rejeitar(numero_linha, linha, motivo) e ao_progresso(resultado) são
+    opcionais (o comando usa para o relatório de rejeitados e o progresso).
+    CPF repetido no arquivo: vale a última ocorrência.
+    """
+    leitor = csv.DictReader(arquivo, delimiter=delimitador)
+    cabecalho = {(c or "").strip().lower() for c in leitor.fieldnames or ()}
+    faltando = [c for c in OBRIGATORIAS if c not in cabecalho]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(faltando)}.")
+    leitor.fieldnames = [(c or "").strip().lower() for c in leitor.fieldnames]
+    # Coluna ausente do arquivo não é "vazia": no upsert ela fica como está
+    opcionais = tuple(c for c in OPCIONAIS if c in cabecalho)
+
+    resultado = ResultadoImportacao()
+    pendentes = {}  # cpf -> linha; o ON CONFLICT não aceita o mesmo CPF duas vezes no lote
+    for linha in leitor:
+        resultado.lidas += 1
+        try:
+            paciente = _paciente(linha)
+        except ValidationError as exc:
+            resultado.rejeitadas += 1
+            if ao_rejeitar:
+                ao_rejeitar(leitor.line_num, linha, " ".join(exc.messages))
+            continue
+
+        pendentes[paciente[1]] = paciente
+        if len(pendentes) >= lote:
+            resultado.gravadas += _gravar(pendentes, opcionais)
+            pendentes = {}
+            if ao_progresso:
+                ao_progresso(resultado)
+
+    if pendentes:
+        resultado.gravadas += _gravar(pendentes, opcionais)
+    if ao_progresso:
+        ao_progresso(resultado)
+    return resultado
@@ -0,0 +1,55 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from patients.importacao import importar_csv
+
+
+class Command(BaseCommand):
+    help = "Importa/atualiza pacientes de um CSV grande (cabeçalho: nome, cpf, telefone, nome_mae, data_nascimento)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("arquivo", help="Caminho do CSV ('-' para ler da entrada padrão).")
+        parser.add_argument("--lote", type=int, default=5000, help="Pacientes por INSERT (padrão 5000).")
+        parser.add_argument("--delimitador", default=",", help="Separador de colunas (padrão ',').")
+        parser.add_argument("--encoding", default="utf-8-sig", help="Codificação do arquivo (padrão utf-8-sig).")
+        parser.add_argument("--rejeitados", help="Grava aqui um CSV com as linhas recusadas e o motivo.")
+
+    def handle(self, *args, arquivo, lote, delimitador, encoding, rejeitados, **options):
+        inicio = time.monotonic()
+
+        def progresso(resultado):
+            segundos = max(time.monotonic() - inicio, 1e-6)
+            self.stdout.write(
+                f"{resultado.lidas} linhas lidas, {resultado.gravadas} gravadas, "
+                f"{resultado.rejeitadas} rejeitadas ({resultado.lidas / segundos:,.0f} linhas/s)"
+            )
+
+        saida_rejeitados = open(rejeitados, "w", newline="", encoding="utf-8") if rejeitados else None
+        relatorio = csv.writer(saida_rejeitados) if saida_rejeitados else None
+        if relatorio:
+            relatorio.writerow(["linha", "motivo", "nome", "cpf"])
+
+        def rejeitar(numero, linha, motivo):
+            if relatorio:
+                relatorio.writerow([numero, motivo, linha.get("nome"), linha.get("cpf")])
+
+        entrada = sys.stdin if arquivo == "-" else open(arquivo, newline="", encoding=encoding)
+        try:
+            resultado = importar_csv(
+                entrada, lote=lote, delimitador=delimitador, ao_rejeitar=rejeitar, ao_progresso=progresso,
+            )
+        except (ValueError, UnicodeDecodeError) as exc:
+            raise CommandError(str(exc))
+        finally:
+            if entrada is not sys.stdin:
+                entrada.close()
+            if saida_rejeitados:
+                saida_rejeitados.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Importação concluída: {resultado.gravadas} pacientes gravados, "
+            f"{resultado.rejeitadas} linhas rejeitadas em {time.monotonic() - inicio:.1f}s."
+        ))
@@ -0,0 +1,55 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:11
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # JANELA DE MANUTENÇÃO: as três colunas geradas (STORED) reescrevem a
+    # tabela de pacientes inteira sob ACCESS EXCLUSIVE. Até o último AddField
+    # terminar, nada lê nem grava pacientes: a recepção para (ordem de
+    # minutos em dezenas de milhões de linhas). Rode fora do horário de
+    # atendimento. Só os índices, depois, são CONCURRENTLY (sem travar as
+    # gravações), e por isso a migration não é atômica.
+    atomic = False
+
+    dependencies = [
+        ('patients', '0001_initial'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='patient',
+            name='cpf_digitos',
+            field=models.GeneratedField(db_persist=True, expression=models.Func(models.F('cpf'), models.Value('\\D'), models.Value(''), models.Value('g'), function='REGEXP_REPLACE'), output_field=models.CharField(db_collation='C', max_length=14)),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='nome_busca',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower(models.Func(models.F('nome'), models.Value('ÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑáàâãäéèêëíìîïóòôõöúùûüçñ'), models.Value('AAAAAEEEEIIIIOOOOOUUUUCNaaaaaeeeeiiiiooooouuuucn'), function='TRANSLATE')), output_field=models.CharField(db_collation='C', max_length=255)),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='nome_mae_busca',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.text.Lower(models.Func(models.F('nome_mae'), models.Value('ÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑáàâãäéèêëíìîïóòôõöúùûüçñ'), models.Value('AAAAAEEEEIIIIOOOOOUUUUCNaaaaaeeeeiiiiooooouuuucn'), function='TRANSLATE')), output_field=models.CharField(max_length=255)),
+        ),
+        AddIndexConcurrently(
+            model_name='patient',
+            index=models.Index(fields=['cpf_digitos'], name='paciente_cpf_digitos_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='patient',
+            index=models.Index(fields=['nome_busca'], name='paciente_nome_busca_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='patient',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['nome_busca'], name='paciente_nome_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        AddIndexConcurrently(
+            model_name='patient',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['nome_mae_busca'], name='paciente_nome_mae_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Índices CONCURRENTLY: a recepção continua cadastrando enquanto indexa
+    atomic = False
+
+    dependencies = [
+        ('patients', '0002_busca_pacientes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='patient',
+            index=models.Index(fields=['criado_em', 'id'], name='paciente_criado_id_idx'),
+        ),
+    ]
@@ -1,4 +1,15 @@
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.db.models.functions import Lower
+
+# Mesma tabela no banco (TRANSLATE) e no Python (busca.normalizar_busca)
+ACENTOS = "ÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇÑáàâãäéèêëíìîïóòôõöúùûüçñ"
+SEM_ACENTOS = "AAAAAEEEEIIIIOOOOOUUUUCNaaaaaeeeeiiiiooooouuuucn"
+
+
+def _texto_busca(campo):
+    """lower(translate(campo, acentos)): coluna calculada pelo próprio PostgreSQL."""
+    return Lower(models.Func(models.F(campo), models.Value(ACENTOS), models.Value(SEM_ACENTOS), function="TRANSLATE"))
 
 
 class Patient(models.Model):
@@ -16,5 +27,33 @@ class Patient(models.Model):
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
 
+    # Colunas geradas (o banco mantém em qualquer INSERT/UPDATE/COPY) para a
+    # busca da recepção: ver patients/busca.py
+    cpf_digitos = models.GeneratedField(
+        expression=models.Func(models.F("cpf"), models.Value(r"\D"), models.Value(""), models.Value("g"), function="REGEXP_REPLACE"),
+        output_field=models.CharField(max_length=14, db_collation="C"),
+        db_persist=True,
+    )
+    nome_busca = models.GeneratedField(
+        expression=_texto_busca("nome"), output_field=models.CharField(max_length=255, db_collation="C"), db_persist=True,
+    )
+    nome_mae_busca = models.GeneratedField(
+        expression=_texto_busca("nome_mae"), output_field=models.CharField(max_length=255), db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            # CPF e nome pelo começo: LIKE 'maria da s%' ... ORDER BY ... LIMIT direto no
+            # btree. Por isso essas colunas são COLLATE "C" (com a collation do banco
+            # o LIKE precisaria de varchar_pattern_ops, que não serve para o ORDER BY)
+            models.Index(fields=["cpf_digitos"], name="paciente_cpf_digitos_idx"),
+            models.Index(fields=["nome_busca"], name="paciente_nome_busca_idx"),
+            # Nome/mãe em qualquer parte e com erro de digitação (pg_trgm)
+            GinIndex(fields=["nome_busca"], opclasses=["gin_trgm_ops"], name="paciente_nome_trgm_idx"),
+            GinIndex(fields=["nome_mae_busca"], opclasses=["gin_trgm_ops"], name="paciente_nome_mae_trgm_idx"),
+            # Lista do admin: páginas por cursor em (criado_em, id) (core/listas.py)
+            models.Index(fields=["criado_em", "id"], name="paciente_criado_id_idx"),
+        ]
+
     def __str__(self):
         return self.nome
@@ -1,3 +1,192 @@
-from django.test import TestCase
+import csv
+import tempfile
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .busca import buscar_pacientes, normalizar_busca
+from .cpf import normalizar_cpf
+from .importacao import importar_csv
+from .models import Patient
+
+
+class NormalizarCpfTests(TestCase):
+    def test_aceita_com_e_sem_pontuacao(self):
+        self.assertEqual(normalizar_cpf("12345678901"), "123.456.789-01")
+        self.assertEqual(normalizar_cpf(" 123.456.789-01 "), "123.456.789-01")
+
+    def test_recusa_quantidade_errada_de_digitos(self):
+        with self.assertRaises(ValidationError):
+            normalizar_cpf("123.456.789")
+
+
+class ImportacaoPacientesTests(TestCase):
+    def _csv(self, *linhas, cabecalho="nome,cpf,telefone,nome_mae,data_nascimento"):
+        return StringIO("\n".join([cabecalho, *linhas]) + "\n")
+
+    def test_normaliza_deduplica_e_atualiza_existentes(self):
+        Patient.objects.create(nome="Nome Antigo", cpf="111.222.333-44", telefone="1111")
+        arquivo = self._csv(
+            "Maria da Silva,11122233344,9999,Ana,1980-05-17",
+            "José Souza,555.666.777-88,,,17/05/1990",
+            "José de Souza,55566677788,8888,,",  # mesmo CPF: vale a última linha
+        )
+
+        resultado = importar_csv(arquivo, lote=2)
+
+        self.assertEqual((resultado.lidas, resultado.rejeitadas), (3, 0))
+        self.assertEqual(Patient.objects.count(), 2)
+        maria = Patient.objects.get(cpf="111.222.333-44")
+        self.assertEqual((maria.nome, maria.telefone, maria.data_nascimento), ("Maria da Silva", "9999", date(1980, 5, 17)))
+        jose = Patient.objects.get(cpf="555.666.777-88")
+        self.assertEqual((jose.nome, jose.telefone, jose.data_nascimento), ("José de Souza", "8888", None))
+
+    def test_coluna_ausente_do_arquivo_nao_apaga_o_cadastro(self):
+        Patient.objects.create(
+            nome="Maria", cpf="111.222.333-44", telefone="9999", nome_mae="Ana", data_nascimento=date(1980, 5, 17),
+        )
+        # CSV antigo: sem telefone nem data de nascimento
+        importar_csv(self._csv("Maria da Silva,11122233344,Ana Souza", cabecalho="nome,cpf,nome_mae"))
+
+        maria = Patient.objects.get(cpf="111.222.333-44")
+        self.assertEqual(
+            (maria.nome, maria.telefone, maria.nome_mae, maria.data_nascimento),
+            ("Maria da Silva", "9999", "Ana Souza", date(1980, 5, 17)),
+        )
+
+    def test_linhas_invalidas_sao_rejeitadas_sem_parar_a_importacao(self):
+        rejeitadas = []
+        arquivo = self._csv(
+            "Sem CPF,123,,,",
+            ",11122233344,,,",
+            "Data Ruim,11122233344,,,31/02/1990",
+            "Ok,11122233344,,,",
+        )
+
+        resultado = importar_csv(arquivo, ao_rejeitar=lambda n, linha, motivo: rejeitadas.append((n, motivo)))
+
+        self.assertEqual((resultado.lidas, resultado.gravadas, resultado.rejeitadas), (4, 1, 3))
+        self.assertEqual([n for n, _ in rejeitadas], [2, 3, 4])
+        self.assertEqual(rejeitadas[0][1], "CPF inválido.")
+
+    def test_comando_grava_relatorio_de_rejeitados(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            origem, recusados = Path(pasta) / "pacientes.csv", Path(pasta) / "rejeitados.csv"
+            origem.write_text("NOME;CPF\nMaria;11122233344\nJoão;999\n", encoding="utf-8")
+            saida = StringIO()
+
+            call_command("importar_pacientes", str(origem), delimitador=";", rejeitados=str(recusados), stdout=saida)
+
+            self.assertIn("1 pacientes gravados, 1 linhas rejeitadas", saida.getvalue())
+            with open(recusados, newline="", encoding="utf-8") as f:
+                self.assertEqual(list(csv.reader(f))[1], ["3", "CPF inválido.", "João", "999"])
+        self.assertTrue(Patient.objects.filter(cpf="111.222.333-44").exists())
+
+    def test_comando_exige_colunas_obrigatorias(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as origem:
+            origem.write("nome,telefone\nMaria,9999\n")
+            origem.flush()
+            with self.assertRaisesMessage(CommandError, "cpf"):
+                call_command("importar_pacientes", origem.name, stdout=StringIO())
+
+
+class BuscaPacientesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Patient.objects.create(nome="José Antônio Falcão", cpf="123.456.789-01", nome_mae="Luzia Conceição")
+        Patient.objects.create(nome="Maria da Silva", cpf="123.999.000-11", nome_mae="Ana da Silva")
+        Patient.objects.create(nome="Ana Beatriz Souza", cpf="987.654.321-00", nome_mae="Josefa Souza")
+
+    def _nomes(self, termo):
+        return [p.nome for p in buscar_pacientes(termo)]
+
+    def test_normalizacao_igual_a_do_banco(self):
+        self.assertEqual(normalizar_busca("  JOSÉ   Antônio "), "jose antonio")
+        self.assertEqual(Patient.objects.get(cpf="123.456.789-01").nome_busca, "jose antonio falcao")
+
+    def test_cpf_pelo_comeco_com_ou_sem_pontuacao(self):
+        self.assertEqual(self._nomes("123"), ["José Antônio Falcão", "Maria da Silva"])
+        self.assertEqual(self._nomes("123.45"), ["José Antônio Falcão"])
+        self.assertEqual(self._nomes("12"), [])
+
+    def test_nome_sem_acento_em_qualquer_ordem_e_nome_da_mae(self):
+        self.assertEqual(self._nomes("falcao jose"), ["José Antônio Falcão"])
+        self.assertEqual(self._nomes("luzia"), ["José Antônio Falcão"])
+        # "ana" está no nome de uma e no nome da mãe da outra
+        self.assertEqual(set(self._nomes("ana")), {"Ana Beatriz Souza", "Maria da Silva"})
+
+    def test_erro_de_digitacao_cai_na_busca_por_semelhanca(self):
+        self.assertEqual(self._nomes("beatris souza")[:1], ["Ana Beatriz Souza"])
+
+    def test_api_exige_login_e_devolve_dados_para_preencher_a_recepcao(self):
+        self.assertEqual(self.client.get("/pacientes/buscar/?q=maria").status_code, 302)
+        self.client.force_login(get_user_model().objects.create_user("recepcao", password="x"))
+        resultados = self.client.get("/pacientes/buscar/?q=maria").json()["resultados"]
+        self.assertEqual([r["cpf"] for r in resultados], ["123.999.000-11"])
+        self.assertEqual(resultados[0]["nome_mae"], "Ana da Silva")
+
+
+class AdminPacientesTests(TestCase):
+    def test_lista_do_ultimo_mes_e_busca_fora_dele(self):
+        self.client.force_login(get_user_model().objects.create_superuser("admin", password="x"))
+        antigo = Patient.objects.create(nome="Antônio Velho", cpf="111.222.333-44")
+        Patient.objects.filter(id=antigo.id).update(criado_em=timezone.now() - timedelta(days=60))
+        Patient.objects.create(nome="Bruna Nova", cpf="555.666.777-88")
+
+        def nomes(**params):
+            resposta = self.client.get("/admin/patients/patient/", params)
+            return [p.nome for p in resposta.context_data["cl"].result_list]
+
+        self.assertEqual(nomes(), ["Bruna Nova"])
+        self.assertEqual(nomes(periodo="tudo"), ["Bruna Nova", "Antônio Velho"])
+        self.assertEqual(nomes(q="11122233344"), ["Antônio Velho"])
+
+
+@tag("lento")
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN do PostgreSQL")
+class BuscaPacientesIndicesTests(TestCase):
+    """Com uma base grande, achar um paciente não pode virar Seq Scan na tabela inteira."""
+
+    TOTAL = 300_000
+    NOMES = ["Maria", "José", "Ana", "João", "Antônia", "Francisco", "Raimundo"]
+    SOBRENOMES = ["da Silva", "dos Santos", "de Oliveira", "Pereira", "Gomes", "Ribeiro", "Lima"]
+
+    @classmethod
+    def setUpTestData(cls):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO patients_patient (nome, cpf, nome_mae, telefone, criado_em, atualizado_em)
+                SELECT (%(nomes)s)[1 + n %% 7] || ' ' || (%(sobrenomes)s)[1 + n %% 7] || ' ' || (%(sobrenomes)s)[1 + n %% 5],
+                       lpad(n::text, 11, '0'),
+                       (%(nomes)s)[1 + n %% 3] || ' ' || (%(sobrenomes)s)[1 + n %% 6],
+                       '', now(), now()
+                FROM generate_series(1, %(total)s) AS n
+                """,
+                {"nomes": cls.NOMES, "sobrenomes": cls.SOBRENOMES, "total": cls.TOTAL},
+            )
+        Patient.objects.create(nome="Luíza Falcão Brandão", cpf="999.888.777-66", nome_mae="Conceição Araújo")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE patients_patient")
+
+    def test_buscas_usam_indice(self):
+        for termo in ["99988", "luiza falcao", "conceicao", "luisa falcao"]:
+            with CaptureQueriesContext(connection) as consultas:
+                self.assertEqual([p.cpf for p in buscar_pacientes(termo)], ["999.888.777-66"], termo)
+            with connection.cursor() as cursor:
+                for consulta in consultas.captured_queries:
+                    if not consulta["sql"].startswith("SELECT"):
+                        continue  # SAVEPOINT/SET LOCAL da busca por semelhança
+                    cursor.execute("EXPLAIN " + consulta["sql"])
+                    plano = "\n".join(linha[0] for linha in cursor.fetchall())
+                    with self.subTest(termo=termo, plano=plano):
+                        self.assertNotIn("Seq Scan on patients_patient", plano)
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = "patients"
+
+urlpatterns = [
+    # Autocomplete da recepção (CPF, nome, nome da mãe)
+    path("pacientes/buscar/", views.buscar, name="buscar"),
+]
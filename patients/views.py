@@ -1,3 +1,23 @@
-from django.shortcuts import render
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 
-# Create your views here.
+from .busca import buscar_pacientes
+
+
+@login_required
+def buscar(request):
+    """Autocomplete da recepção: ?q=<começo do CPF, nome ou nome da mãe>."""
+    pacientes = buscar_pacientes(request.GET.get("q", ""))
+    return JsonResponse({
+        "resultados": [
+            {
+                "id": p.id,
+                "nome": p.nome,
+                "cpf": p.cpf,
+                "telefone": p.telefone,
+                "nome_mae": p.nome_mae,
+                "data_nascimento": p.data_nascimento,
+            }
+            for p in pacientes
+        ]
+    })
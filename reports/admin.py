@@ -1,3 +1,29 @@
 from django.contrib import admin
+from .models import MetricaHora, MetricaMedicoDia
 
-# Register your models here.
+
+class SomenteLeituraAdmin(admin.ModelAdmin):
+    """Mantidas pelo comando atualizar_metricas: o admin só consulta."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MetricaHora)
+class MetricaHoraAdmin(SomenteLeituraAdmin):
+    list_display = ("hora", "unidade", "prioridade", "finalizadas", "canceladas", "atendidas")
+    list_filter = ("unidade", "prioridade")
+    date_hierarchy = "hora"
+
+
+@admin.register(MetricaMedicoDia)
+class MetricaMedicoDiaAdmin(SomenteLeituraAdmin):
+    list_display = ("dia", "unidade", "medico", "atendimentos")
+    list_filter = ("unidade",)
+    date_hierarchy = "dia"
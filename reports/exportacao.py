@@ -0,0 +1,195 @@
+"""
+Exportação do histórico de atendimento (fichas vivas + arquivadas, com os
+dados do paciente) para auditoria: CSV em streaming pela web
+(/relatorios/exportar/fichas.csv) e CSV, Parquet ou Arrow em arquivo
+(manage.py exportar_fichas).
+
+Memória constante, seja qual for o período:
+- as linhas vêm de FichaHistorico por cursor no servidor
+  (QuerySet.iterator(chunk_size=LOTE)), dentro de uma transação: sem ela o
+  Django declara o cursor WITH HOLD e o PostgreSQL materializa o resultado
+  inteiro antes da primeira linha;
+- values_list, não modelos: nada de instanciar milhões de objetos;
+- o CSV sai em blocos de LOTE linhas; Parquet/Arrow são gravados em grupos
+  de linhas (row groups / record batches), um de cada vez.
+- no ASGI a resposta recebe acsv_em_blocos(): um gerador síncrono no
+  StreamingHttpResponse seria lido inteiro pelo Django (sync_to_async(list))
+  antes do primeiro byte. Cada bloco é lido por sync_to_async sempre na
+  mesma thread (thread_sensitive), onde ficam a transação e o cursor.
+
+O período (obrigatório, pela data de chegada) é o que escolhe o índice:
+ficha_arquivada_criado_idx ou, filtrando a unidade,
+ficha_arq_unidade_criado_idx (a tabela viva só tem os últimos dias).
+Status e prioridade filtram em cima dele. A ordem (criado_em, id) sai do
+próprio índice, sem ordenar o ano inteiro.
+
+Parquet e Arrow precisam do pyarrow (opcional: pip install pyarrow).
+"""
+import csv
+from datetime import date, datetime, time, timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+from attendance.models import FichaHistorico
+
+LOTE = 5000
+LINHAS_POR_GRUPO = 100_000
+FORMATOS = ("csv", "parquet", "arrow")
+
+# (coluna no arquivo, lookup no FichaHistorico, tipo)
+COLUNAS = (
+    ("ficha_id", "id", "inteiro"),
+    ("unidade", "unidade__slug", "texto"),
+    ("codigo", "codigo", "texto"),
+    ("data_senha", "data_senha", "data"),
+    ("status", "status", "texto"),
+    ("prioridade", "prioridade", "texto"),
+    ("criado_em", "criado_em", "momento"),
+    ("chamado_em", "chamado_em", "momento"),
+    ("finalizado_em", "finalizado_em", "momento"),
+    ("local_atendimento", "local_atendimento", "texto"),
+    ("medico", "medico_atendente__username", "texto"),
+    ("pa_sistolica", "pa_sistolica", "inteiro"),
+    ("pa_diastolica", "pa_diastolica", "inteiro"),
+    ("temperatura", "temperatura", "decimal"),
+    ("frequencia_cardiaca", "frequencia_cardiaca", "inteiro"),
+    ("observacoes_triagem", "observacoes_triagem", "texto"),
+    ("paciente_id", "paciente_id", "inteiro"),
+    ("paciente_nome", "paciente__nome", "texto"),
+    ("paciente_cpf", "paciente__cpf", "texto"),
+    ("paciente_nascimento", "paciente__data_nascimento", "data"),
+    ("arquivada", "arquivada", "booleano"),
+)
+
+
+def fichas(inicio: date, fim: date, status=(), prioridades=(), unidade_id=None):
+    """Linhas (tuplas na ordem de COLUNAS) das fichas que chegaram de inicio a fim (datas locais, inclusive)."""
+    fuso = timezone.get_current_timezone()
+    historico = FichaHistorico.objects.filter(
+        criado_em__gte=datetime.combine(inicio, time.min, tzinfo=fuso),
+        criado_em__lt=datetime.combine(fim + timedelta(days=1), time.min, tzinfo=fuso),
+    )
+    if unidade_id is not None:
+        historico = historico.filter(unidade_id=unidade_id)
+    if status:
+        historico = historico.filter(status__in=status)
+    if prioridades:
+        historico = historico.filter(prioridade__in=prioridades)
+    return historico.order_by("criado_em", "id").values_list(*(lookup for _, lookup, _ in COLUNAS))
+
+
+def linhas(queryset):
+    """Percorre o queryset por cursor no servidor, LOTE linhas por ida ao banco."""
+    # A transação tem de ser no banco de onde se lê (réplica, se houver)
+    queryset = queryset.using(queryset.db)
+    with transaction.atomic(using=queryset.db):
+        yield from queryset.iterator(chunk_size=LOTE)
+
+
+def _lotes(iteravel, tamanho):
+    lote = []
+    for item in iteravel:
+        lote.append(item)
+        if len(lote) == tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# --- CSV ---------------------------------------------------------------------
+
+class _Eco:
+    """'Arquivo' do csv.writer que só devolve a linha formatada."""
+
+    def write(self, valor):
+        return valor
+
+
+def _csv(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).isoformat()
+    return valor
+
+
+def csv_em_blocos(queryset):
+    """Texto CSV (cabeçalho + linhas) em blocos de até LOTE linhas."""
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow([nome for nome, _, _ in COLUNAS])
+    for lote in _lotes(linhas(queryset), LOTE):
+        yield "".join(escritor.writerow([_csv(v) for v in linha]) for linha in lote)
+
+
+async def acsv_em_blocos(queryset):
+    """csv_em_blocos() para o ASGI: um bloco por vez, cada um lido numa ida à thread do banco."""
+    blocos = csv_em_blocos(queryset)
+    proximo = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (bloco := await proximo(blocos, None)) is not None:
+            yield bloco
+    finally:
+        # Fecha o cursor e a transação na mesma thread em que foram abertos
+        await sync_to_async(blocos.close, thread_sensitive=True)()
+
+
+# --- PARQUET / ARROW ---------------------------------------------------------
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImproperlyConfigured("Exportar em Parquet/Arrow precisa do pyarrow (pip install pyarrow).")
+    return pyarrow
+
+
+def _esquema(pa):
+    tipos = {
+        "inteiro": pa.int64(),
+        "texto": pa.string(),
+        "data": pa.date32(),
+        "momento": pa.timestamp("us", tz="UTC"),
+        "decimal": pa.decimal128(4, 1),
+        "booleano": pa.bool_(),
+    }
+    return pa.schema([(nome, tipos[tipo]) for nome, _, tipo in COLUNAS])
+
+
+def gravar_colunar(queryset, destino, formato="parquet", linhas_por_grupo=LINHAS_POR_GRUPO) -> int:
+    """
+    Grava em `destino` (caminho ou arquivo binário) em Parquet ou Arrow IPC,
+    um grupo de `linhas_por_grupo` linhas por vez. Devolve o total de linhas.
+    """
+    pa = _pyarrow()
+    esquema = _esquema(pa)
+    if formato == "parquet":
+        escritor = pa.parquet.ParquetWriter(destino, esquema)
+    else:
+        escritor = pa.ipc.new_file(destino, esquema)
+    total = 0
+    with escritor:
+        for lote in _lotes(linhas(queryset), linhas_por_grupo):
+            colunas = [pa.array(valores, type=campo.type) for valores, campo in zip(zip(*lote), esquema)]
+            escritor.write_table(pa.Table.from_arrays(colunas, schema=esquema))
+            total += len(lote)
+    return total
+
+
+def gravar(queryset, destino, formato="csv") -> int:
+    """Grava o queryset em `destino` (caminho) no formato pedido. Devolve o total de linhas."""
+    if formato != "csv":
+        return gravar_colunar(queryset, destino, formato)
+    total = 0
+    with open(destino, "w", encoding="utf-8", newline="") as saida:
+        escritor = csv.writer(saida)
+        escritor.writerow([nome for nome, _, _ in COLUNAS])
+        for linha in linhas(queryset):
+            escritor.writerow([_csv(v) for v in linha])
+            total += 1
+    return total
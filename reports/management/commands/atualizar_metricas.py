@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from reports.metricas import atualizar_metricas
+
+
+class Command(BaseCommand):
+    help = "Soma às métricas operacionais as fichas encerradas desde a última execução (rodar no cron)."
+
+    def handle(self, *args, **options):
+        total = atualizar_metricas()
+        self.stdout.write(self.style.SUCCESS(f"{total} ficha(s) somada(s) às métricas."))
@@ -0,0 +1,55 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from core.replicas import em_replica
+from core.unidades import unidade_id_por_slug
+from reports import exportacao
+
+
+def _data(valor):
+    try:
+        data = parse_date(valor)
+    except ValueError:
+        data = None
+    if data is None:
+        raise CommandError(f"Data inválida: {valor!r} (use AAAA-MM-DD).")
+    return data
+
+
+def _lista(valor):
+    return [v for v in (valor or "").split(",") if v]
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta o histórico de fichas (vivas + arquivadas, com o paciente) do período para CSV, "
+        "Parquet ou Arrow, em streaming (memória constante)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--inicio", required=True, help="Primeiro dia de chegada (AAAA-MM-DD).")
+        parser.add_argument("--fim", required=True, help="Último dia de chegada, inclusive (AAAA-MM-DD).")
+        parser.add_argument("--status", help="Só estes status (separados por vírgula).")
+        parser.add_argument("--prioridade", help="Só estas prioridades (separadas por vírgula).")
+        parser.add_argument("--unidade", help="Slug da unidade (padrão: todas).")
+        parser.add_argument("--formato", choices=exportacao.FORMATOS, default="csv")
+        parser.add_argument("--saida", required=True, help="Arquivo de saída.")
+
+    def handle(self, *args, **opcoes):
+        inicio, fim = _data(opcoes["inicio"]), _data(opcoes["fim"])
+        if fim < inicio:
+            raise CommandError("--fim antes de --inicio.")
+        unidade_id = None
+        if opcoes["unidade"]:
+            unidade_id = unidade_id_por_slug(opcoes["unidade"])
+            if unidade_id is None:
+                raise CommandError(f"Unidade inexistente: {opcoes['unidade']}.")
+
+        queryset = exportacao.fichas(inicio, fim, _lista(opcoes["status"]), _lista(opcoes["prioridade"]), unidade_id)
+        try:
+            with em_replica():
+                total = exportacao.gravar(queryset, opcoes["saida"], opcoes["formato"])
+        except ImproperlyConfigured as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"{total} ficha(s) exportada(s) para {opcoes['saida']}."))
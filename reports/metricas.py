@@ -0,0 +1,226 @@
+"""
+Métricas operacionais pré-agregadas, por unidade: contagens por
+hora/prioridade, histograma da espera (percentis) e produtividade dos médicos.
+
+Calcular espera/atendimento em cima de FichaAtendimento a cada acesso ao
+painel de gestão varreria meses de fichas. Em vez disso, atualizar_metricas
+(manage.py atualizar_metricas, no cron) soma às tabelas de reports.models só
+as fichas encerradas desde a última execução, pela coluna atualizado_em
+(índices parciais ficha_encerrada_atualizado_idx / ficha_arquivada_atualizado_idx).
+Os relatórios (resumo_operacional) leem só as linhas agregadas do período.
+
+A marca d'água (ProcessamentoMetricas) avança na mesma transação das somas:
+se o job cair no meio, nada é somado duas vezes. Fichas arquivadas mantêm o
+atualizado_em, então o arquivamento também não gera recontagem. Ficha
+encerrada não passa por nenhuma service de novo; editar uma no admin muda o
+atualizado_em e a faz ser somada outra vez.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from attendance.arquivamento import ENCERRADOS
+from attendance.models import FichaAtendimento, FichaHistorico
+
+from .models import FAIXAS_ESPERA, FaixaEspera, MetricaHora, MetricaMedicoDia, ProcessamentoMetricas
+
+Status = FichaAtendimento.Status
+
+# Só soma o que foi gravado há mais que isto: uma transação que ainda não
+# comitou (atualizado_em já no passado) não fica para trás da marca d'água
+MARGEM = timedelta(minutes=1)
+# Janela de cada transação (a primeira execução pode pegar meses de histórico)
+PASSO = timedelta(days=1)
+NOME = "fichas_encerradas"
+
+
+def _controle():
+    """Marca d'água travada para esta transação (criada na primeira execução). None se não há fichas."""
+    try:
+        return ProcessamentoMetricas.objects.select_for_update().get(nome=NOME)
+    except ProcessamentoMetricas.DoesNotExist:
+        inicio = FichaHistorico.objects.filter(status__in=ENCERRADOS).aggregate(m=Min("atualizado_em"))["m"]
+        if inicio is None:
+            return None
+        ProcessamentoMetricas.objects.get_or_create(
+            nome=NOME, defaults={"processado_ate": inicio - timedelta(microseconds=1)},
+        )
+        return ProcessamentoMetricas.objects.select_for_update().get(nome=NOME)
+
+
+def _somar(desde, ate) -> int:
+    """Soma às tabelas agregadas as fichas encerradas com desde < atualizado_em <= ate."""
+    quote = connection.ops.quote_name
+    # Literal (e não parâmetro) para o planner casar com os índices parciais
+    encerrados = ", ".join(f"'{s}'" for s in ENCERRADOS)
+    atendida = f"status = '{Status.FINALIZADO}' AND chamado_em IS NOT NULL AND finalizado_em IS NOT NULL"
+
+    with connection.cursor() as cursor:
+        # Um único comando: lê a janela uma vez e faz os três upserts (CTEs de escrita)
+        cursor.execute(
+            f"""
+            WITH encerradas AS (
+                SELECT unidade_id, date_trunc('hour', criado_em) AS hora,
+                       coalesce(prioridade, '') AS prioridade,
+                       status, chamado_em, finalizado_em, medico_atendente_id,
+                       extract(epoch FROM chamado_em - criado_em)::float8 AS espera,
+                       extract(epoch FROM finalizado_em - chamado_em)::float8 AS atendimento
+                FROM {quote(FichaHistorico._meta.db_table)}
+                WHERE status IN ({encerrados}) AND atualizado_em > %(desde)s AND atualizado_em <= %(ate)s
+            ),
+            horas AS (
+                INSERT INTO {quote(MetricaHora._meta.db_table)} AS t
+                    (unidade_id, hora, prioridade, finalizadas, canceladas, atendidas, espera_total, atendimento_total)
+                SELECT unidade_id, hora, prioridade,
+                       count(*) FILTER (WHERE status = '{Status.FINALIZADO}'),
+                       count(*) FILTER (WHERE status = '{Status.CANCELADO}'),
+                       count(*) FILTER (WHERE {atendida}),
+                       coalesce(round(sum(espera) FILTER (WHERE {atendida})), 0),
+                       coalesce(round(sum(atendimento) FILTER (WHERE {atendida})), 0)
+                FROM encerradas GROUP BY unidade_id, hora, prioridade
+                ON CONFLICT (unidade_id, hora, prioridade) DO UPDATE SET
+                    finalizadas = t.finalizadas + EXCLUDED.finalizadas,
+                    canceladas = t.canceladas + EXCLUDED.canceladas,
+                    atendidas = t.atendidas + EXCLUDED.atendidas,
+                    espera_total = t.espera_total + EXCLUDED.espera_total,
+                    atendimento_total = t.atendimento_total + EXCLUDED.atendimento_total
+            ),
+            faixas AS (
+                INSERT INTO {quote(FaixaEspera._meta.db_table)} AS t (unidade_id, hora, prioridade, faixa, quantidade)
+                SELECT unidade_id, hora, prioridade, width_bucket(espera / 60, %(faixas)s::float8[]), count(*)
+                FROM encerradas WHERE {atendida}
+                GROUP BY 1, 2, 3, 4
+                ON CONFLICT (unidade_id, hora, prioridade, faixa) DO UPDATE SET quantidade = t.quantidade + EXCLUDED.quantidade
+            ),
+            medicos AS (
+                INSERT INTO {quote(MetricaMedicoDia._meta.db_table)} AS t
+                    (unidade_id, dia, medico_id, atendimentos, atendimento_total)
+                SELECT unidade_id, (finalizado_em AT TIME ZONE %(fuso)s)::date, medico_atendente_id, count(*),
+                       coalesce(round(sum(atendimento)), 0)
+                FROM encerradas WHERE {atendida} AND medico_atendente_id IS NOT NULL
+                GROUP BY 1, 2, 3
+                ON CONFLICT (unidade_id, dia, medico_id) DO UPDATE SET
+                    atendimentos = t.atendimentos + EXCLUDED.atendimentos,
+                    atendimento_total = t.atendimento_total + EXCLUDED.atendimento_total
+            )
+            SELECT count(*) FROM encerradas
+            """,
+            {"desde": desde, "ate": ate, "faixas": list(FAIXAS_ESPERA), "fuso": settings.TIME_ZONE},
+        )
+        return cursor.fetchone()[0]
+
+
+def atualizar_metricas(ate=None, passo=PASSO) -> int:
+    """Soma as fichas encerradas desde a última execução (até `ate`). Retorna quantas somou."""
+    ate = ate or timezone.now() - MARGEM
+    total = 0
+    while True:
+        with transaction.atomic():
+            controle = _controle()
+            if controle is None or controle.processado_ate >= ate:
+                return total
+            fim = min(controle.processado_ate + passo, ate)
+            total += _somar(controle.processado_ate, fim)
+            controle.processado_ate = fim
+            controle.save(update_fields=["processado_ate"])
+
+
+# --- LEITURA -----------------------------------------------------------------
+
+def _minutos(segundos, quantidade):
+    return round(segundos / quantidade / 60, 1) if quantidade else None
+
+
+def _percentil(histograma: dict, p: float):
+    """
+    Limite superior (minutos) da faixa onde está o percentil p do histograma
+    {faixa: quantidade}. None se não há dados ou se cai acima da última faixa.
+    """
+    total = sum(histograma.values())
+    if not total:
+        return None
+    acumulado = 0
+    for faixa in sorted(histograma):
+        acumulado += histograma[faixa]
+        if acumulado >= p * total:
+            return FAIXAS_ESPERA[faixa] if faixa < len(FAIXAS_ESPERA) else None
+    return None
+
+
+def _totais(linhas, histograma):
+    finalizadas = sum(m.finalizadas for m in linhas)
+    atendidas = sum(m.atendidas for m in linhas)
+    return {
+        "finalizadas": finalizadas,
+        "canceladas": sum(m.canceladas for m in linhas),
+        "espera_media_min": _minutos(sum(m.espera_total for m in linhas), atendidas),
+        "atendimento_medio_min": _minutos(sum(m.atendimento_total for m in linhas), atendidas),
+        "espera_p50_min": _percentil(histograma, 0.5),
+        "espera_p90_min": _percentil(histograma, 0.9),
+    }
+
+
+def resumo_operacional(unidade_id, inicio, fim) -> dict:
+    """
+    Métricas da unidade nos dias inicio..fim (datas locais, inclusive), só
+    das tabelas agregadas: três consultas, qualquer que seja o tamanho do histórico.
+    """
+    fuso = timezone.get_current_timezone()
+    de = datetime.combine(inicio, time.min, tzinfo=fuso)
+    ate = datetime.combine(fim + timedelta(days=1), time.min, tzinfo=fuso)
+
+    horas = list(MetricaHora.objects.filter(unidade_id=unidade_id, hora__gte=de, hora__lt=ate).order_by("hora"))
+    faixas = FaixaEspera.objects.filter(unidade_id=unidade_id, hora__gte=de, hora__lt=ate).values_list(
+        "prioridade", "faixa", "quantidade",
+    )
+    medicos = MetricaMedicoDia.objects.filter(unidade_id=unidade_id, dia__range=(inicio, fim)).select_related("medico")
+
+    histograma = defaultdict(int)
+    histograma_prioridade = defaultdict(lambda: defaultdict(int))
+    for prioridade, faixa, quantidade in faixas:
+        histograma[faixa] += quantidade
+        histograma_prioridade[prioridade][faixa] += quantidade
+
+    por_prioridade = defaultdict(list)
+    por_hora = defaultdict(lambda: {"finalizadas": 0, "canceladas": 0})
+    for m in horas:
+        por_prioridade[m.prioridade].append(m)
+        hora = por_hora[timezone.localtime(m.hora, fuso).isoformat()]
+        hora["finalizadas"] += m.finalizadas
+        hora["canceladas"] += m.canceladas
+
+    por_medico = defaultdict(lambda: {"atendimentos": 0, "atendimento_total": 0})
+    for m in medicos:
+        dados = por_medico[m.medico]
+        dados["atendimentos"] += m.atendimentos
+        dados["atendimento_total"] += m.atendimento_total
+
+    # Mesma ordem de gravidade das filas; "" (sem triagem) por último
+    ordem = FichaAtendimento.ORDEM_PRIORIDADE
+    return {
+        "unidade_id": unidade_id,
+        "inicio": inicio,
+        "fim": fim,
+        "total": _totais(horas, histograma),
+        "por_prioridade": [
+            {"prioridade": p or None, **_totais(linhas, histograma_prioridade[p])}
+            for p, linhas in sorted(por_prioridade.items(), key=lambda i: ordem.get(i[0], FichaAtendimento.SEM_PRIORIDADE))
+        ],
+        "por_hora": [{"hora": hora, **dados} for hora, dados in por_hora.items()],
+        "medicos": sorted(
+            (
+                {
+                    "medico_id": medico.id,
+                    "medico": medico.get_full_name() or medico.username,
+                    "atendimentos": dados["atendimentos"],
+                    "atendimento_medio_min": _minutos(dados["atendimento_total"], dados["atendimentos"]),
+                }
+                for medico, dados in por_medico.items()
+            ),
+            key=lambda m: -m["atendimentos"],
+        ),
+    }
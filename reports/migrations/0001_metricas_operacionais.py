@@ -0,0 +1,76 @@
+# Generated by Django 6.0.2 on 2026-10-18 15:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessamentoMetricas',
+            fields=[
+                ('nome', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('processado_ate', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Processamento de Métricas',
+                'verbose_name_plural': 'Processamento de Métricas',
+            },
+        ),
+        migrations.CreateModel(
+            name='FaixaEspera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField()),
+                ('prioridade', models.CharField(blank=True, max_length=10)),
+                ('faixa', models.PositiveSmallIntegerField()),
+                ('quantidade', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Faixa de Espera',
+                'verbose_name_plural': 'Faixas de Espera',
+                'constraints': [models.UniqueConstraint(fields=('hora', 'prioridade', 'faixa'), name='faixa_espera_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MetricaHora',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField()),
+                ('prioridade', models.CharField(blank=True, max_length=10)),
+                ('finalizadas', models.PositiveIntegerField(default=0)),
+                ('canceladas', models.PositiveIntegerField(default=0)),
+                ('atendidas', models.PositiveIntegerField(default=0)),
+                ('espera_total', models.BigIntegerField(default=0)),
+                ('atendimento_total', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Métrica por Hora',
+                'verbose_name_plural': 'Métricas por Hora',
+                'constraints': [models.UniqueConstraint(fields=('hora', 'prioridade'), name='metrica_hora_unica')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MetricaMedicoDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('atendimentos', models.PositiveIntegerField(default=0)),
+                ('atendimento_total', models.BigIntegerField(default=0)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Métrica do Médico por Dia',
+                'verbose_name_plural': 'Métricas dos Médicos por Dia',
+                'constraints': [models.UniqueConstraint(fields=('dia', 'medico'), name='metrica_medico_dia_unica')],
+            },
+        ),
+    ]
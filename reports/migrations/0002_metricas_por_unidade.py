@@ -0,0 +1,52 @@
+# Generated by Django 6.0.2 on 2026-10-18 17:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from core.migrations import UNIDADE_INICIAL
+
+
+def _recomecar(apps, schema_editor):
+    # As somas antigas misturam as unidades e não dá para separar: apaga tudo
+    # e a marca d'água. O próximo atualizar_metricas soma de novo o histórico
+    # inteiro (fichas vivas + arquivo), já por unidade.
+    for modelo in ("MetricaHora", "FaixaEspera", "MetricaMedicoDia", "ProcessamentoMetricas"):
+        apps.get_model("reports", modelo).objects.all().delete()
+
+
+def _unidade():
+    # As tabelas ficam vazias (_recomecar): o default só existe para o ALTER TABLE
+    return models.ForeignKey(
+        default=UNIDADE_INICIAL, on_delete=django.db.models.deletion.PROTECT,
+        related_name='+', to='core.unidade', db_index=False,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_unidade'),
+        ('reports', '0001_metricas_operacionais'),
+    ]
+
+    operations = [
+        migrations.RunPython(_recomecar, migrations.RunPython.noop),
+        migrations.RemoveConstraint(model_name='metricahora', name='metrica_hora_unica'),
+        migrations.RemoveConstraint(model_name='faixaespera', name='faixa_espera_unica'),
+        migrations.RemoveConstraint(model_name='metricamedicodia', name='metrica_medico_dia_unica'),
+        migrations.AddField(model_name='metricahora', name='unidade', field=_unidade(), preserve_default=False),
+        migrations.AddField(model_name='faixaespera', name='unidade', field=_unidade(), preserve_default=False),
+        migrations.AddField(model_name='metricamedicodia', name='unidade', field=_unidade(), preserve_default=False),
+        migrations.AddConstraint(
+            model_name='metricahora',
+            constraint=models.UniqueConstraint(fields=('unidade', 'hora', 'prioridade'), name='metrica_hora_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='faixaespera',
+            constraint=models.UniqueConstraint(fields=('unidade', 'hora', 'prioridade', 'faixa'), name='faixa_espera_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='metricamedicodia',
+            constraint=models.UniqueConstraint(fields=('unidade', 'dia', 'medico'), name='metrica_medico_dia_unica'),
+        ),
+    ]
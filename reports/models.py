@@ -1,3 +1,90 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+# Faixas do histograma de espera, em minutos (limite superior de cada faixa;
+# a última faixa é "mais que FAIXAS_ESPERA[-1]"). Os percentis saem daqui.
+FAIXAS_ESPERA = (5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 240)
+
+
+# --- MÉTRICAS OPERACIONAIS (agregadas) -------------------------------------
+# Mantidas de forma incremental por reports.metricas.atualizar_metricas
+# (manage.py atualizar_metricas no cron). Os painéis de gestão leem só estas
+# tabelas: o custo não cresce com o histórico de fichas.
+#
+# Tudo por unidade: cada clínica vê só os seus números. O índice de cada
+# tabela é o da constraint única, que começa pela unidade.
+#
+# Só entram fichas encerradas (FINALIZADO/CANCELADO), pela hora de chegada.
+# Tempos em segundos:
+#   espera     = chegada (criado_em) -> chamado pelo médico (chamado_em)
+#   atendimento = chamado_em -> finalizado_em
+
+class MetricaHora(models.Model):
+    """Fichas encerradas que chegaram numa hora, por prioridade Manchester."""
+    unidade = models.ForeignKey("core.Unidade", on_delete=models.PROTECT, related_name="+", db_index=False)
+    hora = models.DateTimeField()
+    prioridade = models.CharField(max_length=10, blank=True)  # "" = encerrada sem triagem
+    finalizadas = models.PositiveIntegerField(default=0)
+    canceladas = models.PositiveIntegerField(default=0)
+    # Finalizadas com chamado_em e finalizado_em: base das médias
+    atendidas = models.PositiveIntegerField(default=0)
+    espera_total = models.BigIntegerField(default=0)
+    atendimento_total = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Métrica por Hora"
+        verbose_name_plural = "Métricas por Hora"
+        constraints = [
+            models.UniqueConstraint(fields=['unidade', 'hora', 'prioridade'], name='metrica_hora_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.hora:%d/%m/%Y %H}h {self.prioridade or '-'}"
+
+
+class FaixaEspera(models.Model):
+    """Histograma da espera: quantas fichas de (unidade, hora, prioridade) caíram em cada faixa."""
+    unidade = models.ForeignKey("core.Unidade", on_delete=models.PROTECT, related_name="+", db_index=False)
+    hora = models.DateTimeField()
+    prioridade = models.CharField(max_length=10, blank=True)
+    faixa = models.PositiveSmallIntegerField()  # índice em FAIXAS_ESPERA (len = acima da última)
+    quantidade = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Faixa de Espera"
+        verbose_name_plural = "Faixas de Espera"
+        constraints = [
+            models.UniqueConstraint(fields=['unidade', 'hora', 'prioridade', 'faixa'], name='faixa_espera_unica'),
+        ]
+
+
+class MetricaMedicoDia(models.Model):
+    """Produtividade do médico no dia (data local da finalização), em cada unidade."""
+    unidade = models.ForeignKey("core.Unidade", on_delete=models.PROTECT, related_name="+", db_index=False)
+    dia = models.DateField()
+    medico = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    atendimentos = models.PositiveIntegerField(default=0)
+    atendimento_total = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Métrica do Médico por Dia"
+        verbose_name_plural = "Métricas dos Médicos por Dia"
+        constraints = [
+            models.UniqueConstraint(fields=['unidade', 'dia', 'medico'], name='metrica_medico_dia_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia:%d/%m/%Y} {self.medico}"
+
+
+class ProcessamentoMetricas(models.Model):
+    """Até onde (atualizado_em das fichas encerradas) as métricas já foram somadas."""
+    nome = models.CharField(max_length=50, primary_key=True)
+    processado_ate = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Processamento de Métricas"
+        verbose_name_plural = "Processamento de Métricas"
+
+    def __str__(self):
+        return f"{self.nome}: {self.processado_ate:%d/%m/%Y %H:%M:%S}"
@@ -1,3 +1,238 @@
+import csv
+import tempfile
+from datetime import datetime, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
+from zoneinfo import ZoneInfo
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from attendance.arquivamento import arquivar_lote
+from attendance.models import FichaAtendimento
+from attendance.services import criar_ficha_por_cpf
+from core.migrations import UNIDADE_INICIAL
+from core.models import Unidade
+
+from . import exportacao
+from .exportacao import COLUNAS
+from .metricas import atualizar_metricas, resumo_operacional
+from .models import FaixaEspera, MetricaHora, MetricaMedicoDia
+
+FUSO = ZoneInfo("America/Sao_Paulo")
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class MetricasOperacionaisTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.medico = get_user_model().objects.create_user("medico", first_name="Ana", last_name="Lima")
+        cls.chegada = datetime(2026, 3, 2, 8, 10, tzinfo=FUSO)
+        cls.encerrada_em = cls.chegada + timedelta(hours=2)
+
+    def _ficha(self, cpf, status, prioridade=None, espera=None, atendimento=None, unidade_id=UNIDADE_INICIAL):
+        ficha = criar_ficha_por_cpf(unidade_id=unidade_id, nome=f"Paciente {cpf}", cpf=cpf).ficha
+        chamado_em = self.chegada + espera if espera is not None else None
+        FichaAtendimento.objects.filter(id=ficha.id).update(
+            status=status,
+            prioridade=prioridade,
+            criado_em=self.chegada,
+            atualizado_em=self.encerrada_em,
+            chamado_em=chamado_em,
+            finalizado_em=chamado_em + atendimento if atendimento is not None else None,
+            medico_atendente=self.medico if atendimento is not None else None,
+        )
+        return ficha.id
+
+    def _cenario(self):
+        self._ficha("00000000001", "FINALIZADO", "AMARELO", timedelta(minutes=12), timedelta(minutes=10))
+        self._ficha("00000000002", "FINALIZADO", "AMARELO", timedelta(minutes=50), timedelta(minutes=20))
+        self._ficha("00000000003", "FINALIZADO", "VERMELHO", timedelta(minutes=2), timedelta(minutes=30))
+        self._ficha("00000000004", "CANCELADO")
+        self._ficha("00000000005", "TRIADO", "VERDE")  # ainda na fila: não entra
+
+    def test_soma_uma_vez_so_mesmo_com_arquivamento_no_meio(self):
+        self._cenario()
+        self.assertEqual(atualizar_metricas(ate=self.encerrada_em + timedelta(hours=1)), 4)
+
+        # Arquivar não muda atualizado_em: a próxima execução não reconta
+        arquivar_lote(self.encerrada_em + timedelta(days=1))
+        self.assertEqual(atualizar_metricas(ate=self.encerrada_em + timedelta(hours=2)), 0)
+
+        amarelo = MetricaHora.objects.get(prioridade="AMARELO")
+        self.assertEqual(amarelo.hora, datetime(2026, 3, 2, 8, tzinfo=FUSO))
+        self.assertEqual((amarelo.finalizadas, amarelo.atendidas, amarelo.espera_total), (2, 2, 62 * 60))
+        self.assertEqual(MetricaHora.objects.get(prioridade="").canceladas, 1)
+        # 12 min -> faixa "até 15", 50 min -> "até 60"
+        self.assertEqual(
+            sorted(FaixaEspera.objects.filter(prioridade="AMARELO").values_list("faixa", "quantidade")),
+            [(2, 1), (6, 1)],
+        )
+        medico = MetricaMedicoDia.objects.get()
+        self.assertEqual((medico.atendimentos, medico.atendimento_total), (3, 60 * 60))
+
+    def test_resumo_le_so_as_tabelas_agregadas(self):
+        self._cenario()
+        atualizar_metricas(ate=self.encerrada_em + timedelta(hours=1))
+        dia = self.chegada.date()
+
+        with self.assertNumQueries(3):
+            resumo = resumo_operacional(UNIDADE_INICIAL, dia, dia)
+
+        self.assertEqual(resumo["total"]["finalizadas"], 3)
+        self.assertEqual(resumo["total"]["canceladas"], 1)
+        self.assertEqual(resumo["total"]["espera_p50_min"], 15)
+        self.assertEqual(resumo["total"]["espera_p90_min"], 60)
+        self.assertEqual([p["prioridade"] for p in resumo["por_prioridade"]], ["VERMELHO", "AMARELO", None])
+        self.assertEqual(resumo["medicos"], [
+            {"medico_id": self.medico.id, "medico": "Ana Lima", "atendimentos": 3, "atendimento_medio_min": 20.0},
+        ])
+
+    def test_cada_unidade_ve_so_os_seus_numeros(self):
+        norte = Unidade.objects.create(nome="UPA Norte", slug="norte")
+        self._cenario()
+        self._ficha("00000000006", "FINALIZADO", "AMARELO", timedelta(minutes=100), timedelta(minutes=5), norte.id)
+        self.assertEqual(atualizar_metricas(ate=self.encerrada_em + timedelta(hours=1)), 5)
+
+        self.assertEqual(
+            sorted(MetricaHora.objects.filter(prioridade="AMARELO").values_list("unidade_id", "finalizadas")),
+            [(UNIDADE_INICIAL, 2), (norte.id, 1)],
+        )
+        self.assertEqual(
+            sorted(MetricaMedicoDia.objects.values_list("unidade_id", "atendimentos")),
+            [(UNIDADE_INICIAL, 3), (norte.id, 1)],
+        )
+
+        dia = self.chegada.date()
+        principal = resumo_operacional(UNIDADE_INICIAL, dia, dia)
+        self.assertEqual((principal["total"]["finalizadas"], principal["total"]["espera_p90_min"]), (3, 60))
+        self.assertEqual(principal["medicos"][0]["atendimentos"], 3)
+        resumo_norte = resumo_operacional(norte.id, dia, dia)
+        self.assertEqual((resumo_norte["total"]["finalizadas"], resumo_norte["total"]["espera_p50_min"]), (1, 120))
+        self.assertEqual(resumo_norte["total"]["canceladas"], 0)
+
+        # A API usa a unidade da requisição
+        self.client.force_login(self.medico)
+        resposta = self.client.get("/relatorios/operacional/", {"inicio": "2026-03-02", "unidade": "norte"})
+        self.assertEqual(resposta.json()["total"]["finalizadas"], 1)
+        self.assertEqual(self.client.get("/relatorios/operacional/?inicio=2026-03-02").json()["total"]["finalizadas"], 3)
+
+    def test_comando_e_api(self):
+        self._cenario()
+        saida = StringIO()
+        call_command("atualizar_metricas", stdout=saida)
+        self.assertIn("4 ficha(s) somada(s)", saida.getvalue())
+
+        self.assertEqual(self.client.get("/relatorios/operacional/").status_code, 302)
+        self.client.force_login(self.medico)
+        resposta = self.client.get("/relatorios/operacional/?inicio=2026-03-02")
+        self.assertEqual(resposta.json()["por_hora"], [
+            {"hora": "2026-03-02T08:00:00-03:00", "finalizadas": 3, "canceladas": 1},
+        ])
+        self.assertEqual(self.client.get("/relatorios/operacional/?inicio=2026-03-02&fim=2026-03-01").status_code, 400)
+
+
+class ExportacaoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.auditor = get_user_model().objects.create_user("auditor")
+        cls.auditor.user_permissions.add(Permission.objects.get(codename="view_fichahistorico"))
+        cls.chegada = datetime(2026, 3, 2, 8, 10, tzinfo=FUSO)
+
+    def setUp(self):
+        for cpf, status, prioridade in [
+            ("00000000001", "FINALIZADO", "AMARELO"),
+            ("00000000002", "CANCELADO", None),
+            ("00000000003", "FINALIZADO", "VERMELHO"),
+        ]:
+            ficha = criar_ficha_por_cpf(unidade_id=UNIDADE_INICIAL, nome=f"Paciente {cpf}", cpf=cpf).ficha
+            FichaAtendimento.objects.filter(id=ficha.id).update(
+                status=status, prioridade=prioridade, criado_em=self.chegada, atualizado_em=self.chegada,
+            )
+        # Uma das fichas já foi para o arquivo: a exportação lê as duas tabelas
+        arquivar_lote(self.chegada + timedelta(days=1), tamanho=1)
+
+    def _csv(self, resposta):
+        return list(csv.DictReader(StringIO(b"".join(resposta.streaming_content).decode())))
+
+    def test_csv_em_streaming_com_filtros(self):
+        url = "/relatorios/exportar/fichas.csv"
+        self.assertEqual(self.client.get(url, {"inicio": "2026-03-02", "fim": "2026-03-02"}).status_code, 403)
+        self.client.force_login(self.auditor)
+
+        resposta = self.client.get(url, {"inicio": "2026-03-02", "fim": "2026-03-02"})
+        self.assertTrue(resposta.streaming)
+        self.assertIn("fichas_2026-03-02_2026-03-02.csv", resposta["Content-Disposition"])
+        linhas = self._csv(resposta)
+        self.assertEqual(len(linhas), 3)
+        self.assertEqual(list(linhas[0]), [nome for nome, _, _ in COLUNAS])
+        self.assertEqual({l["arquivada"] for l in linhas}, {"True", "False"})
+        self.assertEqual(linhas[0]["criado_em"], "2026-03-02T08:10:00-03:00")
+        self.assertEqual(linhas[0]["unidade"], "principal")
+
+        filtrada = self._csv(self.client.get(url, {
+            "inicio": "2026-03-02", "fim": "2026-03-02", "status": "FINALIZADO", "prioridade": "VERMELHO",
+        }))
+        self.assertEqual([l["paciente_cpf"] for l in filtrada], ["00000000003"])
+        self.assertEqual(self._csv(self.client.get(url, {"inicio": "2026-03-03", "fim": "2026-03-03"})), [])
+
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.assertEqual(self.client.get(url, {"inicio": "2025-01-01", "fim": "2026-03-02"}).status_code, 400)
+        self.assertEqual(
+            self.client.get(url, {"inicio": "2026-03-02", "fim": "2026-03-02", "unidade": "nenhuma"}).status_code, 400,
+        )
+
+    async def test_asgi_entrega_um_bloco_por_vez(self):
+        # Sem o gerador assíncrono, o Django leria a exportação inteira antes do primeiro byte
+        lidas = []
+        original = exportacao.linhas
+
+        def contando(queryset):
+            for linha in original(queryset):
+                lidas.append(linha)
+                yield linha
+
+        await self.async_client.aforce_login(self.auditor)
+        with mock.patch.object(exportacao, "LOTE", 1), mock.patch.object(exportacao, "linhas", contando):
+            resposta = await self.async_client.get(
+                "/relatorios/exportar/fichas.csv", {"inicio": "2026-03-02", "fim": "2026-03-02"},
+            )
+            self.assertTrue(resposta.is_async)
+            blocos = aiter(resposta.streaming_content)
+            self.assertTrue((await anext(blocos)).startswith(b"ficha_id,"))
+            self.assertEqual(lidas, [])
+            await anext(blocos)
+            self.assertEqual(len(lidas), 1)
+            resto = [bloco async for bloco in blocos]
+        self.assertEqual((len(resto), len(lidas)), (2, 3))
+
+    def test_comando_grava_csv(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            destino = Path(pasta) / "fichas.csv"
+            saida = StringIO()
+            call_command(
+                "exportar_fichas", "--inicio", "2026-03-01", "--fim", "2026-03-31", "--status", "CANCELADO",
+                "--saida", str(destino), stdout=saida,
+            )
+            self.assertIn("1 ficha(s) exportada(s)", saida.getvalue())
+            linhas = list(csv.DictReader(destino.open(encoding="utf-8")))
+        self.assertEqual([(l["status"], l["prioridade"]) for l in linhas], [("CANCELADO", "")])
+
+    @skipUnless(pyarrow, "pyarrow não instalado")
+    def test_comando_grava_parquet_em_grupos(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            destino = Path(pasta) / "fichas.parquet"
+            call_command(
+                "exportar_fichas", "--inicio", "2026-03-02", "--fim", "2026-03-02", "--formato", "parquet",
+                "--saida", str(destino), stdout=StringIO(),
+            )
+            tabela = pyarrow.parquet.read_table(destino)
+        self.assertEqual(tabela.num_rows, 3)
+        self.assertEqual(tabela.column_names, [nome for nome, _, _ in COLUNAS])
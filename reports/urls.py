@@ -0,0 +1,11 @@
+from django.urls import path
+from . import views
+
+app_name = "reports"
+
+urlpatterns = [
+    # Métricas pré-agregadas para o painel de gestão (ver reports/metricas.py)
+    path("relatorios/operacional/", views.operacional, name="operacional"),
+    # Histórico completo em CSV, em streaming (ver reports/exportacao.py)
+    path("relatorios/exportar/fichas.csv", views.exportar_fichas, name="exportar_fichas"),
+]
@@ -1,3 +1,76 @@
-from django.shortcuts import render
+from datetime import timedelta
 
-# Create your views here.
+from django.contrib.auth.decorators import login_required, permission_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.replicas import banco_de_leitura, ler_da_replica
+from core.unidades import unidade_da_requisicao, unidade_id_por_slug
+
+from . import exportacao
+from .metricas import resumo_operacional
+
+MAX_DIAS = 366
+
+
+def _periodo(request):
+    """(inicio, fim) de ?inicio=AAAA-MM-DD&fim=AAAA-MM-DD (obrigatórios). ValueError se inválido."""
+    try:
+        inicio = parse_date(request.GET.get("inicio", ""))
+        fim = parse_date(request.GET.get("fim", ""))
+    except ValueError:
+        raise ValueError("Data inválida.")
+    if inicio is None or fim is None:
+        raise ValueError("Informe o período (?inicio=AAAA-MM-DD&fim=AAAA-MM-DD).")
+    if fim < inicio or fim - inicio > timedelta(days=MAX_DIAS):
+        raise ValueError(f"Período inválido (máximo {MAX_DIAS} dias).")
+    return inicio, fim
+
+
+def _lista(request, nome):
+    return [v for v in request.GET.get(nome, "").split(",") if v]
+
+
+@login_required
+@ler_da_replica
+def operacional(request):
+    """Métricas agregadas da unidade (?inicio=AAAA-MM-DD&fim=AAAA-MM-DD, padrão: hoje; ?unidade=<slug>)."""
+    hoje = timezone.localdate()
+    try:
+        inicio = parse_date(request.GET.get("inicio", "")) or hoje
+        fim = parse_date(request.GET.get("fim", "")) or inicio
+    except ValueError:
+        return HttpResponseBadRequest("Data inválida.")
+    if fim < inicio or fim - inicio > timedelta(days=MAX_DIAS):
+        return HttpResponseBadRequest(f"Período inválido (máximo {MAX_DIAS} dias).")
+    return JsonResponse(resumo_operacional(unidade_da_requisicao(request), inicio, fim))
+
+
+@permission_required("attendance.view_fichahistorico", raise_exception=True)
+@ler_da_replica
+def exportar_fichas(request):
+    """
+    CSV do histórico (fichas + paciente) em streaming, para auditoria.
+    ?inicio=&fim= (obrigatórios, até MAX_DIAS) &status=FINALIZADO,CANCELADO
+    &prioridade=VERMELHO &unidade=<slug>.
+    """
+    try:
+        inicio, fim = _periodo(request)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
+    unidade_id = None
+    if request.GET.get("unidade"):
+        unidade_id = unidade_id_por_slug(request.GET["unidade"])
+        if unidade_id is None:
+            return HttpResponseBadRequest("Unidade inexistente.")
+
+    queryset = exportacao.fichas(inicio, fim, _lista(request, "status"), _lista(request, "prioridade"), unidade_id)
+    # O streaming roda depois que a view retorna: o banco é escolhido agora
+    queryset = queryset.using(banco_de_leitura())
+    # No ASGI o gerador síncrono seria bufferizado inteiro: lá vai o assíncrono
+    blocos = exportacao.acsv_em_blocos if isinstance(request, ASGIRequest) else exportacao.csv_em_blocos
+    response = StreamingHttpResponse(blocos(queryset), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="fichas_{inicio}_{fim}.csv"'
+    return response